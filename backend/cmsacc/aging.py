@@ -0,0 +1,74 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Case, Count, F, FloatField, Max, Min, Sum, Value, When
+from django.utils import timezone
+from cmssys.models import CMSModel
+from .models import Bill, TakingsRollup
+
+# Age buckets of unbalanced bills: (key, label, max age in days or None)
+BUCKETS = [
+    ('days_0_7', '0-7 days', 7),
+    ('days_8_30', '8-30 days', 30),
+    ('days_31_90', '31-90 days', 90),
+    ('days_over_90', '>90 days', None),
+]
+CACHE_SECS = 24 * 60 * 60
+
+
+def _cache_key(today):
+    return f"cmsacc:aging:{today}"
+
+def bucket_ranges(today):
+    """
+    Returns list of (key, start, end) of BUCKETS as of today: half-open CMS datetime
+    bounds of the bill date_created, start None for the oldest bucket, end None for the newest
+    """
+    ranges = []
+    end = None
+    for (key, label, max_days) in BUCKETS:
+        # bucket = bills newer than the limit of the bucket, not in a newer bucket
+        start = None if max_days is None else CMSModel.local_datetime(today - timedelta(days=max_days))
+        ranges.append((key, start, end))
+        end = start
+    return ranges
+
+def compute_aging(today):
+    """
+    Unbalanced bills (unbalance_amt > 0) of all days as of today, excluding placeholder
+    patients, in one query grouped by patient with a conditional sum per age bucket
+    Returns (list of patient row dicts, dict of bucket totals); rows are sorted by
+    total outstanding, largest first
+    """
+    amounts = {}
+    for (key, start, end) in bucket_ranges(today):
+        bounds = {}
+        if start is not None:
+            bounds['date_created__gte'] = start
+        if end is not None:
+            bounds['date_created__lt'] = end
+        amounts[key] = Sum(Case(When(then=F('unbalance_amt'), **bounds), default=Value(0.0), output_field=FloatField()))
+    rows = list(Bill.objects.filter(unbalance_amt__gt=0).exclude(
+        encounter__patient__patient_no__in=TakingsRollup.EXCLUDED_PATIENT_NOS,
+    ).values(
+        'encounter__patient_id', 'encounter__patient__patient_no',
+        'encounter__patient__sur_name', 'encounter__patient__given_name',
+    ).annotate(
+        total=Sum('unbalance_amt'), count=Count('id'),
+        oldest=Min('date_created'), latest=Max('date_created'),
+        **amounts,
+    ).order_by('-total'))
+    totals = {key: 0 for key in [bucket[0] for bucket in BUCKETS] + ['total', 'count']}
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key] or 0
+    return rows, totals
+
+def get_aging(refresh=False):
+    """compute_aging() for today, cached for the day (refresh=True recomputes)"""
+    today = timezone.localdate()
+    key = _cache_key(today)
+    aging = None if refresh else cache.get(key)
+    if aging is None:
+        aging = compute_aging(today)
+        cache.set(key, aging, CACHE_SECS)
+    return aging
@@ -0,0 +1,107 @@
+from datetime import timedelta
+from django.db import router, transaction
+from django.db.models import BigIntegerField, Count, Sum
+from django.db.models.functions import Cast
+from .models import Cashbook, CashDiscrepancy, CashReconciliation, PaymentDetails
+
+CMS_DB = 'cms_db'
+CASH = 'Cash'
+WINDOW_DAYS = 31  # days merged per pair of CMS queries
+TOLERANCE = 0.005
+
+
+def cashbook_totals(start, end):
+    """Streams (date, bill id, amount, count) of Cashbook bill entries, ordered by date, bill id"""
+    return Cashbook.objects.using(CMS_DB).filter(
+        entry_type=Cashbook.BILL, reference_id__isnull=False, date_created__gte=start, date_created__lte=end,
+    ).annotate(bill_id=Cast('reference_id', BigIntegerField())).values('date_created', 'bill_id').annotate(
+        total=Sum('amount'), count=Count('id'),
+    ).order_by('date_created', 'bill_id').values_list('date_created', 'bill_id', 'total', 'count').iterator()
+
+def payment_totals(start, end):
+    """Streams (date, bill id, amount, count) of cash PaymentDetails, ordered by date, bill id"""
+    return PaymentDetails.objects.using(CMS_DB).filter(
+        payment_method__payment_method=CASH, date_created__gte=start, date_created__lte=end,
+    ).values('date_created', 'bill_id').annotate(
+        total=Sum('paid_amt'), count=Count('id'),
+    ).order_by('date_created', 'bill_id').values_list('date_created', 'bill_id', 'total', 'count').iterator()
+
+def merge_join(cashbook_rows, payment_rows):
+    """
+    Merges two streams of (date, bill id, amount, count) sorted by (date, bill id)
+    Yields (date, bill id, cashbook (amount, count) or None, payment (amount, count) or None)
+    """
+    cashbook_row = next(cashbook_rows, None)
+    payment_row = next(payment_rows, None)
+    while cashbook_row or payment_row:
+        if payment_row is None or (cashbook_row and cashbook_row[:2] < payment_row[:2]):
+            yield cashbook_row[0], cashbook_row[1], cashbook_row[2:], None
+            cashbook_row = next(cashbook_rows, None)
+        elif cashbook_row is None or payment_row[:2] < cashbook_row[:2]:
+            yield payment_row[0], payment_row[1], None, payment_row[2:]
+            payment_row = next(payment_rows, None)
+        else:
+            yield cashbook_row[0], cashbook_row[1], cashbook_row[2:], payment_row[2:]
+            cashbook_row = next(cashbook_rows, None)
+            payment_row = next(payment_rows, None)
+
+def _save_day(day, discrepancies):
+    day.discrepancy_count = len(discrepancies)
+    day.save()
+    for discrepancy in discrepancies:
+        discrepancy.reconciliation = day
+    CashDiscrepancy.objects.bulk_create(discrepancies)
+
+def reconcile_window(start, end):
+    """Reconciles days from start to end (inclusive); returns number of days with entries"""
+    with transaction.atomic(using=router.db_for_write(CashReconciliation)):
+        CashReconciliation.objects.filter(date__gte=start, date__lte=end).delete()
+        day = None
+        discrepancies = []
+        days = 0
+        for (date, bill_id, cashbook, payment) in merge_join(cashbook_totals(start, end), payment_totals(start, end)):
+            if day is None or day.date != date:
+                if day is not None:
+                    _save_day(day, discrepancies)
+                day = CashReconciliation(date=date)
+                discrepancies = []
+                days += 1
+            (cashbook_amount, cashbook_count) = cashbook or (0, 0)
+            (payment_amount, payment_count) = payment or (0, 0)
+            cashbook_amount = cashbook_amount or 0
+            payment_amount = payment_amount or 0
+            day.cashbook_total += cashbook_amount
+            day.payment_total += payment_amount
+            day.cashbook_count += cashbook_count
+            day.payment_count += payment_count
+            if cashbook is None:
+                status = CashDiscrepancy.NO_CASHBOOK
+            elif payment is None:
+                status = CashDiscrepancy.NO_PAYMENT
+            elif abs(cashbook_amount - payment_amount) > TOLERANCE:
+                status = CashDiscrepancy.MISMATCH
+            else:
+                continue
+            discrepancies.append(CashDiscrepancy(
+                bill_id=bill_id or 0,
+                cashbook_amount=cashbook_amount,
+                payment_amount=payment_amount,
+                status=status,
+            ))
+        if day is not None:
+            _save_day(day, discrepancies)
+    return days
+
+def reconcile(start, end):
+    """
+    Reconciles Cashbook with cash PaymentDetails from start to end (dates, inclusive)
+    in windows of WINDOW_DAYS: each window is two grouped CMS queries merged as they
+    are read, so memory does not grow with the length of the period
+    Returns number of days with entries
+    """
+    days = 0
+    while start <= end:
+        window_end = min(start + timedelta(days=WINDOW_DAYS - 1), end)
+        days += reconcile_window(start, window_end)
+        start = window_end + timedelta(days=1)
+    return days
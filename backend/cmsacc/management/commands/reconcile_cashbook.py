@@ -0,0 +1,28 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from cmssys.models import CMSModel
+from cmsacc.cashbook import reconcile
+from cmsacc.models import CashReconciliation
+
+class Command(BaseCommand):
+    """
+    Reconciles CMS Cashbook bill entries with cash PaymentDetails per day and
+    stores the results (CashReconciliation, CashDiscrepancy) for CashbookReconciliationList
+    """
+    help = 'Reconciles Cashbook with cash payments of the last --days days (or --since)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Number of days back from today')
+        parser.add_argument('--since', help='Reconcile from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = today - timedelta(days=options['days'])
+        if options['since']:
+            start = CMSModel.parse_local_date(options['since'])
+            if start is None:
+                raise CommandError(f"Invalid date {options['since']}")
+        days = reconcile(start, today)
+        discrepancies = CashReconciliation.objects.filter(date__gte=start, discrepancy_count__gt=0)
+        self.stdout.write(f"{days} days reconciled from {start}, {discrepancies.count()} with discrepancies")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from cmsacc.models import ClinicDay
+
+class Command(BaseCommand):
+    """
+    Adds days of new CMS bills/encounters to the ClinicDay calendar
+    (previous/next clinic day and date picker of PaymentsToday)
+    Run from cron, e.g. every few minutes; PaymentsToday does not refresh the calendar
+    """
+    help = 'Updates the clinic day calendar from CMS bills and encounters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the calendar from all bills and encounters')
+
+    def handle(self, *args, **options):
+        processed = ClinicDay.refresh(full=options['full'])
+        self.stdout.write(f"{processed} bills/encounters processed, {ClinicDay.objects.count()} clinic days")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from cmssys.models import CMSModel
+from cmsacc.models import RevenueDaily
+
+class Command(BaseCommand):
+    """
+    Stores the revenue cube (RevenueDaily) of closed days for the revenue report
+    By default days from the last stored day to yesterday are computed
+    """
+    help = 'Updates daily revenue by charge item, doctor and encounter type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute all days')
+        parser.add_argument('--since', help='Recompute days from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['since']:
+            start = CMSModel.parse_local_date(options['since'])
+            if start is None:
+                raise CommandError(f"Invalid date {options['since']}")
+        rows = RevenueDaily.refresh(start=start, full=options['full'])
+        self.stdout.write(f"{rows} revenue rows stored")
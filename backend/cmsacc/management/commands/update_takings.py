@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from cmsacc.models import TakingsRollup
+
+class Command(BaseCommand):
+    """
+    Computes TakingsRollup of recent days, so PaymentsToday reads stored rows
+    Past days without unbalanced bills are closed; other sessions are refreshed
+    """
+    help = 'Updates AM/PM takings rollup of the last --days days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Number of days back from today')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        for days_back in range(options['days'], -1, -1):
+            date = today - timedelta(days=days_back)
+            stats = TakingsRollup.stats(date)
+            self.stdout.write(f"{date}: {stats['count']} patients, ${stats['bill_total']}")
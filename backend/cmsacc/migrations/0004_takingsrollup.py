@@ -0,0 +1,33 @@
+# Generated by Django 3.1.3 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0003_auto_20210204_1657'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TakingsRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('session', models.CharField(choices=[('a', 'AM'), ('p', 'PM')], max_length=1)),
+                ('count', models.IntegerField(default=0)),
+                ('bill_total', models.FloatField(default=0)),
+                ('cash_total', models.FloatField(default=0)),
+                ('other_total', models.FloatField(default=0)),
+                ('unbalance_total', models.FloatField(default=0)),
+                ('last_payment_id', models.BigIntegerField(default=0)),
+                ('is_closed', models.BooleanField(default=False)),
+                ('computed', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-date', 'session'],
+                'unique_together': {('date', 'session')},
+            },
+        ),
+    ]
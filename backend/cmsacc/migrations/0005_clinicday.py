@@ -0,0 +1,27 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0004_takingsrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('bill_count', models.IntegerField(default=0)),
+                ('encounter_count', models.IntegerField(default=0)),
+                ('last_bill_id', models.BigIntegerField(default=0)),
+                ('last_encounter_id', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
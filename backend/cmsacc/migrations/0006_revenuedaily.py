@@ -0,0 +1,29 @@
+# Generated by Django 3.1.3 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0005_clinicday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('charge_item_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('encounter_type_id', models.BigIntegerField()),
+                ('amount', models.FloatField(default=0)),
+                ('quantity', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'charge_item_id', 'doctor_id', 'encounter_type_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.1.3 on 2026-10-18 14:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0006_revenuedaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashReconciliation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('cashbook_total', models.FloatField(default=0)),
+                ('payment_total', models.FloatField(default=0)),
+                ('cashbook_count', models.IntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('discrepancy_count', models.IntegerField(default=0)),
+                ('reconciled', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CashDiscrepancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bill_id', models.BigIntegerField()),
+                ('cashbook_amount', models.FloatField(default=0)),
+                ('payment_amount', models.FloatField(default=0)),
+                ('status', models.CharField(choices=[('mismatch', 'Amounts differ'), ('no_payment', 'No cash payment'), ('no_cashbook', 'No cashbook entry')], max_length=20)),
+                ('reconciliation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discrepancies', to='cmsacc.cashreconciliation')),
+            ],
+            options={
+                'ordering': ['bill_id'],
+            },
+        ),
+    ]
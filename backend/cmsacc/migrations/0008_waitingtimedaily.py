@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0007_cashreconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitingTimeDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('hour', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('wait_histogram', models.JSONField(default=list)),
+                ('service_histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'unique_together': {('date', 'doctor_id', 'hour')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:10
+
+from django.db import migrations
+
+
+def reopen_unsettled(apps, schema_editor):
+    """Reopens closed past days with unbalanced bills, so later payments are counted"""
+    TakingsRollup = apps.get_model('cmsacc', 'TakingsRollup')
+    TakingsRollup.objects.filter(is_closed=True, unbalance_total__gt=0).update(is_closed=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsacc', '0008_waitingtimedaily'),
+    ]
+
+    operations = [
+        migrations.RunPython(reopen_unsettled, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import connections, models, router, transaction
 from cmssys.models import CMSModel, Encounter, TextBooleanField
+from collections import defaultdict
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
 
 
+def advisory_lock(using, lock_id):
+    """Waits for other transactions on using holding lock_id to finish (Postgres only)"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [lock_id])
+
+
 class Bill(CMSModel):
     """
     Maps to CMS table to track bills charged to patient:encounter_id
@@ -209,4 +218,424 @@ class PaymentDetails(CMSModel):
         if not self.id:
             self.date_created = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS) 
         self.last_updated = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
-        return super().save(*args, **kwargs)
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+# LOCAL Models - stored in default database (db_routers.cms.LOCAL_MODELS)
+# ============
+
+class TakingsRollup(models.Model):
+    """
+    Local summary of CMS takings per day and session (AM/PM), see PaymentsToday
+    Sessions are split at PERIOD_CUTOFF_HR of the encounter time (CMS local time)
+    Rows are recomputed when a payment has been added or the row is older than
+    REFRESH_SECS; a past day is closed (not recomputed) once it has no unbalanced
+    bills left, as later payments against them still count for that day
+    """
+    AM = CMSModel.AM
+    PM = CMSModel.PM
+    SESSION_CHOICES = [
+        (AM, 'AM'),
+        (PM, 'PM'),
+    ]
+    PERIOD_CUTOFF_HR = CMSModel.PERIOD_CUTOFF_HR
+    PERIOD_CUTOFF_MIN = CMSModel.PERIOD_CUTOFF_MIN
+    REFRESH_SECS = 60
+    EXCLUDED_PATIENT_NOS = ['00AM', '00PM']  # placeholder patients for session cash adjustments
+    STATS_FIELDS = ['count', 'bill_total', 'cash_total', 'other_total', 'unbalance_total']
+
+    date = models.DateField()
+    session = models.CharField(max_length=1, choices=SESSION_CHOICES)
+    count = models.IntegerField(default=0)
+    bill_total = models.FloatField(default=0)
+    cash_total = models.FloatField(default=0)
+    other_total = models.FloatField(default=0)
+    unbalance_total = models.FloatField(default=0)
+    last_payment_id = models.BigIntegerField(default=0)  # max PaymentDetails id when computed
+    is_closed = models.BooleanField(default=False)
+    computed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'cmsacc'
+        unique_together = [('date', 'session')]
+        ordering = ['-date', 'session']
+
+    def __str__(self):
+        return f"{self.date} {self.get_session_display()}: {self.count} patients, ${self.bill_total}"
+
+    @classmethod
+    def session_payments(cls, date, session=None):
+        """PaymentDetails of encounters in session of date (whole day if None), excluding placeholder patients"""
+        return PaymentDetails.objects.filter(
+            CMSModel.local_range_q('bill__encounter__date_created', date, date, session),
+        ).exclude(bill__encounter__patient__patient_no__in=cls.EXCLUDED_PATIENT_NOS)
+
+    @classmethod
+    def unbalanced_bills(cls, date, session=None):
+        return Bill.objects.filter(
+            CMSModel.local_range_q('date_created', date, date, session), unbalance_amt__gt=0,
+        )
+
+    def compute(self):
+        """Recompute totals from CMS: one aggregate over payments, one over unbalanced bills"""
+        totals = self.session_payments(self.date, self.session).aggregate(
+            count=models.Count('bill__encounter__id'),
+            bill_total=models.Sum('bill__total'),
+            cash_total=models.Sum('paid_amt', filter=models.Q(payment_method__payment_method='Cash')),
+            other_total=models.Sum('paid_amt', filter=~models.Q(payment_method__payment_method='Cash')),
+        )
+        totals['unbalance_total'] = self.unbalanced_bills(self.date, self.session).aggregate(
+            total=models.Sum('unbalance_amt'))['total']
+        for field in self.STATS_FIELDS:
+            setattr(self, field, totals[field] or 0)
+
+    @classmethod
+    def get_session(cls, date, session, last_payment_id=None):
+        """Returns up to date TakingsRollup for session of date, computing it if needed"""
+        today = timezone.localdate()
+        rollup, created = cls.objects.get_or_create(date=date, session=session)
+        if rollup.is_closed:
+            return rollup
+        if last_payment_id is None:
+            last_payment_id = PaymentDetails.objects.aggregate(models.Max('id'))['id__max'] or 0
+        is_stale = (
+            created
+            or last_payment_id != rollup.last_payment_id
+            or timezone.now() - rollup.computed > timedelta(seconds=cls.REFRESH_SECS)
+        )
+        if is_stale:
+            rollup.compute()
+            rollup.last_payment_id = last_payment_id
+            rollup.is_closed = date < today and not rollup.unbalance_total
+            rollup.save()
+        return rollup
+
+    @classmethod
+    def stats(cls, date, session=None):
+        """Returns dict of takings (STATS_FIELDS) for session of date, or the whole day if session is None"""
+        sessions = [session] if session else [cls.AM, cls.PM]
+        rollups = {rollup.session: rollup for rollup in cls.objects.filter(date=date, session__in=sessions)}
+        if not all(session in rollups and rollups[session].is_closed for session in sessions):
+            last_payment_id = PaymentDetails.objects.aggregate(models.Max('id'))['id__max'] or 0
+            for session in sessions:
+                rollups[session] = cls.get_session(date, session, last_payment_id)
+        stats = dict.fromkeys(cls.STATS_FIELDS, 0)
+        for rollup in rollups.values():
+            for field in cls.STATS_FIELDS:
+                stats[field] += getattr(rollup, field)
+        return stats
+
+
+class ClinicDay(models.Model):
+    """
+    Local calendar of days with clinic activity (CMS bills or encounters), so the
+    previous/next clinic day is one indexed lookup: see previous(), following()
+    Updated incrementally from the last processed bill/encounter ids by
+    manage.py update_clinic_days (cron), not from page requests; refreshes are
+    serialised by a transaction-level advisory lock on Postgres
+    """
+    LOCK_ID = 0x636c6479  # pg_advisory_xact_lock key of refresh()
+
+    date = models.DateField(unique=True)  # CMS local date
+    bill_count = models.IntegerField(default=0)
+    encounter_count = models.IntegerField(default=0)
+    last_bill_id = models.BigIntegerField(default=0)
+    last_encounter_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'cmsacc'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.encounter_count} encounters, {self.bill_count} bills"
+
+    @staticmethod
+    def _count_by_date(model, watermark, batch_size):
+        """Yields (last id, {date: count}) for batches of CMS model rows with id above watermark"""
+        while True:
+            # Read CMS directly: the mirror is not guaranteed to be complete up to an id
+            rows = list(model.objects.using('cms_db').filter(id__gt=watermark).order_by('id').values_list(
+                'id', 'date_created',
+            )[:batch_size])
+            if not rows:
+                break
+            counts = defaultdict(int)
+            for (cmsid, date_created) in rows:
+                if date_created:
+                    # CMS stores local time as UTC, so the UTC date is the local date
+                    counts[timezone.localtime(date_created, timezone.utc).date()] += 1
+            watermark = rows[-1][0]
+            yield watermark, counts
+
+    @classmethod
+    def _apply(cls, counts, count_field, id_field, last_id):
+        # Missing days are inserted first (existing dates are left as they are), then
+        # all days of the batch are read back and their counts added
+        cls.objects.bulk_create([cls(date=date) for date in counts], ignore_conflicts=True)
+        days = cls.objects.in_bulk(list(counts), field_name='date')
+        for (date, count) in counts.items():
+            day = days[date]
+            setattr(day, count_field, getattr(day, count_field) + count)
+            setattr(day, id_field, max(getattr(day, id_field), last_id))
+        cls.objects.bulk_update(list(days.values()), [count_field, id_field])
+
+    @classmethod
+    def refresh(cls, full=False, batch_size=10000):
+        """
+        Adds CMS bills and encounters with ids above the last processed ids
+        full=True rebuilds the calendar; returns number of CMS rows processed
+        """
+        processed = 0
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            # Watermarks are read after the lock, so concurrent runs do not add the same rows
+            advisory_lock(using, cls.LOCK_ID)
+            if full:
+                cls.objects.all().delete()
+            watermarks = cls.objects.aggregate(models.Max('last_bill_id'), models.Max('last_encounter_id'))
+            sources = [
+                (Bill, 'bill_count', 'last_bill_id'),
+                (Encounter, 'encounter_count', 'last_encounter_id'),
+            ]
+            for (model, count_field, id_field) in sources:
+                watermark = watermarks[f"{id_field}__max"] or 0
+                for (last_id, counts) in cls._count_by_date(model, watermark, batch_size):
+                    cls._apply(counts, count_field, id_field, last_id)
+                    processed += sum(counts.values())
+        return processed
+
+    @classmethod
+    def previous(cls, date):
+        """Last clinic day before date, None if none"""
+        return cls.objects.filter(date__lt=date).order_by('-date').values_list('date', flat=True).first()
+
+    @classmethod
+    def following(cls, date):
+        """First clinic day after date, None if none"""
+        return cls.objects.filter(date__gt=date).order_by('date').values_list('date', flat=True).first()
+
+    @classmethod
+    def dates(cls):
+        """List of all clinic days, oldest first (e.g. enabled dates of a date picker)"""
+        return list(cls.objects.order_by('date').values_list('date', flat=True))
+
+
+class RevenueDaily(models.Model):
+    """
+    Local daily revenue cube of CMS bill details: billed amount, quantity and line
+    count per day x charge item x doctor x encounter type (of the bill's encounter)
+    Only closed days (before today) are stored, by manage.py update_revenue (cron),
+    not from page requests: refresh() recomputes from the last stored day, or from
+    start; refreshes are serialised by a transaction-level advisory lock on Postgres
+    Reports: cmsacc.revenue
+    """
+    DIMENSIONS = ['charge_item_id', 'doctor_id', 'encounter_type_id']
+    TOTAL_FIELDS = ['amount', 'quantity', 'count']
+    LOCK_ID = 0x72766e64  # pg_advisory_xact_lock key of refresh()
+
+    date = models.DateField()  # CMS local date of the encounter
+    charge_item_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()
+    encounter_type_id = models.BigIntegerField()
+    amount = models.FloatField(default=0)
+    quantity = models.FloatField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'cmsacc'
+        unique_together = [('date', 'charge_item_id', 'doctor_id', 'encounter_type_id')]
+
+    def __str__(self):
+        return f"{self.date} charge item #{self.charge_item_id} doctor #{self.doctor_id}: ${self.amount}"
+
+    @staticmethod
+    def aggregate_cms(start, end):
+        """
+        Returns dict of (date, charge_item_id, doctor_id, encounter_type_id) => [amount, quantity, count]
+        of CMS bill details of encounters from start to end (local dates, inclusive),
+        excluding placeholder patients
+        """
+        cells = defaultdict(lambda: [0.0, 0.0, 0])
+        details = BillDetail.objects.filter(
+            CMSModel.local_range_q('bill__encounter__date_created', start, end),
+        ).exclude(
+            bill__encounter__patient__patient_no__in=TakingsRollup.EXCLUDED_PATIENT_NOS,
+        ).values_list(
+            'bill__encounter__date_created', 'charge_item_id', 'bill__encounter__doctor_id',
+            'bill__encounter__encounter_type_id', 'billed_amount', 'quantity',
+        )
+        for (date_created, charge_item_id, doctor_id, encounter_type_id, amount, quantity) in details.iterator(chunk_size=10000):
+            # CMS stores local time as UTC, so the UTC date is the local date
+            date = timezone.localtime(date_created, timezone.utc).date()
+            cell = cells[(date, charge_item_id, doctor_id, encounter_type_id)]
+            cell[0] += amount or 0
+            cell[1] += float(quantity or 0)
+            cell[2] += 1
+        return cells
+
+    @classmethod
+    def refresh(cls, start=None, full=False):
+        """
+        Recomputes closed days from start (default: the last stored day, full=True: all days)
+        to yesterday; returns number of rows stored
+        """
+        yesterday = timezone.localdate() - timedelta(days=1)
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            advisory_lock(using, cls.LOCK_ID)
+            if full:
+                start = None
+            elif start is None:
+                start = cls.objects.aggregate(models.Max('date'))['date__max']
+            rows = cls.objects.filter(date__lte=yesterday)
+            if start:
+                rows = rows.filter(date__gte=start)
+            rows.delete()
+            cells = cls.aggregate_cms(start, yesterday)
+            cls.objects.bulk_create([
+                cls(
+                    date=date, charge_item_id=charge_item_id, doctor_id=doctor_id, encounter_type_id=encounter_type_id,
+                    amount=amount, quantity=quantity, count=count,
+                )
+                for ((date, charge_item_id, doctor_id, encounter_type_id), (amount, quantity, count)) in cells.items()
+            ], batch_size=1000)
+        return len(cells)
+
+
+class CashReconciliation(models.Model):
+    """
+    Local result of reconciling CMS Cashbook bill entries with cash PaymentDetails
+    for a day (both keyed by bill id), see cmsacc.cashbook
+    """
+    date = models.DateField(unique=True)
+    cashbook_total = models.FloatField(default=0)
+    payment_total = models.FloatField(default=0)
+    cashbook_count = models.IntegerField(default=0)
+    payment_count = models.IntegerField(default=0)
+    discrepancy_count = models.IntegerField(default=0)
+    reconciled = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'cmsacc'
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: cashbook ${self.cashbook_total}, payments ${self.payment_total}, {self.discrepancy_count} discrepancies"
+
+    @property
+    def difference(self):
+        return self.cashbook_total - self.payment_total
+
+
+class CashDiscrepancy(models.Model):
+    """Bill of a CashReconciliation day whose Cashbook and cash PaymentDetails totals differ"""
+    MISMATCH = 'mismatch'
+    NO_PAYMENT = 'no_payment'
+    NO_CASHBOOK = 'no_cashbook'
+    STATUS_CHOICES = [
+        (MISMATCH, 'Amounts differ'),
+        (NO_PAYMENT, 'No cash payment'),
+        (NO_CASHBOOK, 'No cashbook entry'),
+    ]
+
+    reconciliation = models.ForeignKey(
+        CashReconciliation, on_delete=models.CASCADE, related_name='discrepancies',
+    )
+    bill_id = models.BigIntegerField()  # Cashbook reference_id / PaymentDetails bill_id
+    cashbook_amount = models.FloatField(default=0)
+    payment_amount = models.FloatField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+
+    class Meta:
+        app_label = 'cmsacc'
+        ordering = ['bill_id']
+
+    def __str__(self):
+        return f"Bill #{self.bill_id}: {self.get_status_display()} (cashbook ${self.cashbook_amount}, payments ${self.payment_amount})"
+
+
+class WaitingTimeDaily(models.Model):
+    """
+    Local daily histograms of patient waiting and service times per doctor and hour
+    of queue arrival, from CMS Bill.temp_wq_arrive_time (arrival), Encounter.date_created
+    (consultation) and Bill.date_created (billing):
+    wait = arrival to consultation, service = consultation to billing (minutes)
+    Histograms are counts per BIN_MINUTES bin, the last bin counts everything longer,
+    so days can be added up and percentiles taken over any period (cmsacc.waiting)
+    Only closed days are stored, by manage.py update_waiting_times (cron) as for
+    RevenueDaily, serialised by a transaction-level advisory lock on Postgres
+    """
+    BIN_MINUTES = 5
+    BIN_COUNT = 49  # 0-240 minutes, then > 240
+    MAX_MINUTES = 12 * 60  # longer durations are data errors (e.g. bill of next day)
+    LOCK_ID = 0x77616974  # pg_advisory_xact_lock key of refresh()
+
+    date = models.DateField()  # CMS local date of the encounter
+    doctor_id = models.BigIntegerField()
+    hour = models.IntegerField()  # CMS local hour of arrival
+    count = models.IntegerField(default=0)
+    wait_histogram = models.JSONField(default=list)
+    service_histogram = models.JSONField(default=list)
+
+    class Meta:
+        app_label = 'cmsacc'
+        unique_together = [('date', 'doctor_id', 'hour')]
+
+    def __str__(self):
+        return f"{self.date} {self.hour:02d}h doctor #{self.doctor_id}: {self.count} patients"
+
+    @classmethod
+    def bin(cls, minutes):
+        return min(int(minutes // cls.BIN_MINUTES), cls.BIN_COUNT - 1)
+
+    @classmethod
+    def durations(cls, start, end):
+        """
+        Streams (date, doctor id, arrival hour, wait minutes, service minutes) of bills of
+        encounters from start to end (local dates, inclusive) with a queue arrival time
+        """
+        bills = Bill.objects.filter(
+            CMSModel.local_range_q('encounter__date_created', start, end), temp_wq_arrive_time__isnull=False,
+        ).exclude(
+            encounter__patient__patient_no__in=TakingsRollup.EXCLUDED_PATIENT_NOS,
+        ).values_list('temp_wq_arrive_time', 'encounter__date_created', 'date_created', 'encounter__doctor_id')
+        for (arrived, consulted, billed, doctor_id) in bills.iterator(chunk_size=10000):
+            wait = (consulted - arrived).total_seconds() / 60
+            service = (billed - consulted).total_seconds() / 60
+            if not (0 <= wait <= cls.MAX_MINUTES and 0 <= service <= cls.MAX_MINUTES):
+                continue
+            # CMS stores local time as UTC, so UTC date/hour are local
+            arrived = timezone.localtime(arrived, timezone.utc)
+            consulted = timezone.localtime(consulted, timezone.utc)
+            yield consulted.date(), doctor_id, arrived.hour, wait, service
+
+    @classmethod
+    def refresh(cls, start=None, full=False):
+        """
+        Recomputes closed days from start (default: the last stored day, full=True: all days)
+        to yesterday; returns number of rows stored
+        """
+        yesterday = timezone.localdate() - timedelta(days=1)
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            advisory_lock(using, cls.LOCK_ID)
+            if full:
+                start = None
+            elif start is None:
+                start = cls.objects.aggregate(models.Max('date'))['date__max']
+            rows = cls.objects.filter(date__lte=yesterday)
+            if start:
+                rows = rows.filter(date__gte=start)
+            rows.delete()
+            cells = {}
+            for (date, doctor_id, hour, wait, service) in cls.durations(start, yesterday):
+                cell = cells.get((date, doctor_id, hour))
+                if cell is None:
+                    cell = cells[(date, doctor_id, hour)] = cls(
+                        date=date, doctor_id=doctor_id, hour=hour,
+                        wait_histogram=[0] * cls.BIN_COUNT, service_histogram=[0] * cls.BIN_COUNT,
+                    )
+                cell.count += 1
+                cell.wait_histogram[cls.bin(wait)] += 1
+                cell.service_histogram[cls.bin(service)] += 1
+            cls.objects.bulk_create(cells.values(), batch_size=1000)
+        return len(cells)
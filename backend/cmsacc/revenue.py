@@ -0,0 +1,109 @@
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+from cmssys.models import CmsUser, EncounterType
+from .models import ChargeItem, RevenueDaily
+
+# Report dimension => (RevenueDaily field, model for labels, label attribute)
+DIMENSIONS = {
+    'charge_item': ('charge_item_id', ChargeItem, 'alias'),
+    'doctor': ('doctor_id', CmsUser, 'name'),
+    'encounter_type': ('encounter_type_id', EncounterType, 'label'),
+}
+PERIODS = ['day', 'month', 'year', '']  # '' for totals over the whole range
+CACHE_SECS = 24 * 60 * 60
+OPEN_CACHE_SECS = 60  # reports including today
+
+
+def _period_start(date, period):
+    if period == 'month':
+        return date.replace(day=1)
+    if period == 'year':
+        return date.replace(month=1, day=1)
+    if period == 'day':
+        return date
+    return None
+
+def _cache_key(start, end, group_by, period):
+    last_id = RevenueDaily.objects.aggregate(Max('id'))['id__max']
+    return f"cmsacc:revenue:{start}:{end}:{','.join(group_by)}:{period}:{last_id}"
+
+def _closed_totals(start, end, group_by, period):
+    """Totals of stored (closed) days, one aggregate query over RevenueDaily"""
+    fields = [DIMENSIONS[dimension][0] for dimension in group_by]
+    rows = RevenueDaily.objects.all()
+    if start:
+        rows = rows.filter(date__gte=start)
+    if end:
+        rows = rows.filter(date__lte=end)
+    if period == 'month':
+        rows = rows.annotate(period=TruncMonth('date'))
+        fields.append('period')
+    elif period == 'year':
+        rows = rows.annotate(period=TruncYear('date'))
+        fields.append('period')
+    elif period == 'day':
+        fields.append('date')
+    totals = rows.values(*fields).annotate(
+        **{f"total_{field}": Sum(field) for field in RevenueDaily.TOTAL_FIELDS}
+    ).order_by()
+    for row in totals:
+        key = (row.get('period', row.get('date')),) + tuple(row[DIMENSIONS[d][0]] for d in group_by)
+        yield key, [row[f"total_{field}"] or 0 for field in RevenueDaily.TOTAL_FIELDS]
+
+def _open_totals(date, group_by, period):
+    """Totals of date (today, not stored yet) read from CMS"""
+    indexes = [1 + RevenueDaily.DIMENSIONS.index(DIMENSIONS[d][0]) for d in group_by]
+    for (cell, values) in RevenueDaily.aggregate_cms(date, date).items():
+        yield (_period_start(cell[0], period),) + tuple(cell[i] for i in indexes), values
+
+def compute_report(start, end, group_by, period='month'):
+    """
+    Revenue of encounters from start to end (local dates, inclusive, None for open)
+    grouped by period ('day', 'month', 'year' or '' for the whole range) and the
+    dimensions in group_by (keys of DIMENSIONS)
+    Closed days come from RevenueDaily, today (if in range) from CMS
+    Returns list of row dicts: period, <dimension>_id, <dimension>, amount, quantity, count
+    sorted by period then amount (largest first)
+    """
+    today = timezone.localdate()
+    totals = defaultdict(lambda: [0, 0, 0])
+    for (key, values) in _closed_totals(start, end, group_by, period):
+        for (i, value) in enumerate(values):
+            totals[key][i] += value
+    if (not start or start <= today) and (not end or end >= today):
+        for (key, values) in _open_totals(today, group_by, period):
+            for (i, value) in enumerate(values):
+                totals[key][i] += value
+
+    labels = {}
+    for (i, dimension) in enumerate(group_by):
+        (field, model, attr) = DIMENSIONS[dimension]
+        ids = {key[1 + i] for key in totals}
+        labels[dimension] = {obj.id: getattr(obj, attr) for obj in model.objects.filter(id__in=ids)}
+    report = []
+    for (key, values) in totals.items():
+        row = dict(zip(RevenueDaily.TOTAL_FIELDS, values), period=key[0])
+        for (i, dimension) in enumerate(group_by):
+            row[f"{dimension}_id"] = key[1 + i]
+            row[dimension] = labels[dimension].get(key[1 + i], key[1 + i])
+        report.append(row)
+    report.sort(key=lambda row: -row['amount'])
+    report.sort(key=lambda row: row['period'] or today)
+    return report
+
+def get_report(start, end, group_by, period='month'):
+    """
+    compute_report(), cached until RevenueDaily changes (briefly if the range includes today)
+    Closed days are stored by manage.py update_revenue, not here
+    """
+    today = timezone.localdate()
+    key = _cache_key(start, end, group_by, period)
+    report = cache.get(key)
+    if report is None:
+        report = compute_report(start, end, group_by, period)
+        is_open = (not start or start <= today) and (not end or end >= today)
+        cache.set(key, report, OPEN_CACHE_SECS if is_open else CACHE_SECS)
+    return report
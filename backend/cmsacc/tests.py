@@ -1,3 +1,57 @@
-from django.test import TestCase
+from datetime import date, datetime, timezone
+from django.test import SimpleTestCase
+from .aging import BUCKETS, bucket_ranges
+from .models import WaitingTimeDaily
+from .waiting import percentile
 
-# Create your tests here.
+
+class BucketRangesTest(SimpleTestCase):
+    """cmsacc.aging.bucket_ranges"""
+    def test_buckets_are_contiguous(self):
+        ranges = bucket_ranges(date(2026, 10, 18))
+        self.assertEqual([key for (key, start, end) in ranges], [bucket[0] for bucket in BUCKETS])
+        self.assertIsNone(ranges[0][2])
+        self.assertIsNone(ranges[-1][1])
+        for (newer, older) in zip(ranges, ranges[1:]):
+            self.assertEqual(older[2], newer[1])
+
+    def test_limits_are_local_midnight(self):
+        ranges = dict((key, (start, end)) for (key, start, end) in bucket_ranges(date(2026, 10, 18)))
+        self.assertEqual(ranges['days_0_7'], (datetime(2026, 10, 11, tzinfo=timezone.utc), None))
+        self.assertEqual(ranges['days_8_30'], (
+            datetime(2026, 9, 18, tzinfo=timezone.utc), datetime(2026, 10, 11, tzinfo=timezone.utc),
+        ))
+        self.assertEqual(ranges['days_31_90'], (
+            datetime(2026, 7, 20, tzinfo=timezone.utc), datetime(2026, 9, 18, tzinfo=timezone.utc),
+        ))
+        self.assertEqual(ranges['days_over_90'], (None, datetime(2026, 7, 20, tzinfo=timezone.utc)))
+
+
+class PercentileTest(SimpleTestCase):
+    """cmsacc.waiting.percentile over WaitingTimeDaily histograms"""
+    def histogram(self, counts):
+        histogram = [0] * WaitingTimeDaily.BIN_COUNT
+        for (i, count) in counts.items():
+            histogram[i] = count
+        return histogram
+
+    def test_empty(self):
+        self.assertIsNone(percentile(self.histogram({}), 50))
+
+    def test_upper_bound_of_bin(self):
+        # 10 in 0-5 min, 10 in 15-20 min
+        histogram = self.histogram({0: 10, 3: 10})
+        self.assertEqual(percentile(histogram, 50), 5)
+        self.assertEqual(percentile(histogram, 75), 20)
+        self.assertEqual(percentile(histogram, 90), 20)
+
+    def test_overflow_bin(self):
+        histogram = self.histogram({1: 1, WaitingTimeDaily.BIN_COUNT - 1: 9})
+        self.assertEqual(percentile(histogram, 10), 10)
+        self.assertIsNone(percentile(histogram, 50))
+
+    def test_bin(self):
+        self.assertEqual(WaitingTimeDaily.bin(0), 0)
+        self.assertEqual(WaitingTimeDaily.bin(4.9), 0)
+        self.assertEqual(WaitingTimeDaily.bin(5), 1)
+        self.assertEqual(WaitingTimeDaily.bin(10000), WaitingTimeDaily.BIN_COUNT - 1)
@@ -4,4 +4,9 @@ from . import views
 app_name = 'cmsacc'
 urlpatterns = [
     path('payments/today', views.PaymentsToday.as_view(), name='PaymentToday'),
+    path('payments/today/feed', views.PaymentsFeed, name='PaymentsFeed'),
+    path('revenue', views.RevenueReport.as_view(), name='RevenueReport'),
+    path('receivables', views.AgingReport.as_view(), name='AgingReport'),
+    path('waiting-times', views.WaitingTimeReport.as_view(), name='WaitingTimeReport'),
+    path('cashbook/reconciliation', views.CashbookReconciliationList.as_view(), name='CashbookReconciliation'),
     ]
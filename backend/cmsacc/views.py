@@ -1,22 +1,28 @@
 
 from django.utils import timezone
-import pytz
 from django.conf import settings
-from datetime import datetime, timedelta
-from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
+from datetime import datetime, time, timedelta
+from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse, reverse_lazy, resolve, Resolver404
 from django.shortcuts import redirect, render, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
 from django.forms.models import model_to_dict
-from django.db.models import Q, Sum, Count
 
 from .models import (
     PaymentDetails,
     PaymentMethod,
     Bill,
+    TakingsRollup,
+    ClinicDay,
+    CashReconciliation,
 )
+from cmssys.models import CMSModel
+from .revenue import DIMENSIONS, PERIODS, get_report
+from .aging import BUCKETS, get_aging
+from . import waiting
 
 class PaymentsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
     """
@@ -26,9 +32,11 @@ class PaymentsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         ('a', 'AM'),
         ('p', 'PM'),
     ]
-    PERIOD_CUTOFF_HR = 15  # 3pm in 24hr time
-    PERIOD_CUTOFF_MIN = 0
+    PERIOD_CUTOFF_HR = TakingsRollup.PERIOD_CUTOFF_HR
+    PERIOD_CUTOFF_MIN = TakingsRollup.PERIOD_CUTOFF_MIN
     RECENT_BILLS = 100
+    FEED_POLL_SECS = 10  # today's page polls PaymentsFeed instead of reloading
+    FEED_OVERLAP_SECS = 60  # first feed request also returns changes just before the page was read
     permission_required = ('cmsacc.view_payment_details',)
     template_name = 'cmsacc/payments_today.html'
     model = PaymentDetails
@@ -37,6 +45,8 @@ class PaymentsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
     period = None
     dispdate = None
     lastdate = None
+    prevdate = None
+    nextdate = None
     session_stats = None
     unbalanced_bills = None
 
@@ -44,89 +54,36 @@ class PaymentsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         self.period = self.request.GET.get('p') or ''
         self.day = self.request.GET.get('d') or ''
         self.dt = self.request.GET.get('dt') or ''
-        today = timezone.now()
-        self.lastdate = today - timedelta(days=1)
-        # Cycle through recent bills
-        recent_bills = PaymentDetails.objects.order_by('-date_created')[:self.RECENT_BILLS]
-        recent_dates = set()
-        for bill in recent_bills:
-            recent_dates.add(bill.date_created.strftime('%Y-%m-%d'))
-        error_counter=0
-        while not (self.lastdate.strftime('%Y-%m-%d') in recent_dates) and error_count < 3:
-            try:
-                lastdate = self.lastdate - timedelta(days=1)
-            except:
-                print(f"Error: {self.lastdate} - {timedelta(days=1)}")
-                error_counter += 1
-                lastdate = self.lastdate
-            self.lastdate = lastdate
-        if error_counter == 3:
-            return None
+        now = timezone.localtime()  # CMS dates are local dates
+        today = now.date()
+        self.lastdate = ClinicDay.previous(today) or today - timedelta(days=1)
         if self.day == '1':  # Last encounter date before today
             seldate = self.lastdate
         elif self.day == '2':
             try:
-                seldate = datetime.strptime(self.dt, "%d-%m-%Y")
-                seldate = seldate.replace(tzinfo=pytz.UTC)
-            except:
+                seldate = datetime.strptime(self.dt, "%d-%m-%Y").date()
+            except ValueError:
                 seldate = today
         else:
             seldate = today
-        query_date = seldate.strftime('%Y-%m-%d')
         self.dispdate = seldate.strftime('%d-%m-%Y')
+        self.prevdate = ClinicDay.previous(seldate)
+        # today is not in the calendar until the next update_clinic_days run
+        self.nextdate = (ClinicDay.following(seldate) or today) if seldate < today else None
 
-        time_cutoff = seldate.replace(hour=self.PERIOD_CUTOFF_HR, minute=self.PERIOD_CUTOFF_MIN)
-        
         if not self.period:
-            if seldate >= time_cutoff:
+            if self.day != '2' and now.time() >= time(self.PERIOD_CUTOFF_HR, self.PERIOD_CUTOFF_MIN):
                 self.period = 'p'
             else:
                 self.period = 'a'
-        if self.period == 'a':
-            object_list = PaymentDetails.objects.filter(
-                bill__encounter__date_created__icontains=query_date,
-                bill__encounter__date_created__lt=time_cutoff
-            ).order_by('-bill__encounter__date_created', )
-            self.unbalanced_bills = Bill.objects.filter(
-                unbalance_amt__gt=0,
-                date_created__icontains=query_date,
-                date_created__lt=time_cutoff,
-            ).order_by('-date_created')[:self.RECENT_BILLS]
-        elif self.period == 'p':
-            object_list = PaymentDetails.objects.filter(
-                bill__encounter__date_created__icontains=query_date,
-                bill__encounter__date_created__gte=time_cutoff
-            ).order_by('-bill__encounter__date_created', )
-            self.unbalanced_bills = Bill.objects.filter(
-                unbalance_amt__gt=0,
-                date_created__icontains=query_date,
-                date_created__gte=time_cutoff,
-            ).order_by('-date_created')[:self.RECENT_BILLS]
-        else:
-            object_list = object_list = PaymentDetails.objects.filter(
-                bill__encounter__date_created__icontains=query_date
-            ).order_by('-bill__encounter__date_created', )
-            self.unbalanced_bills = Bill.objects.filter(
-                unbalance_amt__gt=0,
-                date_created__icontains=query_date,
-            ).order_by('-date_created')
-        object_list = object_list.exclude(
-            Q(bill__encounter__patient__patient_no='00AM')|
-            Q(bill__encounter__patient__patient_no='00PM')
+        session = self.period if self.period in (TakingsRollup.AM, TakingsRollup.PM) else None
+        object_list = TakingsRollup.session_payments(seldate, session).order_by(
+            '-bill__encounter__date_created',
         )
-        self.session_stats = object_list.aggregate(
-            count=Count('bill__encounter__id'),
-            bill_total=Sum('bill__total'),
-        )
-        self.session_stats['cash_total'] = object_list.filter(
-            payment_method__payment_method='Cash'
-        ).aggregate(Sum('paid_amt'))['paid_amt__sum'] or 0.0
-        self.session_stats['other_total'] = object_list.exclude(
-            payment_method__payment_method='Cash'
-        ).aggregate(Sum('paid_amt'))['paid_amt__sum'] or 0.0
-        self.session_stats['unbalance_total'] = self.unbalanced_bills.aggregate(
-            Sum('unbalance_amt')
-        )['unbalance_amt__sum'] or 0.0
+        self.unbalanced_bills = TakingsRollup.unbalanced_bills(seldate, session).order_by(
+            '-date_created',
+        )[:self.RECENT_BILLS]
+        self.session_stats = TakingsRollup.stats(seldate, session)
 
         return object_list
 
@@ -137,10 +94,175 @@ class PaymentsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         context['session_stats'] = self.session_stats
         context['lastdate'] = self.lastdate.strftime("%d-%m-%Y")
         context['dispdate'] = self.dispdate
+        context['prevdate'] = self.prevdate.strftime("%d-%m-%Y") if self.prevdate else ''
+        context['nextdate'] = self.nextdate.strftime("%d-%m-%Y") if self.nextdate else ''
+        context['clinic_dates'] = [date.isoformat() for date in ClinicDay.dates()]
+        cms_now = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
+        context['feed_since'] = (cms_now - timedelta(seconds=self.FEED_OVERLAP_SECS)).isoformat()
+        context['feed_poll_secs'] = self.FEED_POLL_SECS
         context['unbalanced_bills'] = self.unbalanced_bills
         return context
 
 
+@login_required
+@permission_required('cmsacc.view_paymentdetails')
+def PaymentsFeed(request, *args, **kwargs):
+    """
+    Returns JSON changes to today's PaymentsToday session (GET p) since GET since,
+    a CMS last_updated watermark: one seek on last_updated each for payments and bills
+    Rows are rendered with the page's row templates; rows changed at the watermark
+    itself are sent again, session stats only when something is newer
+    """
+    try:
+        since = datetime.fromisoformat(request.GET.get('since', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid since'}, status=400)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.utc)
+    period = request.GET.get('p')
+    session = period if period in (TakingsRollup.AM, TakingsRollup.PM) else None
+    today = timezone.localdate()
+    payments = list(TakingsRollup.session_payments(today, session).filter(
+        last_updated__gte=since,
+    ).select_related('bill__encounter__patient', 'bill__encounter__doctor', 'payment_method'))
+    bills = list(Bill.objects.filter(
+        CMSModel.local_range_q('date_created', today, today, session), last_updated__gte=since,
+    ).select_related('encounter__patient', 'encounter__doctor'))
+    changed = [obj.last_updated for obj in payments + bills]
+    data = {
+        'since': max(changed + [since]).isoformat(),
+        'payments': [
+            {'id': entry.id, 'html': render_to_string('cmsacc/_payment_row.html', {'entry': entry})}
+            for entry in payments
+        ],
+        'bills': [
+            {
+                'id': entry.id,
+                'balanced': not entry.unbalance_amt or entry.unbalance_amt <= 0,
+                'html': render_to_string('cmsacc/_unbalanced_bill_row.html', {'entry': entry}),
+            }
+            for entry in bills
+        ],
+        'stats': None,
+    }
+    if any(last_updated > since for last_updated in changed):
+        data['stats'] = TakingsRollup.stats(today, session)
+    return JsonResponse(data)
+
+
+class RevenueReport(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
+    """
+    Revenue by period and charge item/doctor/encounter type (see cmsacc.revenue)
+    GET begin, end (YYYY-MM-DD), g (dimensions, repeated), period (day/month/year, '' for totals)
+    """
+    permission_required = ('cmsacc.view_bill',)
+    template_name = 'cmsacc/revenue_report.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        today = timezone.localdate()
+        begin = CMSModel.parse_local_date(self.request.GET.get('begin')) or today.replace(month=1, day=1)
+        end = CMSModel.parse_local_date(self.request.GET.get('end'))
+        group_by = [dimension for dimension in DIMENSIONS if dimension in self.request.GET.getlist('g')]
+        if 'g' not in self.request.GET:
+            group_by = ['charge_item']
+        period = self.request.GET.get('period', 'month')
+        if period not in PERIODS:
+            period = 'month'
+        report = get_report(begin, end, group_by, period)
+        context['begin'] = begin.isoformat()
+        context['end'] = end.isoformat() if end else ''
+        context['group_by'] = group_by
+        context['dimensions'] = [(dimension, dimension.replace('_', ' ').capitalize()) for dimension in DIMENSIONS]
+        context['period'] = period
+        context['report'] = report
+        context['report_total'] = sum(row['amount'] for row in report)
+        return context
+
+
+class AgingReport(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
+    """
+    Outstanding (unbalanced) bills of all days by patient and age (see cmsacc.aging)
+    Cached for the day; GET refresh=1 recomputes
+    """
+    permission_required = ('cmsacc.view_bill',)
+    template_name = 'cmsacc/aging_report.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        (rows, totals) = get_aging(refresh=self.request.GET.get('refresh') == '1')
+        context['buckets'] = [(key, label) for (key, label, max_days) in BUCKETS]
+        context['aging_list'] = [
+            dict(row, amounts=[row[key] for (key, label, max_days) in BUCKETS]) for row in rows
+        ]
+        context['totals'] = dict(totals, amounts=[totals[key] for (key, label, max_days) in BUCKETS])
+        return context
+
+
+class WaitingTimeReport(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
+    """
+    Waiting (arrival to consultation) and service (consultation to billing) time
+    percentiles of closed days by doctor/weekday/hour (see cmsacc.waiting)
+    GET begin, end (YYYY-MM-DD), g (groups, repeated)
+    """
+    permission_required = ('cmsacc.view_bill',)
+    template_name = 'cmsacc/waiting_time_report.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        today = timezone.localdate()
+        begin = CMSModel.parse_local_date(self.request.GET.get('begin')) or today - timedelta(days=90)
+        end = CMSModel.parse_local_date(self.request.GET.get('end'))
+        group_by = [group for group in waiting.GROUPS if group in self.request.GET.getlist('g')]
+        if 'g' not in self.request.GET:
+            group_by = ['weekday', 'hour']
+        context['begin'] = begin.isoformat()
+        context['end'] = end.isoformat() if end else ''
+        context['groups'] = [(group, group.capitalize()) for group in waiting.GROUPS]
+        context['group_by'] = group_by
+        context['percentiles'] = waiting.PERCENTILES
+        context['report'] = [
+            dict(row, waits=[row[f"wait_p{pct}"] for pct in waiting.PERCENTILES],
+                 services=[row[f"service_p{pct}"] for pct in waiting.PERCENTILES])
+            for row in waiting.get_report(begin, end, group_by)
+        ]
+        return context
+
+
+class CashbookReconciliationList(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+    """
+    Stored results of reconciling Cashbook with cash payments (manage.py reconcile_cashbook)
+    GET begin, end (YYYY-MM-DD), x=1: only days with discrepancies
+    """
+    permission_required = ('cmsacc.view_cashbook',)
+    template_name = 'cmsacc/cashbook_reconciliation.html'
+    model = CashReconciliation
+    context_object_name = 'reconciliation_list'
+    paginate_by = 31
+
+    def get_queryset(self):
+        self.begin = self.request.GET.get('begin') or ''
+        self.end = self.request.GET.get('end') or ''
+        self.discrepancies_only = self.request.GET.get('x') == '1'
+        object_list = CashReconciliation.objects.prefetch_related('discrepancies')
+        begin = CMSModel.parse_local_date(self.begin)
+        end = CMSModel.parse_local_date(self.end)
+        if begin:
+            object_list = object_list.filter(date__gte=begin)
+        if end:
+            object_list = object_list.filter(date__lte=end)
+        if self.discrepancies_only:
+            object_list = object_list.filter(discrepancy_count__gt=0)
+        return object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['begin'] = self.begin
+        context['end'] = self.end
+        context['discrepancies_only'] = self.discrepancies_only
+        return context
+
+
 # class BillsToday(ListView, LoginRequiredMixin, PermissionRequiredMixin):
 #     """
 #     Lists monthly CMS billing
@@ -0,0 +1,90 @@
+import calendar
+from django.core.cache import cache
+from django.db.models import Max
+from cmssys.models import CmsUser
+from .models import WaitingTimeDaily
+
+GROUPS = ['doctor', 'weekday', 'hour']
+PERCENTILES = [50, 75, 90]
+CACHE_SECS = 24 * 60 * 60
+
+
+def percentile(histogram, pct):
+    """Upper bound (minutes) of the bin holding the pct percentile; None if empty or in the overflow bin"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = total * pct / 100
+    running = 0
+    for (i, count) in enumerate(histogram):
+        running += count
+        if running >= rank:
+            if i == len(histogram) - 1:
+                return None
+            return (i + 1) * WaitingTimeDaily.BIN_MINUTES
+    return None
+
+def _add(histogram, other):
+    for (i, count) in enumerate(other):
+        histogram[i] += count
+
+def _cache_key(start, end, group_by):
+    last_id = WaitingTimeDaily.objects.aggregate(Max('id'))['id__max']
+    return f"cmsacc:waiting:{start}:{end}:{','.join(group_by)}:{last_id}"
+
+def compute_report(start, end, group_by):
+    """
+    Waiting/service time percentiles of closed days from start to end (dates, inclusive,
+    None for open) grouped by any of GROUPS, from the stored WaitingTimeDaily histograms
+    Returns list of row dicts: <group> (and doctor_id), count, wait_p<pct>, service_p<pct>
+    (minutes, None if above the histogram range), sorted by group
+    """
+    rows = WaitingTimeDaily.objects.all()
+    if start:
+        rows = rows.filter(date__gte=start)
+    if end:
+        rows = rows.filter(date__lte=end)
+    groups = {}
+    for row in rows.iterator():
+        values = {'doctor': row.doctor_id, 'weekday': row.date.weekday(), 'hour': row.hour}
+        key = tuple(values[group] for group in group_by)
+        if key not in groups:
+            groups[key] = [0, [0] * WaitingTimeDaily.BIN_COUNT, [0] * WaitingTimeDaily.BIN_COUNT]
+        groups[key][0] += row.count
+        _add(groups[key][1], row.wait_histogram)
+        _add(groups[key][2], row.service_histogram)
+
+    doctors = {}
+    if 'doctor' in group_by:
+        doctor_ids = {key[group_by.index('doctor')] for key in groups}
+        doctors = dict(CmsUser.objects.filter(id__in=doctor_ids).values_list('id', 'name'))
+    report = []
+    for key in sorted(groups):
+        (count, wait_histogram, service_histogram) = groups[key]
+        row = {'count': count}
+        for (group, value) in zip(group_by, key):
+            if group == 'doctor':
+                row['doctor_id'] = value
+                value = doctors.get(value, value)
+            elif group == 'weekday':
+                value = calendar.day_abbr[value]
+            elif group == 'hour':
+                value = f"{value:02d}:00"
+            row[group] = value
+        for pct in PERCENTILES:
+            row[f"wait_p{pct}"] = percentile(wait_histogram, pct)
+            row[f"service_p{pct}"] = percentile(service_histogram, pct)
+        report.append(row)
+    return report
+
+def get_report(start, end, group_by):
+    """
+    compute_report(), cached until WaitingTimeDaily changes
+    Closed days are stored by manage.py update_waiting_times, not here
+    """
+    key = _cache_key(start, end, group_by)
+    report = cache.get(key)
+    if report is None:
+        report = compute_report(start, end, group_by)
+        cache.set(key, report, CACHE_SECS)
+    return report
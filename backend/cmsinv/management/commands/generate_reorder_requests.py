@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from cmssys.models import CmsUser
+from cmsinv.models import Supplier
+from cmsinv.reorder import suggest_reorders, create_requests, COVER_DAYS, LEAD_DAYS
+
+class Command(BaseCommand):
+    """
+    Creates draft (Pending) CMS Requests per preferred supplier for active items
+    below reorder level or expected to run out within --lead-days
+    """
+    help = 'Generates reorder Requests/RequestItems for items running low'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List suggestions without creating requests')
+        parser.add_argument('--cover-days', type=int, default=COVER_DAYS, help='Days of usage to order beyond lead time')
+        parser.add_argument('--lead-days', type=int, default=LEAD_DAYS, help='Reorder items running out within this many days')
+        parser.add_argument('--username', default='cmsman', help='CMS user recorded as requester')
+
+    def handle(self, *args, **options):
+        try:
+            cmsuser_obj = CmsUser.objects.get(username=options['username'])
+        except CmsUser.DoesNotExist:
+            raise CommandError(f"CMS user {options['username']} not found")
+        suggestions, no_supplier = suggest_reorders(options['cover_days'], options['lead_days'])
+        suppliers = Supplier.objects.in_bulk(suggestions.keys())
+        for (supplier_id, lines) in suggestions.items():
+            self.stdout.write(f"{suppliers[supplier_id].name if supplier_id in suppliers else supplier_id}:")
+            for line in lines:
+                self.stdout.write(f"  {line['quantity']:>6} x {line['product_name']} (stock {line['stock_qty']})")
+        for line in no_supplier:
+            self.stdout.write(f"No supplier: {line['quantity']:>6} x {line['product_name']}")
+        if not options['dry_run']:
+            create_requests(suggestions, cmsuser_obj)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from cmsinv.models import InventoryItemIndex
+
+class Command(BaseCommand):
+    """
+    Updates local search index (cmsinv.InventoryItemIndex) of CMS InventoryItem
+    Only items with last_updated since the last run are fetched; schedule e.g. every minute
+    """
+    help = 'Updates InventoryItemIndex from CMS InventoryItem changed since last update'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-index all items and remove deleted items')
+
+    def handle(self, *args, **options):
+        created, updated, deleted = InventoryItemIndex.refresh(full=options['full'])
+        self.stdout.write(f"Item index: {created} created, {updated} updated, {deleted} deleted")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from cmsinv.models import ItemMovementDaily
+from cmsinv.projection import refresh_projections
+
+class Command(BaseCommand):
+    """
+    Updates local daily rollup (cmsinv.ItemMovementDaily) of CMS InventoryMovementLog
+    Only log entries added since the last run are read; schedule e.g. every few minutes
+    Days of stock remaining (cmsinv.ItemProjection) are then recomputed if the rollup
+    changed or the day changed
+    """
+    help = 'Updates ItemMovementDaily from CMS InventoryMovementLog entries added since last update'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild rollup from the whole movement log')
+
+    def handle(self, *args, **options):
+        processed = ItemMovementDaily.refresh(full=options['full'])
+        self.stdout.write(f"Movement rollup: {processed} log entries processed")
+        projected = refresh_projections()
+        if projected is not None:
+            self.stdout.write(f"Days of stock: {projected} items projected")
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.3 on 2026-10-18 10:05
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsinv', '0007_auto_20210204_1657'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            reverse_sql=migrations.RunSQL.noop,
+            hints={'model_name': 'inventoryitemindex'},
+        ),
+        migrations.CreateModel(
+            name='InventoryItemIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cmsid', models.BigIntegerField(unique=True)),
+                ('product_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('alias', models.CharField(blank=True, max_length=255, null=True)),
+                ('generic_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('document', models.TextField(default='')),
+                ('discontinue', models.BooleanField(default=False)),
+                ('last_updated', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitemindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='cmsinv_itemindex_doc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsinv', '0008_inventoryitemindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemMovementDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cmsid', models.BigIntegerField(blank=True, null=True)),
+                ('movement_type', models.CharField(blank=True, default='', max_length=255)),
+                ('move_item', models.CharField(blank=True, default='', max_length=255)),
+                ('date', models.DateField(db_index=True)),
+                ('quantity', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('cumulative_quantity', models.FloatField(default=0)),
+                ('last_log_id', models.BigIntegerField(default=0, db_index=True)),
+            ],
+            options={
+                'unique_together': {('cmsid', 'movement_type', 'move_item', 'date')},
+            },
+        ),
+    ]
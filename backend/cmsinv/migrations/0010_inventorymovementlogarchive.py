@@ -0,0 +1,36 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsinv', '0009_itemmovementdaily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovementLogArchive',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=1)),
+                ('date_created', models.DateTimeField()),
+                ('last_updated', models.DateTimeField()),
+                ('lot_no', models.CharField(blank=True, max_length=255, null=True)),
+                ('move_item', models.CharField(blank=True, max_length=255, null=True)),
+                ('quantity', models.FloatField()),
+                ('reference_no', models.CharField(blank=True, max_length=255, null=True)),
+                ('movement_type', models.CharField(blank=True, choices=[('Delivery', 'Delivery'), ('Dispensary', 'Dispensary'), ('Reconciliation', 'Reconciliation'), ('Stock Initialization', 'Stock Initialization')], max_length=255, null=True)),
+                ('updated_by', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovementlogarchive',
+            index=models.Index(fields=['last_updated', 'id'], name='cmsinv_movelogarch_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='inventorymovementlogarchive',
+            index=models.Index(fields=['date_created'], name='cmsinv_movelogarch_created'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmsinv', '0010_inventorymovementlogarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemProjection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cmsid', models.BigIntegerField(unique=True)),
+                ('discontinue', models.BooleanField(default=False)),
+                ('inventory_type', models.CharField(blank=True, max_length=255, null=True)),
+                ('dangerous_sign', models.BooleanField(default=False)),
+                ('stock_qty', models.FloatField(default=0)),
+                ('daily_usage', models.FloatField(default=0)),
+                ('days_remaining', models.FloatField(blank=True, db_index=True, null=True)),
+                ('date', models.DateField()),
+                ('last_log_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
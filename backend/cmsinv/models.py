@@ -1,4 +1,6 @@
-from django.db import models
+from collections import defaultdict
+from django.db import IntegrityError, models, router, transaction
+from django.contrib.postgres.indexes import GinIndex
 from cmssys.models import CMSModel, CmsUser, TextBooleanField 
 from datetime import timedelta
 from django.utils import timezone
@@ -257,26 +259,75 @@ class InventoryItem(CMSModel):
     def is_active(self):
         return not(self.discontinue)
 
+    CLINIC_DRUG_NO_PREFIX = 'CN'
+    CLINIC_DRUG_NO_DIGITS = 6
+
     @classmethod
-    def generateNextClinicDrugNo(cls):
+    def formatClinicDrugNo(cls, number):
+        return f"{cls.CLINIC_DRUG_NO_PREFIX}{str(number).rjust(cls.CLINIC_DRUG_NO_DIGITS, '0')}"
+
+    @classmethod
+    def lastClinicDrugNumber(cls, using=None, lock=False):
         """
-        Generate new clinic drug no.
+        Returns numeric part of the last clinic drug no. (0 if none)
+        Uses the unique index on clinic_drug_no (ORDER BY ... DESC LIMIT 1) rather than
+        loading all numbers; lock=True adds FOR UPDATE, which must be inside a transaction
         """
-        PREFIX = 'CN'
-        DIGIT_LENGTH = 6
-        clinic_drugs = cls.objects.filter(
-            clinic_drug_no__isnull=False,
-        ).exclude(clinic_drug_no__exact='')
-        clinic_drug_nos = list(clinic_drugs.values_list('clinic_drug_no', flat=True).order_by('clinic_drug_no'))
-        last_clinic_drug_no = clinic_drug_nos[-1]
-        no_numeric = last_clinic_drug_no[len(PREFIX):]
-        if len(no_numeric) != DIGIT_LENGTH:
+        clinic_drugs = cls.objects.using(using).filter(
+            clinic_drug_no__startswith=cls.CLINIC_DRUG_NO_PREFIX,
+        )
+        if lock:
+            clinic_drugs = clinic_drugs.select_for_update()
+        last_clinic_drug_no = clinic_drugs.order_by('-clinic_drug_no').values_list('clinic_drug_no', flat=True).first()
+        if not last_clinic_drug_no:
+            return 0
+        no_numeric = last_clinic_drug_no[len(cls.CLINIC_DRUG_NO_PREFIX):]
+        if len(no_numeric) != cls.CLINIC_DRUG_NO_DIGITS:
             print('Warning: clinic_drug_no digits does not match configured.')
-        next_no = str(int(no_numeric) + 1)
-        next_clinic_drug_no = f"{PREFIX}{next_no.rjust(DIGIT_LENGTH, '0')}"
-        # print(f"Last clinic drug no.: {last_clinic_drug_no}; Generated next no.: {next_clinic_drug_no}")
+        return int(no_numeric)
+
+    @classmethod
+    def generateNextClinicDrugNo(cls):
+        """
+        Generate new clinic drug no. (for display; not reserved)
+        """
+        return cls.formatClinicDrugNo(cls.lastClinicDrugNumber() + 1)
+
+    @classmethod
+    def reserveClinicDrugNos(cls, count=1, using='cms_db'):
+        """
+        Reserve block of count consecutive new clinic drug no. (not written)
+        Must be called inside transaction.atomic(using=using); the last clinic drug no. is
+        read with SELECT ... FOR UPDATE. This only locks the current last row: a
+        reservation that waited on it can read the same last number once the other
+        transaction commits, so the numbers must be written with assignClinicDrugNos()
+        """
+        last_number = cls.lastClinicDrugNumber(using=using, lock=True)
+        return [cls.formatClinicDrugNo(last_number + offset) for offset in range(1, count + 1)]
 
-        return(next_clinic_drug_no)
+    @classmethod
+    def assignClinicDrugNos(cls, items, using='cms_db', attempts=3):
+        """
+        Assign and write new clinic drug no. to saved items; returns the numbers
+        Must be called inside transaction.atomic(using=using). The numbers are written
+        in a savepoint: if the unique index on clinic_drug_no rejects a number handed
+        out concurrently, the block is reserved again (up to attempts times)
+        """
+        for attempt in range(1, attempts + 1):
+            clinic_drug_nos = cls.reserveClinicDrugNos(len(items), using=using)
+            for (item, clinic_drug_no) in zip(items, clinic_drug_nos):
+                item.clinic_drug_no = clinic_drug_no
+            try:
+                with transaction.atomic(using=using):
+                    cls.objects.using(using).bulk_update(items, ['clinic_drug_no'])
+            except IntegrityError:
+                for item in items:
+                    item.clinic_drug_no = None
+                if attempt == attempts:
+                    raise
+                print(f"Warning: clinic drug no. {clinic_drug_nos[0]} taken, reserving again")
+                continue
+            return clinic_drug_nos
 
     class Meta:
         managed = False
@@ -703,3 +754,317 @@ class PrescriptionDetail(CMSModel):
         managed = False
         db_table = 'prescription_detail'
         app_label = 'cmsinv'
+
+# LOCAL Models - stored in default database (db_routers.cms.LOCAL_MODELS)
+# ============
+
+class InventoryItemIndex(models.Model):
+    """
+    Local search index of CMS inventory_item, see cmsinv.search
+    document holds the lowercase searchable fields (incl. Chinese names) with a
+    pg_trgm GIN index, so substring searches do not scan the CMS table
+    Refreshed incrementally from InventoryItem.last_updated: manage.py update_item_index
+    """
+    SEARCH_FIELDS = [
+        'product_name', 'product_name_chinese',
+        'alias',
+        'generic_name', 'generic_name_chinese',
+        'label_name', 'label_name_chinese',
+        'ingredient',
+        'registration_no',
+        'clinic_drug_no',
+    ]
+
+    cmsid = models.BigIntegerField(unique=True)
+    product_name = models.CharField(max_length=255, blank=True, null=True)
+    alias = models.CharField(max_length=255, blank=True, null=True)
+    generic_name = models.CharField(max_length=255, blank=True, null=True)
+    document = models.TextField(default='')
+    discontinue = models.BooleanField(default=False)
+    last_updated = models.DateTimeField(blank=True, null=True, db_index=True)  # CMS last_updated
+
+    class Meta:
+        app_label = 'cmsinv'
+        indexes = [
+            GinIndex(fields=['document'], name='cmsinv_itemindex_doc_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f"#{self.cmsid} {self.product_name} ({self.last_updated})"
+
+    @classmethod
+    def from_cmsitem(cls, cmsitem_obj):
+        document = ' '.join(
+            str(getattr(cmsitem_obj, field)) for field in cls.SEARCH_FIELDS if getattr(cmsitem_obj, field)
+        ).lower()
+        return cls(
+            cmsid=cmsitem_obj.id,
+            product_name=cmsitem_obj.product_name,
+            alias=cmsitem_obj.alias,
+            generic_name=cmsitem_obj.generic_name,
+            document=document,
+            discontinue=bool(cmsitem_obj.discontinue),
+            last_updated=cmsitem_obj.last_updated,
+        )
+
+    @classmethod
+    def refresh(cls, full=False, batch_size=500):
+        """
+        Update index from CMS items changed since the last indexed last_updated
+        full=True re-indexes all items and removes items no longer in CMS
+        Returns (created, updated, deleted) counts
+        """
+        cmsitems = InventoryItem.objects.only('id', 'last_updated', 'discontinue', *cls.SEARCH_FIELDS)
+        watermark = None if full else cls.objects.aggregate(models.Max('last_updated'))['last_updated__max']
+        if watermark:
+            # >= so items updated within the same second as the last refresh are not missed;
+            # items without last_updated cannot be compared and are always re-indexed
+            cmsitems = cmsitems.filter(models.Q(last_updated__gte=watermark) | models.Q(last_updated__isnull=True))
+        existing = cls.objects.in_bulk(field_name='cmsid') if full else None
+        created = updated = 0
+        seen = set()
+        batch = list()
+
+        def write_batch(batch):
+            nonlocal created, updated
+            if existing is None:
+                current = cls.objects.in_bulk([entry.cmsid for entry in batch], field_name='cmsid')
+            else:
+                current = existing
+            to_create = []
+            to_update = []
+            for entry in batch:
+                if entry.cmsid in current:
+                    entry.id = current[entry.cmsid].id
+                    to_update.append(entry)
+                else:
+                    to_create.append(entry)
+            cls.objects.bulk_create(to_create)
+            cls.objects.bulk_update(to_update, [
+                'product_name', 'alias', 'generic_name', 'document', 'discontinue', 'last_updated',
+            ])
+            created += len(to_create)
+            updated += len(to_update)
+
+        for cmsitem_obj in cmsitems.iterator():
+            seen.add(cmsitem_obj.id)
+            batch.append(cls.from_cmsitem(cmsitem_obj))
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                batch = []
+        if batch:
+            write_batch(batch)
+        deleted = 0
+        if full:
+            deleted, _ = cls.objects.exclude(cmsid__in=seen).delete()
+        return (created, updated, deleted)
+
+
+class ItemProjection(models.Model):
+    """
+    Local days of stock remaining per CMS inventory_item, with the item columns the
+    item list filters on, so the list can be filtered and sorted by days remaining
+    in SQL (see cmsinv.projection)
+    Recomputed when ItemMovementDaily has new entries (last_log_id) or the day
+    changes: manage.py update_movement_rollup
+    """
+    cmsid = models.BigIntegerField(unique=True)
+    discontinue = models.BooleanField(default=False)
+    inventory_type = models.CharField(max_length=255, blank=True, null=True)
+    dangerous_sign = models.BooleanField(default=False)
+    stock_qty = models.FloatField(default=0)
+    daily_usage = models.FloatField(default=0)
+    days_remaining = models.FloatField(blank=True, null=True, db_index=True)  # None if no usage
+    date = models.DateField()  # last day of the lookback period
+    last_log_id = models.BigIntegerField(default=0)  # ItemMovementDaily watermark used
+
+    class Meta:
+        app_label = 'cmsinv'
+
+    def __str__(self):
+        return f"#{self.cmsid}: {self.days_remaining} days ({self.date})"
+
+
+class InventoryMovementLogArchive(CMSModel):
+    """
+    Local archive of CMS inventory_movement_log rows older than CMS_ARCHIVE_DAYS
+    (same ids and fields), see cmssys.archive; InventoryMovementLogList spans both
+    """
+    version = models.BigIntegerField(default=1)
+    date_created = models.DateTimeField()
+    last_updated = models.DateTimeField()
+    lot_no = models.CharField(max_length=255, blank=True, null=True)
+    move_item = models.CharField(max_length=255, blank=True, null=True)
+    quantity = models.FloatField()
+    reference_no = models.CharField(max_length=255, blank=True, null=True)
+    movement_type = models.CharField(choices=InventoryMovementLog.MOVEMENT_TYPE_CHOICES, max_length=255, blank=True, null=True)
+    updated_by = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        app_label = 'cmsinv'
+        indexes = [
+            models.Index(fields=['last_updated', 'id'], name='cmsinv_movelogarch_keyset'),
+            models.Index(fields=['date_created'], name='cmsinv_movelogarch_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.last_updated} [{self.movement_type}]: {self.quantity} | {self.move_item} (archived)"
+
+
+class ItemMovementDaily(models.Model):
+    """
+    Local daily rollup of CMS inventory_movement_log per item and movement type
+    cumulative_quantity is the running total of the series (item, movement type)
+    up to and including date, so the total over any date range is the difference
+    of two rows: see total()
+    Log entries are matched to InventoryItem by product name; entries that do not
+    match are kept under their move_item text with cmsid null
+    Updated incrementally from the last processed log id: manage.py update_movement_rollup
+    """
+    cmsid = models.BigIntegerField(blank=True, null=True)  # InventoryItem id
+    movement_type = models.CharField(max_length=255, blank=True, default='')
+    move_item = models.CharField(max_length=255, blank=True, default='')  # only if cmsid is null
+    date = models.DateField(db_index=True)  # CMS local date of date_created
+    quantity = models.FloatField(default=0)
+    count = models.IntegerField(default=0)
+    cumulative_quantity = models.FloatField(default=0)
+    last_log_id = models.BigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        app_label = 'cmsinv'
+        unique_together = [('cmsid', 'movement_type', 'move_item', 'date')]
+
+    def __str__(self):
+        return f"{self.date} #{self.cmsid or self.move_item} [{self.movement_type}]: {self.quantity}"
+
+    @property
+    def series(self):
+        return (self.cmsid, self.move_item, self.movement_type)
+
+    @staticmethod
+    def item_ids_by_name():
+        """Returns dict of lowercase product name => InventoryItem id, active and older items preferred"""
+        cmsids = {}
+        item_names = InventoryItem.objects.order_by('-discontinue', '-id').values_list('id', 'product_name')
+        for (cmsid, product_name) in item_names:
+            if product_name:
+                cmsids[product_name.strip().lower()] = cmsid
+        return cmsids
+
+    @classmethod
+    def _apply(cls, deltas):
+        """
+        Adds deltas {(cmsid, move_item, movement_type, date): [quantity, count, last_log_id]}
+        and recomputes cumulative_quantity of the following days of each series
+        """
+        by_series = defaultdict(dict)
+        for ((cmsid, move_item, movement_type, date), delta) in deltas.items():
+            by_series[(cmsid, move_item, movement_type)][date] = delta
+        cmsids = {series[0] for series in by_series if series[0] is not None}
+        move_items = {series[1] for series in by_series if series[0] is None}
+        existing = defaultdict(dict)
+        rows = cls.objects.filter(date__gte=min(key[3] for key in deltas)).filter(
+            models.Q(cmsid__in=cmsids) | models.Q(cmsid__isnull=True, move_item__in=move_items)
+        )
+        for row in rows:
+            existing[row.series][row.date] = row
+
+        to_create = []
+        to_update = []
+        for (series, series_deltas) in by_series.items():
+            rows = existing[series]
+            first_date = min(series_deltas)
+            later_dates = [date for date in rows if date >= first_date]
+            earlier_dates = [date for date in rows if date < first_date]
+            if later_dates:
+                row = rows[min(later_dates)]
+                running = row.cumulative_quantity - row.quantity
+            elif earlier_dates:
+                running = rows[max(earlier_dates)].cumulative_quantity
+            else:
+                (cmsid, move_item, movement_type) = series
+                running = cls.objects.filter(
+                    cmsid=cmsid, move_item=move_item, movement_type=movement_type, date__lt=first_date,
+                ).order_by('-date').values_list('cumulative_quantity', flat=True).first() or 0
+            for date in sorted(set(later_dates) | set(series_deltas)):
+                row = rows.get(date)
+                if row is None:
+                    (cmsid, move_item, movement_type) = series
+                    row = cls(cmsid=cmsid, move_item=move_item, movement_type=movement_type, date=date)
+                    to_create.append(row)
+                else:
+                    to_update.append(row)
+                if date in series_deltas:
+                    (quantity, count, last_log_id) = series_deltas[date]
+                    row.quantity += quantity
+                    row.count += count
+                    row.last_log_id = max(row.last_log_id, last_log_id)
+                running += row.quantity
+                row.cumulative_quantity = running
+        cls.objects.bulk_create(to_create)
+        cls.objects.bulk_update(to_update, ['quantity', 'count', 'cumulative_quantity', 'last_log_id'])
+
+    @classmethod
+    def refresh(cls, full=False, batch_size=10000):
+        """
+        Adds CMS InventoryMovementLog entries with id above the last processed id
+        full=True rebuilds the rollup from the whole log
+        Returns number of log entries processed
+        """
+        with transaction.atomic(using=router.db_for_write(cls)):
+            if full:
+                cls.objects.all().delete()
+            watermark = cls.objects.aggregate(models.Max('last_log_id'))['last_log_id__max'] or 0
+            cmsids = cls.item_ids_by_name()
+            processed = 0
+            # Read log from CMS directly: the mirror is not guaranteed to be complete up to an id
+            sources = [InventoryMovementLog.objects.using('cms_db')]
+            if full:
+                # entries deleted from CMS by archive_cms_history are only in the archive
+                sources.insert(0, InventoryMovementLogArchive.objects.all())
+            for source in sources:
+                while True:
+                    logs = list(source.filter(id__gt=watermark).order_by('id').values_list(
+                        'id', 'date_created', 'move_item', 'movement_type', 'quantity',
+                    )[:batch_size])
+                    if not logs:
+                        break
+                    deltas = defaultdict(lambda: [0.0, 0, 0])
+                    for (log_id, date_created, move_item, movement_type, quantity) in logs:
+                        move_item = (move_item or '').strip()
+                        cmsid = cmsids.get(move_item.lower())
+                        # CMS stores local time as UTC, so the UTC date is the local date
+                        date = timezone.localtime(date_created, timezone.utc).date()
+                        delta = deltas[(cmsid, '' if cmsid else move_item[:255], movement_type or '', date)]
+                        delta[0] += quantity or 0
+                        delta[1] += 1
+                        delta[2] = log_id
+                    cls._apply(deltas)
+                    watermark = logs[-1][0]
+                    processed += len(logs)
+        return processed
+
+    @classmethod
+    def total(cls, cmsid, start, end, movement_type=InventoryMovementLog.DISPENSARY, move_item=''):
+        """
+        Total quantity of movement_type for item from start to end (dates, inclusive)
+        Two indexed single-row lookups, independent of the length of the log
+        Items not matched by name: cmsid=None, move_item=<move_item text>
+        """
+        series = cls.objects.filter(cmsid=cmsid, move_item=move_item, movement_type=movement_type)
+        until_end = series.filter(date__lte=end).order_by('-date').values_list('cumulative_quantity', flat=True).first()
+        before_start = series.filter(date__lt=start).order_by('-date').values_list('cumulative_quantity', flat=True).first()
+        return (until_end or 0) - (before_start or 0)
+
+    @classmethod
+    def consumption(cls, cmsid, start, end):
+        """Quantity of item dispensed from start to end (dates, inclusive)"""
+        return abs(cls.total(cmsid, start, end, movement_type=InventoryMovementLog.DISPENSARY))
+
+    @classmethod
+    def totals(cls, start, end, movement_type=InventoryMovementLog.DISPENSARY):
+        """Returns dict of InventoryItem id => total quantity of movement_type from start to end (dates, inclusive)"""
+        rows = cls.objects.filter(
+            cmsid__isnull=False, movement_type=movement_type, date__gte=start, date__lte=end,
+        ).values('cmsid').annotate(total=models.Sum('quantity'))
+        return {row['cmsid']: row['total'] for row in rows}
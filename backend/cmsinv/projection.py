@@ -0,0 +1,85 @@
+from datetime import timedelta
+from django.db import router, transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from .models import InventoryItem, PrescriptionDetail, ItemMovementDaily, ItemProjection
+
+LOOKBACK_DAYS = 90
+
+
+def rollup_watermark():
+    """Last CMS log id processed by ItemMovementDaily (0 if none); one indexed lookup"""
+    return ItemMovementDaily.objects.aggregate(Max('last_log_id'))['last_log_id__max'] or 0
+
+def days_of_stock(stock_qty, usage):
+    """Days stock_qty lasts at usage per day; None if no usage"""
+    if usage > 0:
+        return max(stock_qty or 0, 0) / usage
+    return None
+
+def daily_usage(today, lookback_days=LOOKBACK_DAYS):
+    """
+    Returns dict of InventoryItem id => daily usage over the lookback period up to today
+    Daily usage is the larger of dispensed (ItemMovementDaily) and prescribed (PrescriptionDetail) quantity
+    """
+    start = today - timedelta(days=lookback_days - 1)
+    dispensed = ItemMovementDaily.totals(start, today)
+    prescribed = dict(PrescriptionDetail.objects.filter(
+        PrescriptionDetail.local_range_q('prescription__date_created', start, today),
+    ).values_list('drug_id').annotate(total=Sum('quantity')).order_by())
+    return {
+        cmsid: max(abs(dispensed.get(cmsid) or 0), prescribed.get(cmsid) or 0) / lookback_days
+        for cmsid in set(dispensed) | set(prescribed) if cmsid is not None
+    }
+
+def is_stale(today, watermark):
+    """True if ItemProjection was not computed for today and the rollup watermark"""
+    stored = ItemProjection.objects.values_list('date', 'last_log_id').first()
+    return stored != (today, watermark)
+
+def refresh_projections(lookback_days=LOOKBACK_DAYS, force=False):
+    """
+    Stores days of stock remaining of all CMS items as ItemProjection rows (None for
+    discontinued items and items without usage), replacing the previous rows
+    Skipped unless force if already computed for today and the current rollup watermark
+    Returns number of items stored, None if skipped
+    """
+    today = timezone.localdate()
+    watermark = rollup_watermark()
+    if not force and not is_stale(today, watermark):
+        return None
+    usage_by_item = daily_usage(today, lookback_days)
+    projections = []
+    cmsitems = InventoryItem.objects.values_list(
+        'id', 'discontinue', 'inventory_type', 'dangerous_sign', 'stock_qty',
+    )
+    for (cmsid, discontinue, inventory_type, dangerous_sign, stock_qty) in cmsitems:
+        usage = 0 if discontinue else usage_by_item.get(cmsid, 0)
+        projections.append(ItemProjection(
+            cmsid=cmsid,
+            discontinue=bool(discontinue),
+            inventory_type=inventory_type,
+            dangerous_sign=bool(dangerous_sign),
+            stock_qty=stock_qty or 0,
+            daily_usage=usage,
+            days_remaining=days_of_stock(stock_qty, usage),
+            date=today,
+            last_log_id=watermark,
+        ))
+    with transaction.atomic(using=router.db_for_write(ItemProjection)):
+        ItemProjection.objects.all().delete()
+        ItemProjection.objects.bulk_create(projections, batch_size=1000)
+    return len(projections)
+
+def get_projections():
+    """Returns dict of InventoryItem id => (daily usage, days of stock remaining) of active items"""
+    return {
+        cmsid: (usage, days_left)
+        for (cmsid, usage, days_left) in ItemProjection.objects.filter(discontinue=False).values_list(
+            'cmsid', 'daily_usage', 'days_remaining',
+        )
+    }
+
+def days_remaining_by_id(cmsids):
+    """Returns dict of InventoryItem id => days of stock remaining (None if no usage) for cmsids"""
+    return dict(ItemProjection.objects.filter(cmsid__in=cmsids).values_list('cmsid', 'days_remaining'))
@@ -0,0 +1,106 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from cmssys.audit import AuditWriter
+from .models import InventoryItem, InventoryItemSupplier, Request, RequestItem
+from .projection import get_projections, refresh_projections
+
+CMS_DB = 'cms_db'
+COVER_DAYS = 30  # stock to order for, at current usage
+LEAD_DAYS = 14  # reorder items expected to run out within this many days
+
+
+def suggest_reorders(cover_days=COVER_DAYS, lead_days=LEAD_DAYS):
+    """
+    Evaluates all active InventoryItems against reorder_level, expected_qty and usage
+    (see cmsinv.projection) in one pass; items already on a pending Request are skipped
+    Returns (dict of supplier id => list of suggestion dicts, list of items without supplier)
+    """
+    refresh_projections()  # skipped if current
+    projections = get_projections()
+    items = InventoryItem.objects.using(CMS_DB).filter(discontinue=False).values(
+        'id', 'product_name', 'stock_qty', 'reorder_level', 'expected_qty', 'standard_cost', 'unit',
+    )
+    pending_ids = set(RequestItem.objects.using(CMS_DB).filter(
+        request__status=Request.PENDING,
+    ).values_list('item_id', flat=True))
+    preferred_suppliers = {}
+    item_suppliers = InventoryItemSupplier.objects.using(CMS_DB).order_by(
+        '-suppliers_idx', '-id',
+    ).values_list('inventory_item_id', 'supplier_id')
+    for (cmsid, supplier_id) in item_suppliers:
+        preferred_suppliers[cmsid] = supplier_id  # lowest suppliers_idx written last
+
+    suggestions = defaultdict(list)
+    no_supplier = []
+    for item in items:
+        if item['id'] in pending_ids:
+            continue
+        stock_qty = item['stock_qty'] or 0
+        reorder_level = item['reorder_level'] or 0
+        (usage, days_left) = projections.get(item['id'], (0, None))
+        below_level = reorder_level > 0 and stock_qty <= reorder_level
+        running_out = days_left is not None and days_left <= lead_days
+        if not (below_level or running_out):
+            continue
+        target_qty = max(item['expected_qty'] or 0, reorder_level, usage * (lead_days + cover_days))
+        quantity = round(target_qty - stock_qty)
+        if quantity <= 0:
+            continue
+        suggestion = dict(item, quantity=quantity, usage=usage, days_left=days_left)
+        supplier_id = preferred_suppliers.get(item['id'])
+        if supplier_id is None:
+            no_supplier.append(suggestion)
+        else:
+            suggestions[supplier_id].append(suggestion)
+    return suggestions, no_supplier
+
+def create_requests(suggestions, cmsuser_obj, session_id=None, uri=None):
+    """
+    Bulk creates a Pending Request per supplier with a RequestItem per suggestion
+    Returns list of Requests created
+    """
+    if not suggestions:
+        return []
+    # whole seconds: CMS datetime columns have no fractional part
+    cms_now = (timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)).replace(microsecond=0)
+    # run token in remarks: requests of this run are read back by remarks alone
+    remarks = f"Reorder suggestion {cms_now:%Y-%m-%d %H:%M:%S} ({uuid.uuid4().hex[:12]})"
+    with AuditWriter(cmsuser_obj.username, session_id=session_id, uri=uri, using=CMS_DB) as audit:
+        Request.objects.using(CMS_DB).bulk_create([
+            Request(
+                remarks=remarks,
+                requested_by=cmsuser_obj,
+                status=Request.PENDING,
+                supplier_id=supplier_id,
+                total_cost=sum(line['quantity'] * (line['standard_cost'] or 0) for line in lines),
+                updated_by=cmsuser_obj.username,
+                date_created=cms_now,
+                last_updated=cms_now,
+            ) for (supplier_id, lines) in suggestions.items()
+        ])
+        # bulk_create on MySQL does not return ids: read back the requests of this run
+        request_list = list(Request.objects.using(CMS_DB).filter(remarks=remarks, requested_by=cmsuser_obj))
+        new_request_items = []
+        for request_obj in request_list:
+            audit.insert(request_obj)
+            for (idx, line) in enumerate(suggestions[request_obj.supplier_id]):
+                request_item = RequestItem(
+                    expected_qty=line['expected_qty'] or 0,
+                    item_id=line['id'],
+                    quantity=line['quantity'],
+                    remarks=None if line['days_left'] is None else f"{line['days_left']:.0f} days left",
+                    request=request_obj,
+                    stock_qty=line['stock_qty'] or 0,
+                    unit=line['unit'],
+                    request_items_idx=idx,
+                )
+                new_request_items.append(request_item)
+        RequestItem.objects.using(CMS_DB).bulk_create(new_request_items)
+        # read back for ids, all items of the new requests are new
+        for request_item in RequestItem.objects.using(CMS_DB).filter(request__in=request_list).order_by('id'):
+            audit.insert(request_item)
+    print(f"{len(request_list)} reorder requests created ({len(new_request_items)} items)")
+    return request_list
@@ -0,0 +1,93 @@
+import logging
+from django.db import connections
+from django.db.models import Q, Case, When, IntegerField
+from django.db.models.functions import Greatest
+from django.contrib.postgres.search import TrigramSimilarity
+from .models import InventoryItem, InventoryItemIndex
+
+MAX_RESULTS = 500
+
+logger = logging.getLogger(__name__)
+_fallback_warned = False  # search_items() warns once per process
+
+
+def index_available():
+    """Index search needs Postgres (pg_trgm) and a populated InventoryItemIndex"""
+    db = InventoryItemIndex.objects.db
+    return connections[db].vendor == 'postgresql' and InventoryItemIndex.objects.exists()
+
+def search_item_ids(query, limit=MAX_RESULTS):
+    """
+    Returns CMS InventoryItem ids matching all words in query, best match first
+    Each word is matched as a substring of the indexed document (pg_trgm GIN index);
+    ranked by trigram similarity of the query to product name, alias or generic name
+    """
+    words = query.lower().split()
+    if not words:
+        return []
+    object_list = InventoryItemIndex.objects.all()
+    for word in words:
+        object_list = object_list.filter(document__contains=word)
+    object_list = object_list.annotate(rank=Greatest(
+        TrigramSimilarity('product_name', query),
+        TrigramSimilarity('alias', query),
+        TrigramSimilarity('generic_name', query),
+    )).order_by('-rank', 'product_name')
+    return list(object_list.values_list('cmsid', flat=True)[:limit])
+
+def search_phrase_ids(phrase, limit=MAX_RESULTS):
+    """Returns CMS InventoryItem ids whose indexed document contains phrase as a whole"""
+    object_list = InventoryItemIndex.objects.filter(document__contains=phrase.lower()).order_by('product_name')
+    return list(object_list.values_list('cmsid', flat=True)[:limit])
+
+def items_by_rank(cmsids):
+    """InventoryItem queryset for cmsids, ordered as given"""
+    rank = Case(
+        *[When(id=cmsid, then=position) for (position, cmsid) in enumerate(cmsids)],
+        output_field=IntegerField(),
+    )
+    return InventoryItem.objects.filter(id__in=cmsids).annotate(search_rank=rank)
+
+def search_items(*queries, ingredient=None, limit=MAX_RESULTS):
+    """
+    Search CMS InventoryItem by alias, product/generic/label names (incl. Chinese),
+    ingredient, registration and clinic drug no.; items matching any of queries,
+    or containing ingredient (e.g. an ingredient list) as a whole
+    Returns InventoryItem queryset annotated with search_rank (0 = best match) for
+    ordering; falls back to icontains on the CMS table if the index is not available
+    """
+    global _fallback_warned
+    queries = [query for query in queries if query]
+    if not queries and not ingredient:
+        return InventoryItem.objects.none()
+    if not index_available():
+        if not _fallback_warned:
+            logger.warning("InventoryItemIndex not available, searching CMS table (manage.py update_item_index)")
+            _fallback_warned = True
+        match_query = Q(ingredient__icontains=ingredient) if ingredient else Q()
+        for query in queries:
+            match_query |= (
+                Q(alias__icontains=query) |
+                Q(product_name__icontains=query) |
+                Q(product_name_chinese__icontains=query) |
+                Q(generic_name__icontains=query) |
+                Q(generic_name_chinese__icontains=query) |
+                Q(ingredient__icontains=query) |
+                Q(registration_no__icontains=query)
+            )
+        return InventoryItem.objects.filter(match_query).annotate(search_rank=Case(
+            When(product_name__istartswith=(queries or [ingredient])[0], then=0),
+            default=1,
+            output_field=IntegerField(),
+        ))
+    cmsids = []
+    seen = set()
+    matches = [search_item_ids(query, limit) for query in queries]
+    if ingredient:
+        matches.append(search_phrase_ids(ingredient, limit))
+    for match in matches:
+        for cmsid in match:
+            if cmsid not in seen:
+                seen.add(cmsid)
+                cmsids.append(cmsid)
+    return items_by_rank(cmsids[:limit])
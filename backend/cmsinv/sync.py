@@ -0,0 +1,279 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from cmssys.audit import AuditWriter, audit_class_name, serialize, snapshot
+from .models import (
+    InventoryItem,
+    Supplier,
+    Delivery,
+    ReceivedItem,
+    InventoryMovementLog,
+)
+
+CMS_DB = 'cms_db'
+
+
+class DeliverySync:
+    """
+    Syncs an inventory.DeliveryOrder into the CMS database
+
+    All CMS items referenced by the delivery order are prefetched with a single
+    in_bulk() query (for preview()); run() reads them again with SELECT ... FOR UPDATE
+    inside one cms_db transaction, so stock_qty is incremented from its current
+    value and concurrent CMS writes to the items wait for the commit. Changes are
+    computed in memory, then written with bulk_create/bulk_update:
+    - supplier_manufacturer / delivery (get or create)
+    - received_item
+    - inventory_item (stock_qty, costs, active and clinic drug list status)
+    - inventory_movement_log
+    - audit_log
+    Lines already received under the same CMS delivery are not posted again.
+    """
+    CMS_USERNAME = 'cmsman'
+    ADDED = 'added'
+    EXISTING = 'existing'
+    MISSING = 'missing'
+    WRITE_STEPS = 4  # received items, inventory items, movement log, audit log and commit
+
+    def __init__(self, delivery_obj, cmsuser_obj, session_id=None, uri=None):
+        self.delivery_obj = delivery_obj
+        self.cmsuser_obj = cmsuser_obj
+        self.actor = cmsuser_obj.username
+        self.session_id = session_id
+        self.uri = uri
+        self.lines = list(delivery_obj.delivery_items.select_related('item').order_by('id'))
+        self.cms_lines = [listitem for listitem in self.lines if listitem.item.cmsid]
+        self.cmsitems = InventoryItem.objects.using(CMS_DB).in_bulk(
+            {listitem.item.cmsid for listitem in self.cms_lines}
+        )
+
+    def _lock_items(self):
+        """Returns CMS items of the delivery order, read with SELECT ... FOR UPDATE (in id order)"""
+        return InventoryItem.objects.using(CMS_DB).select_for_update().order_by('id').in_bulk(
+            {listitem.item.cmsid for listitem in self.cms_lines}
+        )
+
+    @staticmethod
+    def _lot_no(listitem):
+        return listitem.batch_num or ""
+
+    @staticmethod
+    def _received_key(drug_item_id, quantity, cost, lot_no=None):
+        return (drug_item_id, round(float(quantity), 2), round(float(cost), 2), lot_no)
+
+    def preview(self):
+        """
+        Returns summary of changes to be applied for each CMS item in the delivery order
+        """
+        existing = {}
+        received_qs = ReceivedItem.objects.using(CMS_DB).filter(
+            arrive_date=self.delivery_obj.invoice_date,
+            drug_item_id__in=self.cmsitems.keys(),
+        )
+        for received in received_qs:
+            existing[self._received_key(received.drug_item_id, received.quantity, received.cost)] = received
+
+        itemupdate_list = []
+        for listitem in self.cms_lines:
+            cmsitem_obj = self.cmsitems.get(listitem.item.cmsid)
+            if cmsitem_obj is None:
+                print(f"Warning: CMS item #{listitem.item.cmsid} for {listitem.item.name} not found")
+                continue
+            key = self._received_key(cmsitem_obj.id, listitem.items_quantity, listitem.total_price)
+            itemupdate_list.append({
+                'name': listitem.item.name,
+                'cmsid': listitem.item.cmsid,
+                'discontinue': cmsitem_obj.discontinue,
+                'existing_qty': cmsitem_obj.stock_qty,
+                'old_standard_cost': cmsitem_obj.standard_cost,
+                'old_avg_cost': cmsitem_obj.avg_cost,
+                'items_quantity': listitem.items_quantity,
+                'new_standard_cost': listitem.standard_cost,
+                'new_avg_cost': listitem.average_cost,
+                'existing': existing.get(key),
+            })
+        return itemupdate_list
+
+    def _get_or_create_supplier(self, audit):
+        vendor = self.delivery_obj.vendor
+        new_supplier_data = {
+            'address': vendor.address,
+            'name': vendor.name.upper(),
+            'supp_type': 'Supplier',
+            'updated_by': self.actor,
+        }
+        supplier_obj, created = Supplier.objects.db_manager(CMS_DB).get_or_create(
+            name__iexact=vendor.name.upper(),
+            defaults=new_supplier_data,
+        )
+        if created:
+            print(f"New supplier added: ({supplier_obj.name})")
+            audit.insert(supplier_obj)
+        return supplier_obj
+
+    def _get_or_create_delivery(self, supplier_obj, audit):
+        new_cmsdelivery_data = {
+            'cash_amount': 0,  # payment tracking not via CMS
+            'total_cost': self.delivery_obj.items_total,
+            'create_date': self.delivery_obj.invoice_date,
+            'received_by': self.cmsuser_obj,
+            'supplierdn': self.delivery_obj.invoice_no,
+            'delivery_note_no': self.delivery_obj.id,
+            'updated_by': self.actor,
+            'supplier': supplier_obj,
+        }
+        cmsdelivery_obj, created = Delivery.objects.db_manager(CMS_DB).get_or_create(
+            delivery_note_no=self.delivery_obj.id,
+            defaults=new_cmsdelivery_data,
+        )
+        if created:
+            print(f"New delivery added: id #{cmsdelivery_obj.id}")
+            audit.insert(cmsdelivery_obj)
+        else:
+            print(f"Delivery order already synced to CMS as delivery #{cmsdelivery_obj.id}")
+        return cmsdelivery_obj
+
+    def _assign_clinic_drug_nos(self, cmsitem_list):
+        """Assign and write block of reserved clinic drug no. to items without one"""
+        if not cmsitem_list:
+            return
+        InventoryItem.assignClinicDrugNos(cmsitem_list, using=CMS_DB)
+        for cmsitem_obj in cmsitem_list:
+            print(f"Generated and added new: {cmsitem_obj.clinic_drug_no}")
+
+    @property
+    def total_steps(self):
+        """Progress steps of run(): one per CMS line, then one per write phase"""
+        return len(self.cms_lines) + self.WRITE_STEPS
+
+    def run(self, update_quantities=True, progress=None):
+        """
+        Writes delivery order to CMS; returns list of per-line results
+        progress: optional callable(processed, total) of steps (see total_steps), called
+        as each line is processed and after each write; the last step after the commit
+        """
+        total_steps = self.total_steps
+
+        def report(step):
+            if progress:
+                progress(step, total_steps)
+
+        results = []
+        if not self.cms_lines:
+            self.delivery_obj.cms_synced = True
+            self.delivery_obj.save()
+            return results
+
+        cms_now = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
+        with AuditWriter(self.actor, session_id=self.session_id, uri=self.uri, using=CMS_DB) as audit:
+            self.cmsitems = self._lock_items()
+            supplier_obj = self._get_or_create_supplier(audit)
+            cmsdelivery_obj = self._get_or_create_delivery(supplier_obj, audit)
+
+            # Lines already received under this CMS delivery are not posted again
+            received_keys = set()
+            for received in ReceivedItem.objects.using(CMS_DB).filter(delivery=cmsdelivery_obj):
+                received_keys.add(self._received_key(
+                    received.drug_item_id, received.quantity, received.cost, received.lot_no))
+
+            new_received = []
+            new_movements = []
+            old_values = {}  # InventoryItem.id => snapshot before sync
+            for item_idx, listitem in enumerate(self.cms_lines):
+                report(item_idx)
+                result = {
+                    'name': listitem.item.name,
+                    'cmsid': listitem.item.cmsid,
+                    'quantity': float(listitem.items_quantity),
+                }
+                results.append(result)
+                cmsitem_obj = self.cmsitems.get(listitem.item.cmsid)
+                if cmsitem_obj is None:
+                    print(f"Skipping item {listitem.item.name} - CMS item #{listitem.item.cmsid} not found")
+                    result['status'] = self.MISSING
+                    continue
+                lot_no = self._lot_no(listitem)
+                key = self._received_key(cmsitem_obj.id, listitem.items_quantity, listitem.total_price, lot_no)
+                if key in received_keys:
+                    print(f"Already existing: {listitem.item.name}")
+                    result['status'] = self.EXISTING
+                    continue
+                received_keys.add(key)
+
+                new_received.append(ReceivedItem(
+                    arrive_date=self.delivery_obj.invoice_date,
+                    cost=listitem.total_price,
+                    dangerous_sign=cmsitem_obj.dangerous_sign,
+                    delivery=cmsdelivery_obj,
+                    drug_item=cmsitem_obj,
+                    expire_date=listitem.expiry_date,
+                    lot_no=lot_no,
+                    quantity=listitem.items_quantity,
+                    unit=listitem.items_unit,
+                    received_items_idx=item_idx,
+                    remarks=listitem.terms,
+                ))
+
+                # Update InventoryItem quantity/costs in memory
+                if cmsitem_obj.id not in old_values:
+                    old_values[cmsitem_obj.id] = snapshot(cmsitem_obj)
+                if update_quantities:
+                    cmsitem_obj.stock_qty += float(listitem.items_quantity)
+                if listitem.standard_cost != 0:
+                    cmsitem_obj.standard_cost = float(listitem.standard_cost)
+                if listitem.average_cost != 0:
+                    cmsitem_obj.avg_cost = float(listitem.average_cost)
+                cmsitem_obj.discontinue = False
+                cmsitem_obj.is_clinic_drug_list = True
+
+                new_movements.append(InventoryMovementLog(
+                    lot_no=listitem.batch_num,
+                    move_item=listitem.item.name,
+                    quantity=listitem.items_quantity,
+                    movement_type=InventoryMovementLog.DELIVERY,
+                    updated_by=self.actor,
+                    reference_no=cmsdelivery_obj.id,
+                    date_created=cms_now,
+                    last_updated=cms_now,
+                ))
+                result['status'] = self.ADDED
+
+            changed_items = [self.cmsitems[cmsid] for cmsid in old_values]
+            self._assign_clinic_drug_nos([
+                cmsitem_obj for cmsitem_obj in changed_items if not cmsitem_obj.clinic_drug_no
+            ])
+            for cmsitem_obj in changed_items:
+                cmsitem_obj.updated_by = self.actor
+                cmsitem_obj.last_updated = cms_now
+                cmsitem_obj.version += 1
+                audit.update(cmsitem_obj, old_values[cmsitem_obj.id])
+            for movement in new_movements:
+                # bulk_create on MySQL does not return ids; reference delivery as before
+                audit.log(
+                    audit_class_name(InventoryMovementLog), 'INSERT', cmsdelivery_obj.id,
+                    new_value=serialize(movement),
+                )
+
+            step = len(self.cms_lines)
+            ReceivedItem.objects.using(CMS_DB).bulk_create(new_received)
+            step += 1
+            report(step)
+            if changed_items:
+                InventoryItem.objects.using(CMS_DB).bulk_update(changed_items, [
+                    'stock_qty', 'standard_cost', 'avg_cost', 'discontinue', 'is_clinic_drug_list',
+                    'clinic_drug_no', 'updated_by', 'last_updated', 'version',
+                ])
+            step += 1
+            report(step)
+            InventoryMovementLog.objects.using(CMS_DB).bulk_create(new_movements)
+            step += 1
+            report(step)
+
+        # audit log entries are written as the transaction commits
+        report(total_steps)
+        print(f"Synced delivery order #{self.delivery_obj.id}: {len(new_received)} received, "
+              f"{len(changed_items)} items updated")
+        self.delivery_obj.cms_delivery_id = cmsdelivery_obj.id
+        self.delivery_obj.cms_synced = True
+        self.delivery_obj.save()
+        return results
@@ -1,3 +1,17 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from .projection import days_of_stock
 
-# Create your tests here.
+
+class DaysOfStockTest(SimpleTestCase):
+    """cmsinv.projection.days_of_stock"""
+    def test_days(self):
+        self.assertEqual(days_of_stock(30, 1.5), 20)
+        self.assertEqual(days_of_stock(0, 2), 0)
+
+    def test_no_usage(self):
+        self.assertIsNone(days_of_stock(30, 0))
+        self.assertIsNone(days_of_stock(30, -1))
+
+    def test_missing_or_negative_stock(self):
+        self.assertEqual(days_of_stock(None, 2), 0)
+        self.assertEqual(days_of_stock(-5, 2), 0)
@@ -1,15 +1,12 @@
 
 from django.utils import timezone
-from datetime import datetime, timedelta
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
 from django.urls import reverse, reverse_lazy, resolve, Resolver404
 from django.shortcuts import redirect, render, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect
-from django.forms.models import model_to_dict
-from django.db.models import Q
-from django.conf import settings
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.db.models import F, Q
 from drugdb.models import (
     RegisteredDrug,
     Company,
@@ -18,20 +15,21 @@ from inventory.models import (
     Vendor,
     DeliveryOrder,
     DeliveryItem,
+    DeliverySyncJob,
     Item, ItemType,
 )
-from cmssys.models import (
-    CmsUser,
-    AuditLog,
-)
+from cmssys.models import CmsUser
+from cmssys.audit import AuditWriter, snapshot
+from cmssys.pagination import KeysetPaginationMixin
+from cmssys.archive import ArchiveListMixin
 from .models import (
     InventoryItem,
     InventoryItemType,
     Supplier,
     InventoryMovementLog,
-    Delivery,
-    ReceivedItem,
+    InventoryMovementLogArchive,
     Depletion,
+    ItemProjection,
 )
 
 from .forms import (
@@ -42,6 +40,10 @@ from .forms import (
     SupplierQuickEditModalForm,
     # NewDeliveryFromDeliveryOrderModalForm,
 )
+from .sync import DeliverySync
+from .search import search_items
+from .projection import days_remaining_by_id
+from .search import MAX_RESULTS as MAX_SEARCH_RESULTS
 
 from bootstrap_modal_forms.generic import BSModalReadView, BSModalUpdateView, BSModalCreateView
 
@@ -59,22 +61,22 @@ class InventoryItemList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
     paginate_by = 20
     last_query = ''
     last_query_count = 0
+    projected = False  # list of ItemProjection rows, see paginate_queryset()
 
     def get_queryset(self):
         query = self.request.GET.get('q')
         self.invtype = self.request.GET.get('invtype') or '0'
         self.status = self.request.GET.get('status') or ''
         self.dd = self.request.GET.get('dd') or 'any'
+        self.days = self.request.GET.get('days') or ''
+        if not self.days.isdigit():
+            self.days = ''
+        self.sort = self.request.GET.get('sort') or ''
+        if self.days or self.sort == 'days':
+            return self.get_projected_queryset(query)
         if query:
             self.last_query = query
-            object_list = InventoryItem.objects.filter(
-                Q(registration_no__icontains=query) |
-                Q(product_name__icontains=query) |
-                # Q(generic_name__icontains=query) |
-                Q(alias__icontains=query) |
-                # Q(clinic_drug_no__icontains=query) |
-                Q(ingredient__icontains=query)
-            ).order_by('discontinue')
+            object_list = search_items(query).order_by('discontinue', 'search_rank')
         else:
             self.last_query = ''
             object_list = InventoryItem.objects.all().order_by('discontinue')
@@ -93,6 +95,60 @@ class InventoryItemList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         self.last_query_count = object_list.count
         return object_list
 
+    def get_projected_queryset(self, query):
+        """
+        Filters and sorts by days of stock remaining in SQL on the local ItemProjection
+        (same filters on its copy of the item columns); pages are read from CMS
+        """
+        self.projected = True
+        object_list = ItemProjection.objects.all()
+        if query:
+            self.last_query = query
+            object_list = object_list.filter(cmsid__in=list(
+                search_items(query).values_list('id', flat=True)[:MAX_SEARCH_RESULTS]
+            ))
+        else:
+            self.last_query = ''
+        if self.status == '1':
+            object_list = object_list.filter(discontinue=False)
+        elif self.status == '0':
+            object_list = object_list.filter(discontinue=True)
+        if self.invtype =='1':
+            object_list = object_list.filter(inventory_type='Drug')
+        elif self.invtype == '2':
+            object_list = object_list.filter(inventory_type='Supplement')
+        if self.dd == '1':
+            object_list = object_list.filter(dangerous_sign=True)
+        elif self.dd == '0':
+            object_list = object_list.filter(dangerous_sign=False)
+        if self.days:
+            object_list = object_list.filter(days_remaining__lte=int(self.days))
+        self.last_query_count = object_list.count
+        if self.sort == 'days':
+            # items without usage last
+            return object_list.order_by(F('days_remaining').asc(nulls_last=True), 'cmsid')
+        return object_list.order_by('discontinue', 'cmsid')
+
+    def paginate_queryset(self, queryset, page_size):
+        """Page of CMS items with days_remaining (of ItemProjection rows if projected)"""
+        (paginator, page, object_list, is_paginated) = super().paginate_queryset(queryset, page_size)
+        if self.projected:
+            projections = list(object_list)
+            cmsitems = InventoryItem.objects.in_bulk([projection.cmsid for projection in projections])
+            object_list = []
+            for projection in projections:
+                cmsitem = cmsitems.get(projection.cmsid)
+                if cmsitem is not None:
+                    cmsitem.days_remaining = projection.days_remaining
+                    object_list.append(cmsitem)
+        else:
+            object_list = list(object_list)
+            days_by_id = days_remaining_by_id([cmsitem.id for cmsitem in object_list])
+            for cmsitem in object_list:
+                cmsitem.days_remaining = days_by_id.get(cmsitem.id)
+        page.object_list = object_list
+        return (paginator, page, object_list, is_paginated)
+
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         data['last_query'] = self.last_query
@@ -100,6 +156,8 @@ class InventoryItemList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         data['invtype'] = self.invtype
         data['status'] = self.status
         data['dd'] = self.dd
+        data['days'] = self.days
+        data['sort'] = self.sort
         return data
 
 class InventoryItemDetail(DetailView, LoginRequiredMixin, PermissionRequiredMixin):
@@ -214,6 +272,7 @@ class InventoryItemQuickEditModal(BSModalUpdateView, LoginRequiredMixin, Permiss
     """Simple Edit of InventoryItem key fields"""
     permission_required = ('cmsinv.change_inventoryitem')
     model = InventoryItem
+    queryset = InventoryItem.objects.using('cms_db')  # edit live CMS row, not mirror
     template_name = 'cmsinv/inventoryitem_quickedit_modal.html'
     form_class = InventoryItemQuickEditModalForm
     item_obj = None
@@ -221,6 +280,7 @@ class InventoryItemQuickEditModal(BSModalUpdateView, LoginRequiredMixin, Permiss
     match_drug_list = None
     set_match_drug = False
     next_url = ''
+    old_values = None
 
     def dispatch(self, request, *args, **kwargs):
         if 'pk' in kwargs:
@@ -249,6 +309,11 @@ class InventoryItemQuickEditModal(BSModalUpdateView, LoginRequiredMixin, Permiss
                 self.match_drug_list = RegisteredDrug.objects.filter(Q(name__icontains=keyword))
         return super().dispatch(request, *args, **kwargs)
 
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        self.old_values = snapshot(obj)  # For audit log of changed fields
+        return obj
+
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         
@@ -277,7 +342,12 @@ class InventoryItemQuickEditModal(BSModalUpdateView, LoginRequiredMixin, Permiss
         form.instance.updated_by = self.request.user.username
         form.instance.last_updated = timezone.now()
         form.instance.version = self.object.version + 1
-        response = super().form_valid(form)
+        with AuditWriter(
+            self.request.user.username, session_id=self.request.session.session_key, uri=self.request.path
+        ) as audit:
+            response = super().form_valid(form)
+            if not self.request.is_ajax():  # Ajax request only validates modal form, nothing saved
+                audit.update(self.object, self.old_values)
 
         # Update corresponding inventory.Item
         drug_obj = None
@@ -322,9 +392,16 @@ class InventoryItemUpdate(UpdateView, LoginRequiredMixin, PermissionRequiredMixi
     """Update Inventory Item details"""
     permission_required = ('cmsinv.change_inventoryitem')
     model = InventoryItem
+    queryset = InventoryItem.objects.using('cms_db')  # edit live CMS row, not mirror
     form_class = InventoryItemUpdateForm
     template_name = 'cmsinv/inventory_item_update.html'
     drug_obj = None
+    old_values = None
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        self.old_values = snapshot(obj)  # For audit log of changed fields
+        return obj
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
@@ -343,7 +420,11 @@ class InventoryItemUpdate(UpdateView, LoginRequiredMixin, PermissionRequiredMixi
         form.instance.updated_by = self.request.user.username
         form.instance.last_updated = timezone.now()
         form.instance.version = self.object.version + 1
-        response = super().form_valid(form)
+        with AuditWriter(
+            self.request.user.username, session_id=self.request.session.session_key, uri=self.request.path
+        ) as audit:
+            response = super().form_valid(form)
+            audit.update(self.object, self.old_values)
 
         # Update corresponding inventory.Item and drugdb.RegisteredDrug
         drug_obj = None
@@ -440,120 +521,49 @@ class NewInventoryItem(CreateView, LoginRequiredMixin, PermissionRequiredMixin):
         form.instance.inventory_item_type = InventoryItemType.objects.get(id=1)
         session_id = self.request.session.session_key
 
-        if self.regdrug_obj:  # Assign cert_holder if RegisteredDrug
-            cert_holder_data = {
-                'name': self.regdrug_obj.company.name,
-                'address': self.regdrug_obj.company.address,
-                'supp_type': 'Certificate Holder',
-                'date_created': timezone.now(),
-                'last_updated': timezone.now(),
-                'updated_by': user,
-            }
-            cert_holder_obj, created = Supplier.objects.get_or_create(
-                name=self.regdrug_obj.company.name.upper(),
-                defaults=cert_holder_data,
-                )
-            if created: # Update AuditLog
-                print(f"Cert Holder created: {cert_holder_obj}")
-
-                audit_str_dict = {**cert_holder_data,
-                    'dateCreated': datetime.strftime(cert_holder_obj.date_created, "%a %b %d %H:%M:%S %Z %Y"),
-                    'lastUpdated': datetime.strftime(cert_holder_obj.last_updated, "%a %b %d %H:%M:%S %Z %Y"),
-                    'type': 'Supplier',
+        with AuditWriter(user, session_id=session_id, uri=uri) as audit:
+            if self.regdrug_obj:  # Assign cert_holder if RegisteredDrug
+                cert_holder_data = {
+                    'name': self.regdrug_obj.company.name,
+                    'address': self.regdrug_obj.company.address,
+                    'supp_type': 'Certificate Holder',
+                    'date_created': timezone.now(),
+                    'last_updated': timezone.now(),
+                    'updated_by': user,
                 }
-                sorted_dict = dict(sorted(audit_str_dict.items()))
-                audit_str = "||".join([
-                    ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-                ])
-                
-                newAuditLogEntry = AuditLog(
-                    actor = user,
-                    class_name = 'SupplierManufacturer',
-                    event_name = 'INSERT',
-                    old_value = None,
-                    new_value = audit_str,
-                    persisted_object_version = 'null',
-                    persisted_object_id = cert_holder_obj.id,
-                    session_id = session_id,
-                    uri = uri,
-                )
-                newAuditLogEntry.save()
-                if newAuditLogEntry.id:
-                    print(f"New audit log entry added: {audit_str}")
-                else:
-                    print("Error writing audit log entry")
-            form.instance.certificate_holder = cert_holder_obj
-            form.instance.registration_no = self.regdrug_obj.reg_no
-
-        elif self.vendor_obj:  # Assign vendor if given
-            new_supplier_data = {
-                'name': self.vendor_obj.name,
-                'address': self.vendor_obj.address,
-                'supp_type': 'Supplier',
-                'date_created': timezone.now(),
-                'last_updated': timezone.now(),
-                'updated_by': user,
-            }
-            supplier_obj, created = Supplier.objects.get_or_create(
-                name=self.vendor_obj.name.upper(),
-                defaults=new_supplier_data,
-            )
-            if created: # Update AuditLog
-                print(f"New supplier added: ({supplier_obj.name})")
-
-                audit_str_dict = {**new_supplier_data,
-                    'dateCreated': datetime.strftime(supplier_obj.date_created, "%a %b %d %H:%M:%S %Z %Y"),
-                    'lastUpdated': datetime.strftime(supplier_obj.last_updated, "%a %b %d %H:%M:%S %Z %Y"),
-                    'type': 'Supplier',
+                cert_holder_obj, created = Supplier.objects.get_or_create(
+                    name=self.regdrug_obj.company.name.upper(),
+                    defaults=cert_holder_data,
+                    )
+                if created:
+                    print(f"Cert Holder created: {cert_holder_obj}")
+                    audit.insert(cert_holder_obj)
+                form.instance.certificate_holder = cert_holder_obj
+                form.instance.registration_no = self.regdrug_obj.reg_no
+
+            elif self.vendor_obj:  # Assign vendor if given
+                new_supplier_data = {
+                    'name': self.vendor_obj.name,
+                    'address': self.vendor_obj.address,
+                    'supp_type': 'Supplier',
+                    'date_created': timezone.now(),
+                    'last_updated': timezone.now(),
+                    'updated_by': user,
                 }
-                sorted_dict = dict(sorted(audit_str_dict.items()))
-                audit_str = "||".join([
-                    ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-                ])
-                
-                newAuditLogEntry = AuditLog(
-                    actor = user,
-                    class_name = 'SupplierManufacturer',
-                    event_name = 'INSERT',
-                    old_value = None,
-                    new_value = audit_str,
-                    persisted_object_version = 'null',
-                    persisted_object_id = supplier_obj.id,
-                    session_id = session_id,
-                    uri = uri,
+                supplier_obj, created = Supplier.objects.get_or_create(
+                    name=self.vendor_obj.name.upper(),
+                    defaults=new_supplier_data,
                 )
-                newAuditLogEntry.save()
-                if newAuditLogEntry.id:
-                    print(f"New audit log entry added: {audit_str}")
-                else:
-                    print("Error writing audit log entry")
-            form.instance.certificate_holder = supplier_obj
-        
-        # Submit form 
-        response = super().form_valid(form)
+                if created:
+                    print(f"New supplier added: ({supplier_obj.name})")
+                    audit.insert(supplier_obj)
+                form.instance.certificate_holder = supplier_obj
 
-        # Successful save => Update AuditLog for InventoryItem
-        audit_str_dict = model_to_dict(self.object)
-        sorted_dict = dict(sorted(audit_str_dict.items()))
-        audit_str = "||".join([
-            ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-        ])
-        newAuditLogEntry = AuditLog(
-            actor = user,
-            class_name = 'InventoryItem',
-            event_name = 'INSERT',
-            old_value = None,
-            new_value = audit_str,
-            persisted_object_version = 'null',
-            persisted_object_id = self.object.id,
-            session_id = session_id,
-            uri = uri,
-        )
-        newAuditLogEntry.save()
-        if newAuditLogEntry.id:
-            print(f"New audit log entry added: {audit_str}")
-        else:
-            print("Error writing audit log entry")
+            # Submit form 
+            response = super().form_valid(form)
+
+            # Successful save => Update AuditLog for InventoryItem
+            audit.insert(self.object)
 
         # Create new corresponding inventory.Item if not existing
         if self.object.registration_no:
@@ -641,11 +651,18 @@ class SupplierQuickEditModal(BSModalUpdateView, LoginRequiredMixin, PermissionRe
     """Quick Edit Modal for Supplier Details"""
     permission_required = ('cmsinv.change_supplier',)
     model = Supplier
+    queryset = Supplier.objects.using('cms_db')  # edit live CMS row, not mirror
     template_name = 'cmsinv/supplier_quickedit_modal.html'
     context_object_name = 'supplier_obj'
     form_class = SupplierQuickEditModalForm
     company_obj_list = None
     vendor_obj_list = None
+    old_values = None
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        self.old_values = snapshot(obj)  # For audit log of changed fields
+        return obj
    
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
@@ -675,12 +692,21 @@ class SupplierQuickEditModal(BSModalUpdateView, LoginRequiredMixin, PermissionRe
             })
         return kwargs
 
+    def form_valid(self, form):
+        with AuditWriter(
+            self.request.user.username, session_id=self.request.session.session_key, uri=self.request.path
+        ) as audit:
+            response = super().form_valid(form)
+            if not self.request.is_ajax():  # Ajax request only validates modal form, nothing saved
+                audit.update(self.object, self.old_values)
+        return response
+
     def get_success_url(self):
         return reverse('cmsinv:SupplierList')
 
-class InventoryMovementLogList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
+class InventoryMovementLogList(ArchiveListMixin, KeysetPaginationMixin, ListView, LoginRequiredMixin, PermissionRequiredMixin):
     """
-    Displays InventoryMovementLog
+    Displays InventoryMovementLog, with archived entries if the date filter reaches back
     """
     DELIVERY = '1'
     DISPENSARY = '2'
@@ -695,6 +721,7 @@ class InventoryMovementLogList(ListView, LoginRequiredMixin, PermissionRequiredM
     permission_required = ('cmsinv.view_inventorymovementlog',)
     template_name = 'cmsinv/inventory_movement_log.html'
     model = InventoryMovementLog
+    archive_model = InventoryMovementLogArchive
     context_object_name = 'cmsinv_move_log'
     paginate_by = 20
     last_query = ''
@@ -704,28 +731,22 @@ class InventoryMovementLogList(ListView, LoginRequiredMixin, PermissionRequiredM
         self.begin = self.request.GET.get('begin') or ''
         self.end = self.request.GET.get('end') or ''
         self.disp_type = self.request.GET.get('t') or ''
+        self.last_query = self.request.GET.get('q') or ''
+        object_list = self.filter_history(InventoryMovementLog.objects.all())
+        self.last_query_count = object_list.count
+        return object_list
+
+    def filter_history(self, object_list):
+        """Type, search and date filters of the log (or its archive)"""
         if self.disp_type:
             move_type = dict(self.MOVEMENT_TYPE_CHOICES).get(self.disp_type)
-            print(move_type)
-            object_list = InventoryMovementLog.objects.filter(movement_type=move_type).order_by('-last_updated')
-        else:
-            object_list = InventoryMovementLog.objects.all().order_by('-last_updated')
-        query = self.request.GET.get('q')
-        if query:
-            self.last_query = query
+            object_list = object_list.filter(movement_type=move_type)
+        if self.last_query:
             object_list = object_list.filter(
-                Q(move_item__icontains=query)
+                Q(move_item__icontains=self.last_query)
             )
-            self.last_query_count = object_list.count
-        else:
-            self.last_query = ''
-            object_list = object_list.order_by('-last_updated')
-            self.last_query_count = object_list.count
-        if self.begin:
-            object_list = object_list.filter(received_date__gte=self.begin)
-        if self.end:
-            object_list = object_list.filter(received_date__lte=self.end)
-        return object_list
+        object_list = object_list.filter(InventoryMovementLog.local_range_q('date_created', self.begin, self.end))
+        return object_list.order_by('-last_updated')
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
@@ -737,9 +758,6 @@ class InventoryMovementLogList(ListView, LoginRequiredMixin, PermissionRequiredM
         return data
 
 
-def underscore_to_camel(word):
-    return word.split('_')[0] + ''.join(x.capitalize() or '_' for x in word.split('_')[1:])
-
 @login_required
 @permission_required('cmsinv.change_inventoryitem', 'inventory.add_deliveryorder',)
 def NewDeliveryFromDeliveryOrderModalView(request, *args, **kwargs):
@@ -749,380 +767,43 @@ def NewDeliveryFromDeliveryOrderModalView(request, *args, **kwargs):
         print("Error: no delivery_id")
     uri = request.GET.get('next', reverse('inventory:DeliveryOrderDetail', args=(delivery_obj.id,)))
     session_id = request.session.session_key
-    # Get cmsuser id
-    cmsuser_obj = CmsUser.objects.get(username='cmsman')
-    itemupdate_list = []
-    for listitem in delivery_obj.delivery_items.all():
-        if listitem.item.cmsid:
-            cmsitem_obj = InventoryItem.objects.get(id=listitem.item.cmsid)
-            try:
-                cmsreceived_obj = ReceivedItem.objects.get(
-                        arrive_date=delivery_obj.invoice_date,
-                        drug_item=cmsitem_obj,
-                        quantity=listitem.items_quantity,
-                        cost=listitem.total_price,
-                        )
-            except ReceivedItem.DoesNotExist:
-                cmsreceived_obj = None
-            summary = {
-                'name': listitem.item.name,
-                'cmsid': listitem.item.cmsid,
-                'discontinue': cmsitem_obj.discontinue,
-                'existing_qty': cmsitem_obj.stock_qty,
-                'old_standard_cost': cmsitem_obj.standard_cost,
-                'old_avg_cost': cmsitem_obj.avg_cost,
-                'items_quantity': listitem.items_quantity,
-                'new_standard_cost': listitem.standard_cost,
-                'new_avg_cost': listitem.average_cost,
-                'existing': cmsreceived_obj,
-            }
-            itemupdate_list.append(summary)
 
+    # If POST request confirm sync, queue job to add data to CMS (see manage.py run_sync_jobs)
+    if request.method == "POST":
+        doUpdateQuantities = request.POST.get("updateQuantities") == '1'
+        job = DeliverySyncJob.enqueue(
+            delivery_obj,
+            update_quantities=doUpdateQuantities,
+            session_id=session_id,
+            uri=uri,
+            requested_by=request.user.username,
+        )
+        if job.status == DeliverySyncJob.DONE:
+            # Completed jobs are not run again
+            if request.is_ajax():
+                return JsonResponse({
+                    'job_id': job.id,
+                    'status': job.status,
+                    'error': f"Delivery order already synced to CMS (job #{job.id})",
+                }, status=409)
+            return redirect(uri)
+        if request.is_ajax():
+            return JsonResponse({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': reverse('inventory:DeliverySyncJobStatus', args=(job.id,)),
+            })
+        return redirect(uri)
+
+    # Get cmsuser id
+    cmsuser_obj = CmsUser.objects.get(username=DeliverySync.CMS_USERNAME)
+    delivery_sync = DeliverySync(delivery_obj, cmsuser_obj, session_id=session_id, uri=uri)
+    itemupdate_list = delivery_sync.preview()
     context = {
         'delivery_obj': delivery_obj,
         'itemupdate_list': itemupdate_list,
         'itemupdate_count': len(itemupdate_list),
     }
-    # If POST request confirm sync, add data to CMS
-    if request.method == "POST":
-        doUpdateQuantities = request.POST.get("updateQuantities") == '1'
-
-        if len(itemupdate_list) == 0:
-            # Set delivery order status to cms_synced
-            delivery_obj.cms_synced = True
-            delivery_obj.save()
-        else:
-            # Get or create CMS supplier based on vendor name
-            new_supplier_data = {
-                'address': delivery_obj.vendor.address,
-                'name': delivery_obj.vendor.name.upper(),
-                'supp_type': 'Supplier',
-                'updated_by': cmsuser_obj.username,
-            }
-            supplier_obj, supplier_created = Supplier.objects.get_or_create(
-                name__iexact=delivery_obj.vendor.name.upper(), 
-                defaults=new_supplier_data
-            )
-            if supplier_created:  # Update AuditLog
-                print(f"New supplier added: ({supplier_obj.name})")
-
-                audit_str_dict = {**new_supplier_data,
-                    'dateCreated': datetime.strftime(supplier_obj.date_created, "%a %b %d %H:%M:%S %Y"),
-                    'lastUpdated': datetime.strftime(supplier_obj.last_updated, "%a %b %d %H:%M:%S %Y"),
-                    'type': 'Supplier',
-                }
-                sorted_dict = dict(sorted(audit_str_dict.items()))
-                audit_str = "||".join([
-                    ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-                ])
-                
-                newAuditLogEntry = AuditLog(
-                    actor = cmsuser_obj.username,
-                    class_name = 'SupplierManufacturer',
-                    event_name = 'INSERT',
-                    old_value = None,
-                    new_value = audit_str,
-                    persisted_object_version = 'null',
-                    persisted_object_id = supplier_obj.id,
-                    session_id = session_id,
-                    uri = uri,
-                )
-                newAuditLogEntry.save()
-                if newAuditLogEntry.id:
-                    print(f"New audit log entry added: {audit_str}")
-                else:
-                    print("Error writing audit log entry")
-            
-            # Get or create CMS delivery record
-            new_cmsdelivery_data = {
-                'cash_amount': 0,  # payment tracking not via CMS
-                'total_cost': delivery_obj.items_total,
-                'create_date': delivery_obj.invoice_date,
-                'received_by': cmsuser_obj,
-                'supplierdn': delivery_obj.invoice_no,
-                'delivery_note_no': delivery_obj.id,
-                'updated_by': cmsuser_obj.username,
-                'supplier': supplier_obj, 
-            }
-            cmsdelivery_obj, cmsdelivery_created = Delivery.objects.get_or_create(
-                delivery_note_no=delivery_obj.id, 
-                defaults=new_cmsdelivery_data
-            )
-            if cmsdelivery_created:  # Update DeliveryOrder record and AuditLog
-                print(f"New delivery added: id #{cmsdelivery_obj.id}")
-                delivery_obj.cms_delivery_id = cmsdelivery_obj.id
-                delivery_obj.cms_synced = True
-                delivery_obj.save()
-
-                audit_str_dict = {**new_cmsdelivery_data,
-                    'dateCreated': datetime.strftime(cmsdelivery_obj.date_created, "%a %b %d %H:%M:%S %Y"),
-                    'lastUpdated': datetime.strftime(cmsdelivery_obj.last_updated, "%a %b %d %H:%M:%S %Y"),
-                    'type': 'Delivery',
-                }
-                sorted_dict = dict(sorted(audit_str_dict.items()))
-                audit_str = "||".join([
-                    ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-                ])
-                
-                newAuditLogEntry = AuditLog(
-                    actor = cmsuser_obj.username,
-                    class_name = 'Delivery',
-                    event_name = 'INSERT',
-                    old_value = None,
-                    new_value = audit_str,
-                    persisted_object_version = 'null',
-                    persisted_object_id = cmsdelivery_obj.id,
-                    session_id = session_id,
-                    uri = uri,
-                )
-                newAuditLogEntry.save()
-                if newAuditLogEntry.id:
-                    print(f"New audit log entry added: {audit_str}")
-                else:
-                    print("Error writing audit log entry")
-            else:
-                print(f"Delivery order already synced to CMS")
-
-            # Loop through DeliveryOrder item list and add to CMS received_item
-            item_idx = 0
-            for listitem in delivery_obj.delivery_items.all():
-                # Get CMS Inventory Item object
-                if listitem.item.cmsid:
-                    cmsitem_obj = InventoryItem.objects.get(id=listitem.item.cmsid)
-                    if listitem.batch_num:
-                        lot_no = listitem.batch_num
-                    else:
-                        lot_no = ""
-                    new_cmsreceived_item = {
-                        'arrive_date': delivery_obj.invoice_date,
-                        'cost': listitem.total_price,
-                        'dangerous_sign': cmsitem_obj.dangerous_sign,
-                        'delivery': cmsdelivery_obj,
-                        'drug_item': cmsitem_obj,
-                        'expire_date': listitem.expiry_date,
-                        'lot_no': lot_no,
-                        'quantity': listitem.items_quantity,
-                        'unit': listitem.items_unit,
-                        'received_items_idx': item_idx,
-                        'remarks': listitem.terms,
-                    }
-                    cmsreceived_obj, cmsreceived_created = ReceivedItem.objects.update_or_create(
-                        arrive_date=delivery_obj.invoice_date,
-                        drug_item=cmsitem_obj,
-                        quantity=listitem.items_quantity,
-                        cost=listitem.total_price,
-                        lot_no=lot_no,
-                        defaults=new_cmsreceived_item
-                    )
-                    if cmsreceived_created:  # Update InventoryItem, InventoryMovementLog, AuditLog
-                        print(f"New received item added: {cmsreceived_obj}")
-                    else:
-                        print(f"Already existing: {cmsreceived_obj}")
-                    if cmsreceived_obj:
-                        # Update InventoryItem quantity/costs
-                        last_updated = timezone.now() - timedelta(hours=settings.CMS_OFFSET_HRS)
-                        old_stock_qty = cmsitem_obj.stock_qty
-                        old_standard_cost = cmsitem_obj.standard_cost
-                        old_avg_cost = cmsitem_obj.avg_cost
-                        # old_discontinue = 'true' if cmsitem_obj.discontinue else 'false'
-                        old_discontinue = cmsitem_obj.discontinue
-                        old_is_clinic_drug_list = 'false' if cmsitem_obj.is_clinic_drug_list else 'true'
-                        old_clinic_drug_no = cmsitem_obj.clinic_drug_no
-                        if doUpdateQuantities:
-                            cmsitem_obj.stock_qty += float(listitem.items_quantity)
-                            print(f"CMS Item #{cmsitem_obj.id} Old Q {old_stock_qty} => {cmsitem_obj.stock_qty}")
-                        if listitem.standard_cost != 0:
-                            cmsitem_obj.standard_cost = listitem.standard_cost
-                        if listitem.average_cost != 0:
-                            cmsitem_obj.avg_cost = listitem.average_cost
-                        if old_discontinue:
-                            cmsitem_obj.discontinue = False
-                            print(f"CMS Item #{cmsitem_obj.id} set Active")
-                        cmsitem_obj.is_clinic_drug_list = True
-                        if not old_clinic_drug_no:
-                            cmsitem_obj.clinic_drug_no = InventoryItem.generateNextClinicDrugNo()
-                            print(f"Generated and added new: {cmsitem_obj.clinic_drug_no}")
-                        cmsitem_obj.updated_by = cmsuser_obj.username
-                        cmsitem_obj.last_updated = last_updated
-                        cmsitem_obj.save()
-                        if cmsitem_obj.last_updated == last_updated:
-                            # Successful save
-                            print(f"Updated inventory item: {cmsitem_obj.product_name}")
-                        
-                            # Update AuditLog:InventoryItem - stock_qty if changed
-                            if old_stock_qty == cmsitem_obj.stock_qty:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = str(old_stock_qty),
-                                    new_value = str(cmsitem_obj.stock_qty),
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "stockQty",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-
-                            # Update AuditLog:InventoryItem - standard_cost if not 0
-                            if listitem.standard_cost !=0:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = str(old_standard_cost),
-                                    new_value = str(cmsitem_obj.standard_cost),
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "standardCost",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-
-                            # Update AuditLog:InventoryItem - avg_cost
-                            if listitem.average_cost != 0:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = str(old_avg_cost),
-                                    new_value = str(cmsitem_obj.avg_cost),
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "avgCost",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-
-                            # Update AuditLog:InventoryItem - discontinue - if changed.
-                            if old_discontinue:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = 'true',
-                                    new_value = 'false',
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "discontinue",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-                            # Update AuditLog:InventoryItem - is_clinic_drug_list
-                            if not old_is_clinic_drug_list:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = 'false',
-                                    new_value = 'true',
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "is_clinic_drug_list",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-                            # Update AuditLog:InventoryItem - clinic_drug_no - if changed
-                            if old_clinic_drug_no != cmsitem_obj.clinic_drug_no:
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryItem',
-                                    event_name = 'UPDATE',
-                                    old_value = old_clinic_drug_no,
-                                    new_value = cmsitem_obj.clinic_drug_no,
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsitem_obj.id,
-                                    property_name = "clinic_drug_no",
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added UPDATE:{newAuditLogEntry.property_name} {newAuditLogEntry.old_value}=>{newAuditLogEntry.new_value}")
-                                else:
-                                    print("Error writing audit log entry")
-
-                            # Add new InventoryMovementLog record
-                            new_invmovelog_data = {
-                                'lot_no': listitem.batch_num,
-                                'move_item': listitem.item.name,
-                                'quantity': listitem.items_quantity,
-                                'movement_type': 'Delivery',
-                                'updated_by': cmsuser_obj.username,
-                                'reference_no': cmsdelivery_obj.id,
-                            }
-                            newInventoryMovementLogEntry = InventoryMovementLog(
-                                **new_invmovelog_data,
-                            )
-                            newInventoryMovementLogEntry.save()
-                            if newInventoryMovementLogEntry.id:
-                                # Successful save
-                                print(f"New InventoryMovementLog added: {newInventoryMovementLogEntry}")
-
-                                # Update AuditLog for InventoryMovementLog
-                                ## Rename movement_type to type
-                                new_invmovelog_data['type'] = new_invmovelog_data.pop('movement_type')
-                                audit_str_dict = {**new_invmovelog_data,
-                                    'dateCreated': datetime.strftime(newInventoryMovementLogEntry.date_created, "%a %b %d %H:%M:%S %Z %Y"),
-                                    'lastUpdated': datetime.strftime(newInventoryMovementLogEntry.last_updated, "%a %b %d %H:%M:%S %Z %Y"),
-                                }
-                                sorted_dict = dict(sorted(audit_str_dict.items()))
-                                audit_str = "||".join([
-                                    ":=".join((underscore_to_camel(key), str(value))) for (key, value) in sorted_dict.items()
-                                ])
-                                
-                                newAuditLogEntry = AuditLog(
-                                    actor = cmsuser_obj.username,
-                                    class_name = 'InventoryMovementLog',
-                                    event_name = 'INSERT',
-                                    old_value = None,
-                                    new_value = audit_str,
-                                    persisted_object_version = 'null',
-                                    persisted_object_id = cmsdelivery_obj.id,
-                                    session_id = session_id,
-                                    uri = uri,
-                                )
-                                newAuditLogEntry.save()
-                                if newAuditLogEntry.id:
-                                    print(f"New audit log entry added: {audit_str}")
-                                else:
-                                    print("Error writing audit log entry")
-                            else:
-                                print("Error updating inventory log")
-                        else:
-                            print("CMS InventoryItem not updated")
-                    else:
-                        print(f"Error: Missing cmsreceived_obj")
-                    item_idx += 1
-                else:
-                    print(f"Skipping item {listitem.item.name} - not a CMS item")
-        return redirect(uri)
-    
     return render(request, "cmsinv/new_delivery_from_deliveryorder_modal.html", context)
 
 class ReconciliationList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
@@ -1169,10 +850,7 @@ class ReconciliationList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
             self.last_query = ''
             object_list = object_list.order_by('-last_updated')
             self.last_query_count = object_list.count
-        if self.begin:
-            object_list = object_list.filter(received_date__gte=self.begin)
-        if self.end:
-            object_list = object_list.filter(received_date__lte=self.end)
+        object_list = object_list.filter(Depletion.local_range_q('last_updated', self.begin, self.end))
         return object_list
 
     def get_context_data(self, **kwargs):
@@ -0,0 +1,125 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Min
+from django.utils import timezone
+from .models import CMSModel
+
+CMS_DB = 'cms_db'
+CUTOFF_CACHE_SECS = 10 * 60  # archive cutoffs change only when archive_cms_history runs
+
+
+def archive_horizon(days=None):
+    """First local date kept in CMS: today - days (default settings.CMS_ARCHIVE_DAYS)"""
+    if days is None:
+        days = settings.CMS_ARCHIVE_DAYS
+    return timezone.localdate() - timedelta(days=days)
+
+
+class TableArchiver:
+    """
+    Moves CMS rows created before a date to a local archive model with the same
+    fields (and ids), in batches of ids
+    Rows are deleted from CMS only with delete=True, and only once they are in the
+    archive and covered by the local summary: covered_up_to() returns the highest
+    CMS id already summarized (e.g. ItemMovementDaily last_log_id)
+    """
+    def __init__(self, model, archive_model, covered_up_to=None):
+        self.model = model
+        self.archive_model = archive_model
+        self.covered_up_to = covered_up_to
+
+    def archive(self, before, delete=False, batch_size=1000):
+        """
+        Archives rows with date_created before the local date before
+        Returns (number of rows copied, number of rows deleted from CMS)
+        """
+        fields = [field.attname for field in self.archive_model._meta.concrete_fields]
+        rows = self.model.objects.using(CMS_DB).filter(date_created__lt=CMSModel.local_datetime(before))
+        covered = None
+        if delete and self.covered_up_to:
+            covered = self.covered_up_to() or 0
+        (copied, deleted) = (0, 0)
+        watermark = 0
+        while True:
+            batch = list(rows.filter(id__gt=watermark).order_by('id').values(*fields)[:batch_size])
+            if not batch:
+                break
+            watermark = batch[-1]['id']
+            ids = [row['id'] for row in batch]
+            with transaction.atomic(using=router.db_for_write(self.archive_model)):
+                self.archive_model.objects.bulk_create(
+                    [self.archive_model(**row) for row in batch], ignore_conflicts=True,
+                )
+            copied += len(batch)
+            if delete:
+                archived = set(self.archive_model.objects.filter(id__in=ids).values_list('id', flat=True))
+                ids = [row_id for row_id in ids if row_id in archived and (covered is None or row_id <= covered)]
+                if len(ids) < len(batch):
+                    print(f"Warning: {len(batch) - len(ids)} {self.model.__name__} rows not archived or summarized, kept in CMS")
+                if ids:
+                    deleted += self.model.objects.using(CMS_DB).filter(id__in=ids).delete()[0]
+        clear_cutoff(self.archive_model)
+        return copied, deleted
+
+
+def _cutoff_key(archive_model):
+    return f"cmssys:archive:{archive_model._meta.label_lower}:cutoff"
+
+def clear_cutoff(archive_model):
+    cache.delete(_cutoff_key(archive_model))
+
+def archive_cutoff(model, archive_model, keyset_fields):
+    """
+    Returns (first id still in CMS model, keyset values of the newest archived row
+    not in CMS); either is None if there is no such row
+    Cached for CUTOFF_CACHE_SECS and cleared by TableArchiver.archive(); with a
+    per-process cache, rows just moved by another process are listed within that time
+    """
+    key = _cutoff_key(archive_model)
+    cutoff = cache.get(key)
+    if cutoff is None:
+        first_live_id = model.objects.aggregate(Min('id'))['id__min']
+        archived = archive_model.objects.all()
+        if first_live_id is not None:
+            archived = archived.filter(id__lt=first_live_id)
+        newest = archived.order_by(*[f"-{field}" for field in keyset_fields]).values_list(*keyset_fields).first()
+        cutoff = (first_live_id, newest)
+        cache.set(key, cutoff, CUTOFF_CACHE_SECS)
+    return cutoff
+
+
+class ArchiveListMixin:
+    """
+    ListView mixin for CMS history with a local archive_model: get_archive_queryset()
+    applies filter_history() to the archive when the begin date (self.begin, '' for
+    none) reaches back before the archive horizon, so KeysetPaginationMixin pages
+    through live and archived rows together
+    The cutoff between CMS and archive is cached (archive_cutoff()), and the archive
+    is only read for pages that reach back to its newest row (get_archive_newest())
+    """
+    archive_model = None
+
+    def filter_history(self, object_list):
+        return object_list
+
+    def get_archive_cutoff(self):
+        return archive_cutoff(self.model, self.archive_model, self.keyset_fields)
+
+    def get_archive_newest(self):
+        return self.get_archive_cutoff()[1]
+
+    def get_archive_queryset(self):
+        begin = CMSModel.parse_local_date(self.begin) if self.begin else None
+        if begin and begin >= archive_horizon():
+            return None
+        (first_live_id, newest) = self.get_archive_cutoff()
+        if newest is None:
+            return None
+        object_list = self.archive_model.objects.all()
+        # archived rows still in CMS (copied, not deleted) are listed from CMS;
+        # rows are archived and deleted oldest id first
+        if first_live_id is not None:
+            object_list = object_list.filter(id__lt=first_live_id)
+        return self.filter_history(object_list)
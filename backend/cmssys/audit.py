@@ -0,0 +1,171 @@
+import sys
+from datetime import datetime, date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import AuditLog
+
+CMS_DB = 'cms_db'
+AUDIT_DATE_FORMAT = "%a %b %d %H:%M:%S %Z %Y"
+EXCLUDED_PROPERTIES = ('id', 'version')
+IGNORED_UPDATE_PROPERTIES = ('dateCreated', 'lastUpdated', 'updatedBy')
+
+# Model label => list of (attname, CMS property name), built once per model
+_property_map_cache = {}
+
+
+def underscore_to_camel(word):
+    return word.split('_')[0] + ''.join(x.capitalize() or '_' for x in word.split('_')[1:])
+
+def audit_class_name(model):
+    """CMS (Grails) domain class name, derived from db_table; e.g. supplier_manufacturer => SupplierManufacturer"""
+    return ''.join(x.capitalize() for x in model._meta.db_table.split('_'))
+
+def property_map(model):
+    """
+    Returns list of (attname, property name) for concrete fields of model
+    CMS property names are the camelCase column names, without _id for foreign keys;
+    e.g. supp_type (db_column 'type') => type, certificate_holder_id => certificateHolder
+    """
+    label = model._meta.label
+    if label not in _property_map_cache:
+        properties = []
+        for field in model._meta.concrete_fields:
+            column = field.column
+            if field.is_relation and column.endswith('_id'):
+                column = column[:-len('_id')]
+            if column in EXCLUDED_PROPERTIES:
+                continue
+            properties.append((field.attname, underscore_to_camel(column)))
+        _property_map_cache[label] = properties
+    return _property_map_cache[label]
+
+def format_value(value):
+    """Format value as stored by the CMS app"""
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return str(value).lower()
+    if isinstance(value, datetime):
+        return datetime.strftime(value, AUDIT_DATE_FORMAT)
+    if isinstance(value, date):
+        return datetime.strftime(datetime.combine(value, datetime.min.time()), AUDIT_DATE_FORMAT)
+    return str(value)
+
+def serialize_dict(data):
+    """Serialize dict in CMS audit_log format: key:=value||key:=value (sorted by camelCase key)"""
+    camel_dict = {underscore_to_camel(key): format_value(value) for (key, value) in data.items()}
+    return "||".join([
+        ":=".join((key, value)) for (key, value) in sorted(camel_dict.items())
+    ])
+
+def deserialize(text):
+    """
+    Parses CMS audit_log value text: key:=value||key:=value => dict of key => value
+    Returns None if text is not in this format (e.g. a single property value)
+    """
+    if not text or ':=' not in text:
+        return None
+    data = {}
+    for pair in text.split('||'):
+        (key, sep, value) = pair.partition(':=')
+        if sep:
+            data[key] = value
+        elif data:
+            # value containing '||': belongs to the previous key
+            data[list(data)[-1]] += '||' + pair
+    return data
+
+def snapshot(obj):
+    """Returns dict of CMS property name => value for obj, to diff against later"""
+    return {property_name: getattr(obj, attname) for (attname, property_name) in property_map(type(obj))}
+
+def serialize(obj, extra=None):
+    """Serialize CMSModel instance in CMS audit_log format"""
+    data = snapshot(obj)
+    if extra:
+        data.update(extra)
+    return serialize_dict(data)
+
+
+class AuditWriter:
+    """
+    Collects CMS audit_log entries for a unit of work and writes them with a single
+    bulk_create just before the surrounding cms_db transaction commits; nothing is
+    written if the unit of work raises
+
+        with AuditWriter(actor, session_id=session_id, uri=uri) as audit:
+            old_values = snapshot(obj)
+            ... obj.save()
+            audit.update(obj, old_values)
+    """
+    def __init__(self, actor, session_id=None, uri=None, using=CMS_DB):
+        self.actor = actor
+        self.session_id = session_id
+        self.uri = uri
+        self.using = using
+        self.entries = []
+        self._atomic = None
+
+    def __enter__(self):
+        self._atomic = transaction.atomic(using=self.using)
+        self._atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            try:
+                self.flush()
+            except Exception:
+                self._atomic.__exit__(*sys.exc_info())
+                raise
+        return self._atomic.__exit__(exc_type, exc_value, traceback)
+
+    def log(self, class_name, event_name, persisted_object_id, property_name=None, old_value=None, new_value=None):
+        cms_now = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
+        entry = AuditLog(
+            actor=self.actor,
+            class_name=class_name,
+            event_name=event_name,
+            old_value=old_value,
+            new_value=new_value,
+            persisted_object_version='null',
+            persisted_object_id=persisted_object_id,
+            property_name=property_name,
+            session_id=self.session_id,
+            uri=self.uri,
+            date_created=cms_now,
+            last_updated=cms_now,
+        )
+        self.entries.append(entry)
+        return entry
+
+    def insert(self, obj, extra=None, class_name=None):
+        """INSERT entry with serialized values of newly saved obj"""
+        return self.log(
+            class_name or audit_class_name(type(obj)), 'INSERT', obj.pk,
+            new_value=serialize(obj, extra),
+        )
+
+    def update(self, obj, old_values, class_name=None):
+        """UPDATE entry for each property of obj changed since old_values (see snapshot)"""
+        entries = []
+        for (property_name, new_value) in snapshot(obj).items():
+            if property_name not in old_values:
+                continue
+            old_value = old_values[property_name]
+            if old_value == new_value or property_name in IGNORED_UPDATE_PROPERTIES:
+                continue
+            entries.append(self.log(
+                class_name or audit_class_name(type(obj)), 'UPDATE', obj.pk,
+                property_name=property_name,
+                old_value=None if old_value is None else format_value(old_value),
+                new_value=None if new_value is None else format_value(new_value),
+            ))
+        return entries
+
+    def flush(self):
+        if self.entries:
+            AuditLog.objects.using(self.using).bulk_create(self.entries)
+            print(f"{len(self.entries)} audit log entries added")
+        self.entries = []
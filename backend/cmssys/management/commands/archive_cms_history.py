@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from cmsinv.models import InventoryMovementLog, InventoryMovementLogArchive, ItemMovementDaily
+from cmssys.archive import TableArchiver, archive_horizon
+from cmssys.models import AuditLog, AuditLogArchive, AuditIndexEntry
+
+class Command(BaseCommand):
+    """
+    Copies CMS inventory_movement_log and audit_log rows older than CMS_ARCHIVE_DAYS
+    to local archive tables; with --delete, also removes them from CMS once the
+    movement rollup and audit index are up to date with them
+    """
+    help = 'Archives CMS InventoryMovementLog and AuditLog history older than CMS_ARCHIVE_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Keep this many days in CMS (default CMS_ARCHIVE_DAYS)')
+        parser.add_argument('--delete', action='store_true', help='Delete archived rows from CMS')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per batch')
+
+    def handle(self, *args, **options):
+        before = archive_horizon(options['days'])
+        if options['delete']:
+            # summaries must include the rows before they leave CMS
+            ItemMovementDaily.refresh()
+            AuditIndexEntry.refresh()
+        archivers = [
+            TableArchiver(
+                InventoryMovementLog, InventoryMovementLogArchive,
+                lambda: ItemMovementDaily.objects.aggregate(Max('last_log_id'))['last_log_id__max'],
+            ),
+            TableArchiver(
+                AuditLog, AuditLogArchive,
+                lambda: AuditIndexEntry.objects.aggregate(Max('audit_id'))['audit_id__max'],
+            ),
+        ]
+        for archiver in archivers:
+            (copied, deleted) = archiver.archive(before, delete=options['delete'], batch_size=options['batch_size'])
+            self.stdout.write(f"{archiver.model.__name__}: {copied} rows before {before} archived, {deleted} deleted from CMS")
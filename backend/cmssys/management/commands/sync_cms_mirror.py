@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from cmssys.mirror import sync_mirror
+
+class Command(BaseCommand):
+    """
+    Copies changed rows of mirrored CMS tables into the local cms_mirror schema
+    Run with --loop to keep the mirror within CMS_MIRROR_MAX_STALENESS_SECS
+    """
+    help = 'Syncs local mirror of CMS inventory tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Also compare versions of all rows and remove deleted rows')
+        parser.add_argument('--loop', type=float, metavar='SECONDS', help='Sync repeatedly, every SECONDS')
+
+    def sync(self, full):
+        for (table, (copied, deleted)) in sync_mirror(full=full).items():
+            self.stdout.write(f"{table}: {copied} copied, {deleted} deleted")
+
+    def handle(self, *args, **options):
+        if options['loop'] is not None and options['loop'] <= 0:
+            raise CommandError('--loop must be positive')
+        self.sync(options['full'])
+        while options['loop']:
+            time.sleep(options['loop'])
+            try:
+                self.sync(False)
+            except Exception as e:
+                print(f"Error: CMS mirror sync failed - {e}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from cmssys.models import AuditIndexEntry
+
+class Command(BaseCommand):
+    """
+    Updates local search index (cmssys.AuditIndexEntry) of CMS audit_log
+    Only entries above the last indexed id are fetched; schedule e.g. every minute
+    """
+    help = 'Updates AuditIndexEntry from CMS audit_log entries added since last update'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-index the whole audit_log')
+
+    def handle(self, *args, **options):
+        processed = AuditIndexEntry.refresh(full=options['full'])
+        self.stdout.write(f"Audit index: {processed} audit_log entries indexed")
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.3 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmssys', '0004_patient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MirrorState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=255, unique=True)),
+                ('last_updated', models.DateTimeField(blank=True, null=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_synced', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync', models.DateTimeField(blank=True, null=True)),
+                ('row_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
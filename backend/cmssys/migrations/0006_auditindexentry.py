@@ -0,0 +1,51 @@
+# Generated by Django 3.1.3 on 2026-10-18 16:10
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmssys', '0005_mirrorstate'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            reverse_sql=migrations.RunSQL.noop,
+            hints={'model_name': 'auditindexentry'},
+        ),
+        migrations.CreateModel(
+            name='AuditIndexEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audit_id', models.BigIntegerField(db_index=True)),
+                ('class_name', models.CharField(max_length=255)),
+                ('object_id', models.CharField(blank=True, default='', max_length=255)),
+                ('event_name', models.CharField(blank=True, default='', max_length=255)),
+                ('actor', models.CharField(blank=True, default='', max_length=255)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('old_value', models.TextField(blank=True, null=True)),
+                ('new_value', models.TextField(blank=True, null=True)),
+                ('date_created', models.DateTimeField()),
+                ('document', models.TextField(default='')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='auditindexentry',
+            index=models.Index(fields=['class_name', 'object_id', 'date_created'], name='cmssys_auditidx_object'),
+        ),
+        migrations.AddIndex(
+            model_name='auditindexentry',
+            index=models.Index(fields=['actor', 'date_created'], name='cmssys_auditidx_actor'),
+        ),
+        migrations.AddIndex(
+            model_name='auditindexentry',
+            index=models.Index(fields=['key'], name='cmssys_auditidx_key'),
+        ),
+        migrations.AddIndex(
+            model_name='auditindexentry',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['document'], name='cmssys_auditidx_doc_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cmssys', '0006_auditindexentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchive',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+                ('actor', models.CharField(blank=True, max_length=255, null=True)),
+                ('class_name', models.CharField(max_length=255)),
+                ('date_created', models.DateTimeField()),
+                ('last_updated', models.DateTimeField()),
+                ('event_name', models.CharField(max_length=255)),
+                ('new_value', models.TextField(blank=True, null=True)),
+                ('old_value', models.TextField(blank=True, null=True)),
+                ('persisted_object_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('persisted_object_version', models.CharField(blank=True, max_length=255, null=True)),
+                ('property_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('session_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('uri', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchive',
+            index=models.Index(fields=['last_updated', 'id'], name='cmssys_auditarch_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchive',
+            index=models.Index(fields=['date_created'], name='cmssys_auditarch_created'),
+        ),
+    ]
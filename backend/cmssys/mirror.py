@@ -0,0 +1,205 @@
+import time
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from .models import MirrorState, TextBooleanField
+
+CMS_DB = 'cms_db'
+MIRROR_DB = 'cms_mirror'
+BATCH_SIZE = 1000
+STATE_CACHE_SECS = 5  # how long routers may reuse a table's last_synced
+
+# CMS tables copied into the cms_mirror schema (app_label.model_name, lowercase)
+MIRRORED_MODELS = [
+        'cmsinv.inventoryitem',
+        'cmsinv.supplier',
+        'cmsinv.receiveditem',
+        'cmsinv.inventorymovementlog',
+        'cmsinv.delivery',
+    ]
+
+
+def mirror_enabled():
+    return getattr(settings, 'CMS_MIRROR_ENABLED', False) and MIRROR_DB in settings.DATABASES
+
+def mirrored_models():
+    return [apps.get_model(label) for label in MIRRORED_MODELS]
+
+def _state_cache_key(table):
+    return f"cms_mirror:{table}"
+
+def is_fresh(model):
+    """
+    True if reads of model may be served from the mirror: mirror enabled, table
+    synced within CMS_MIRROR_MAX_STALENESS_SECS, and not inside a cms_db transaction
+    (reads in a write transaction must see its own changes)
+    """
+    if not mirror_enabled() or connections[CMS_DB].in_atomic_block:
+        return False
+    table = model._meta.db_table
+    last_synced = cache.get(_state_cache_key(table))
+    if last_synced is None:
+        synced = MirrorState.objects.filter(table=table).values_list('last_synced', flat=True).first()
+        last_synced = synced.timestamp() if synced else 0
+        cache.set(_state_cache_key(table), last_synced, STATE_CACHE_SECS)
+    return time.time() - last_synced <= settings.CMS_MIRROR_MAX_STALENESS_SECS
+
+
+class TableMirror:
+    """
+    Copies one CMS table into the cms_mirror schema of the local Postgres database
+    - Mirror tables have the CMS table/column names (so models read them unchanged
+      through the cms_mirror connection) but no constraints besides the primary key
+    - Incremental sync: rows with last_updated >= watermark; received_item has no
+      timestamps, so new rows are taken by id > watermark
+    - Version sweep: (id, version) of all CMS rows compared with the mirror; rows
+      with a changed version are copied again and deleted rows removed
+    """
+    def __init__(self, model):
+        self.model = model
+        self.table = model._meta.db_table
+        self.fields = model._meta.concrete_fields
+        self.attnames = [field.attname for field in self.fields]
+        self.has_timestamp = 'last_updated' in self.attnames
+        self.connection = connections[MIRROR_DB]
+
+    def _column_type(self, field):
+        if field.primary_key:
+            return 'bigint'
+        if isinstance(field, TextBooleanField):
+            return 'text'
+        return field.db_type(self.connection)
+
+    def create_table(self):
+        """Creates mirror table, adds columns for fields new since it was created"""
+        quote_name = self.connection.ops.quote_name
+        table = quote_name(self.table)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {quote_name(settings.CMS_MIRROR_SCHEMA)}")
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} ({quote_name('id')} bigint PRIMARY KEY)")
+            for field in self.fields:
+                if field.primary_key:
+                    continue
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS "
+                    f"{quote_name(field.column)} {self._column_type(field)}"
+                )
+                if field.is_relation or field.attname == 'last_updated':
+                    index_name = f"{self.table}_{field.column}_idx"[:self.connection.ops.max_name_length()]
+                    cursor.execute(
+                        f"CREATE INDEX IF NOT EXISTS {quote_name(index_name)} "
+                        f"ON {table} ({quote_name(field.column)})"
+                    )
+
+    def _prep_row(self, row):
+        values = []
+        for (field, value) in zip(self.fields, row):
+            value = field.get_db_prep_value(value, self.connection)
+            if isinstance(field, TextBooleanField) and value is not None:
+                value = str(value)
+            values.append(value)
+        return values
+
+    def upsert(self, rows):
+        """INSERT ... ON CONFLICT (id) DO UPDATE rows (tuples of values in self.attnames order)"""
+        if not rows:
+            return 0
+        from psycopg2.extras import execute_values
+        quote_name = self.connection.ops.quote_name
+        columns = [quote_name(field.column) for field in self.fields]
+        updates = [f"{column} = EXCLUDED.{column}" for column in columns if column != quote_name('id')]
+        sql = (
+            f"INSERT INTO {quote_name(self.table)} ({', '.join(columns)}) VALUES %s "
+            f"ON CONFLICT ({quote_name('id')}) DO UPDATE SET {', '.join(updates)}"
+        )
+        with self.connection.cursor() as cursor:
+            execute_values(cursor.cursor, sql, [self._prep_row(row) for row in rows], page_size=BATCH_SIZE)
+        return len(rows)
+
+    def delete(self, ids):
+        if not ids:
+            return 0
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.connection.ops.quote_name(self.table)} WHERE id = ANY(%s)", [list(ids)]
+            )
+        return len(ids)
+
+    def _copy(self, queryset):
+        """Upserts rows of CMS queryset in batches; returns (count, last row)"""
+        count = 0
+        batch = []
+        row = None
+        for row in queryset.values_list(*self.attnames).iterator(chunk_size=BATCH_SIZE):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                count += self.upsert(batch)
+                batch = []
+        count += self.upsert(batch)
+        return count, row
+
+    def sync_incremental(self, state):
+        """Copies rows changed (or added) since the watermarks in state; returns row count"""
+        cms_objects = self.model.objects.using(CMS_DB)
+        if self.has_timestamp:
+            queryset = cms_objects.order_by('last_updated', 'id')
+            if state.last_updated:
+                queryset = queryset.filter(last_updated__gte=state.last_updated)
+            count, last_row = self._copy(queryset)
+            if last_row and last_row[self.attnames.index('last_updated')]:
+                state.last_updated = last_row[self.attnames.index('last_updated')]
+        else:
+            count, last_row = self._copy(cms_objects.filter(id__gt=state.last_id).order_by('id'))
+            if last_row:
+                state.last_id = last_row[self.attnames.index('id')]
+        return count
+
+    def sync_versions(self):
+        """Copies rows whose version differs from the mirror, removes deleted rows; returns (copied, deleted)"""
+        cms_versions = dict(self.model.objects.using(CMS_DB).values_list('id', 'version').iterator(chunk_size=BATCH_SIZE))
+        mirror_versions = dict(self.model.objects.using(MIRROR_DB).values_list('id', 'version').iterator(chunk_size=BATCH_SIZE))
+        changed_ids = [
+            cmsid for (cmsid, version) in cms_versions.items()
+            if cmsid not in mirror_versions or mirror_versions[cmsid] != version
+        ]
+        copied = 0
+        for i in range(0, len(changed_ids), BATCH_SIZE):
+            count, last_row = self._copy(self.model.objects.using(CMS_DB).filter(id__in=changed_ids[i:i + BATCH_SIZE]))
+            copied += count
+        deleted = self.delete([cmsid for cmsid in mirror_versions if cmsid not in cms_versions])
+        return copied, deleted
+
+    def sync(self, full=False):
+        """
+        Brings the mirror table up to date; a version sweep is run with full or when
+        the last one is older than CMS_MIRROR_SWEEP_SECS
+        Returns (copied, deleted)
+        """
+        started = timezone.now()
+        state, created = MirrorState.objects.get_or_create(table=self.table)
+        self.create_table()
+        copied = self.sync_incremental(state)
+        deleted = 0
+        sweep_due = timezone.now() - timedelta(seconds=settings.CMS_MIRROR_SWEEP_SECS)
+        if full or not state.last_full_sync or state.last_full_sync < sweep_due:
+            swept, deleted = self.sync_versions()
+            copied += swept
+            state.last_full_sync = started
+        state.last_synced = started
+        state.row_count = self.model.objects.using(MIRROR_DB).count()
+        state.save()
+        cache.set(_state_cache_key(self.table), started.timestamp(), STATE_CACHE_SECS)
+        return copied, deleted
+
+
+def sync_mirror(full=False):
+    """Syncs all mirrored CMS tables; returns dict of db_table => (copied, deleted)"""
+    if MIRROR_DB not in settings.DATABASES:
+        raise RuntimeError(f"Database '{MIRROR_DB}' is not configured")
+    results = {}
+    for model in mirrored_models():
+        results[model._meta.db_table] = TableMirror(model).sync(full=full)
+    return results
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.contrib.postgres.indexes import GinIndex
 # from django.utils.timezone import get_current_timezone, make_aware, utc
-from datetime import timedelta
+from datetime import date, datetime, time, timedelta
 from django.utils import timezone
 from django.conf import settings
 import pytz
@@ -40,7 +41,7 @@ class TextBooleanField(models.BooleanField):
     def from_db_value(self, value, expression, connection):
         if value is None:
             return value 
-        elif value is "1":
+        elif value in ("1", 1, True):
             return True
         else:
             return False
@@ -73,9 +74,68 @@ class CMSModel(models.Model):
     """
     id = models.BigAutoField(primary_key=True)
 
+    # Clinic sessions of a day, split at PERIOD_CUTOFF_HR (CMS local time)
+    AM = 'a'
+    PM = 'p'
+    PERIOD_CUTOFF_HR = 15  # 3pm in 24hr time
+    PERIOD_CUTOFF_MIN = 0
+
     class Meta:
         abstract = True
 
+    @staticmethod
+    def parse_local_date(value):
+        """Returns date for value (date or DATE_INPUT_FORMATS string), None if empty or invalid"""
+        if not value or isinstance(value, date):
+            return value or None
+        for date_format in settings.DATE_INPUT_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return None
+
+    @staticmethod
+    def local_datetime(local_date, hour=0, minute=0):
+        """Local time on local_date as stored by CMS (local wall time in UTC columns)"""
+        return datetime.combine(local_date, time(hour, minute), tzinfo=timezone.utc)
+
+    @classmethod
+    def local_range(cls, begin, end=None, session=None):
+        """
+        Returns half-open (start, end) CMS datetimes covering local dates begin to end
+        (inclusive; end defaults to begin), or only the AM/PM session of begin
+        """
+        begin = cls.parse_local_date(begin)
+        end = cls.parse_local_date(end) or begin
+        start = cls.local_datetime(begin)
+        stop = cls.local_datetime(end + timedelta(days=1))
+        cutoff = cls.local_datetime(begin, cls.PERIOD_CUTOFF_HR, cls.PERIOD_CUTOFF_MIN)
+        if session == cls.AM:
+            return (start, cutoff)
+        if session == cls.PM:
+            return (cutoff, cls.local_datetime(begin + timedelta(days=1)))
+        return (start, stop)
+
+    @classmethod
+    def local_range_q(cls, field, begin=None, end=None, session=None):
+        """
+        Q filtering field (a date_created/last_updated path, may span relations) to local
+        dates begin to end (inclusive, either may be None/'' for an open range) or the
+        AM/PM session of begin; range predicates on the raw column, so indexes can be used
+        """
+        begin = cls.parse_local_date(begin)
+        end = cls.parse_local_date(end)
+        condition = models.Q()
+        if session and begin:
+            (start, stop) = cls.local_range(begin, session=session)
+            return models.Q(**{f"{field}__gte": start, f"{field}__lt": stop})
+        if begin:
+            condition &= models.Q(**{f"{field}__gte": cls.local_datetime(begin)})
+        if end:
+            condition &= models.Q(**{f"{field}__lt": cls.local_datetime(end + timedelta(days=1))})
+        return condition
+
     @property
     def date_created_conv(self):
         if self.date_created:
@@ -130,6 +190,37 @@ class AuditLog(CMSModel):
             self.date_created = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS) 
         self.last_updated = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
         return super().save(*args, **kwargs)
+
+
+class AuditLogArchive(CMSModel):
+    """
+    Local archive of CMS audit_log rows older than CMS_ARCHIVE_DAYS (same ids and
+    fields), see cmssys.archive; AuditLogList spans both, AuditIndexEntry keeps them indexed
+    """
+    version = models.BigIntegerField(default=0)
+    actor = models.CharField(max_length=255, blank=True, null=True)
+    class_name = models.CharField(max_length=255)
+    date_created = models.DateTimeField()
+    last_updated = models.DateTimeField()
+    event_name = models.CharField(max_length=255)
+    new_value = models.TextField(blank=True, null=True)
+    old_value = models.TextField(blank=True, null=True)
+    persisted_object_id = models.CharField(max_length=255, blank=True, null=True)
+    persisted_object_version = models.CharField(max_length=255, blank=True, null=True)
+    property_name = models.CharField(max_length=255, blank=True, null=True)
+    session_id = models.CharField(max_length=255, blank=True, null=True)
+    uri = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        app_label = 'cmssys'
+        indexes = [
+            models.Index(fields=['last_updated', 'id'], name='cmssys_auditarch_keyset'),
+            models.Index(fields=['date_created'], name='cmssys_auditarch_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.date_created} [{self.actor}] {self.event_name} {self.class_name}: {self.property_name} (archived)"
+
 class CmsUser(CMSModel):
     """
     Maps to CMS table: user
@@ -297,4 +388,121 @@ class Encounter(CMSModel):
         if not self.id:
             self.date_created = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS) 
         self.last_updated = timezone.now() + timedelta(hours=settings.CMS_OFFSET_HRS)
-        return super().save(*args, **kwargs)
\ No newline at end of file
+        return super().save(*args, **kwargs)
+
+class MirrorState(models.Model):
+    """
+    Sync state of a CMS table mirrored into the local Postgres cms_mirror schema,
+    see cmssys.mirror; stored in the default database
+    """
+    table = models.CharField(max_length=255, unique=True)  # CMS db_table
+    last_updated = models.DateTimeField(blank=True, null=True)  # CMS last_updated watermark
+    last_id = models.BigIntegerField(default=0)  # id watermark, for tables without last_updated
+    last_synced = models.DateTimeField(blank=True, null=True)  # start of last successful sync
+    last_full_sync = models.DateTimeField(blank=True, null=True)  # last version sweep
+    row_count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'cmssys'
+
+    def __str__(self):
+        return f"{self.table}: synced {self.last_synced} ({self.row_count} rows)"
+
+
+class AuditIndexEntry(models.Model):
+    """
+    Local search index of CMS audit_log: one row per property of an audit entry
+    (serialized key:=value||... values of inserts/deletes are split into their keys)
+    document is the lowercase text of the row for substring search (pg_trgm GIN index);
+    object history is an index seek on (class_name, object_id, date_created)
+    Updated incrementally from the last indexed audit_log id: manage.py update_audit_index
+    """
+    audit_id = models.BigIntegerField(db_index=True)  # AuditLog id
+    class_name = models.CharField(max_length=255)
+    object_id = models.CharField(max_length=255, blank=True, default='')  # persisted_object_id
+    event_name = models.CharField(max_length=255, blank=True, default='')
+    actor = models.CharField(max_length=255, blank=True, default='')
+    key = models.CharField(max_length=255, blank=True, default='')  # property name
+    old_value = models.TextField(blank=True, null=True)
+    new_value = models.TextField(blank=True, null=True)
+    date_created = models.DateTimeField()  # CMS date_created
+    document = models.TextField(default='')
+
+    class Meta:
+        app_label = 'cmssys'
+        indexes = [
+            models.Index(fields=['class_name', 'object_id', 'date_created'], name='cmssys_auditidx_object'),
+            models.Index(fields=['actor', 'date_created'], name='cmssys_auditidx_actor'),
+            models.Index(fields=['key'], name='cmssys_auditidx_key'),
+            GinIndex(fields=['document'], name='cmssys_auditidx_doc_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return f"#{self.audit_id} {self.event_name} {self.class_name} #{self.object_id}: {self.key} {self.old_value} => {self.new_value}"
+
+    @property
+    def date_created_conv(self):
+        return self.date_created - timedelta(hours=settings.CMS_OFFSET_HRS)
+
+    @classmethod
+    def from_auditlog(cls, audit_obj):
+        """Returns list of (unsaved) entries for AuditLog audit_obj"""
+        from .audit import deserialize
+        old_values = deserialize(audit_obj.old_value)
+        new_values = deserialize(audit_obj.new_value)
+        if audit_obj.property_name or (old_values is None and new_values is None):
+            values = [(audit_obj.property_name or '', audit_obj.old_value, audit_obj.new_value)]
+        else:
+            old_values = old_values or {}
+            new_values = new_values or {}
+            keys = list(old_values) + [key for key in new_values if key not in old_values]
+            values = [(key, old_values.get(key), new_values.get(key)) for key in keys]
+        entries = []
+        for (key, old_value, new_value) in values:
+            entry = cls(
+                audit_id=audit_obj.id,
+                class_name=audit_obj.class_name or '',
+                object_id=(audit_obj.persisted_object_id or '')[:255],
+                event_name=audit_obj.event_name or '',
+                actor=audit_obj.actor or '',
+                key=key[:255],
+                old_value=old_value,
+                new_value=new_value,
+                date_created=audit_obj.date_created,
+            )
+            entry.document = ' '.join(
+                str(value) for value in (entry.class_name, entry.object_id, entry.event_name, entry.actor, key, old_value, new_value)
+                if value
+            ).lower()
+            entries.append(entry)
+        return entries
+
+    @classmethod
+    def refresh(cls, full=False, batch_size=5000):
+        """
+        Indexes CMS audit_log entries with id above the last indexed id
+        full=True re-indexes the whole audit_log
+        Returns number of audit_log entries indexed
+        """
+        processed = 0
+        with transaction.atomic(using=router.db_for_write(cls)):
+            if full:
+                cls.objects.all().delete()
+            watermark = cls.objects.aggregate(models.Max('audit_id'))['audit_id__max'] or 0
+            sources = [AuditLog.objects.using('cms_db')]
+            if full:
+                # entries deleted from CMS by archive_cms_history are only in the archive
+                sources.insert(0, AuditLogArchive.objects.all())
+            for source in sources:
+                while True:
+                    # audit_log is append only, so new entries are those above the last id
+                    audit_list = list(source.filter(id__gt=watermark).order_by('id')[:batch_size])
+                    if not audit_list:
+                        break
+                    entries = []
+                    for audit_obj in audit_list:
+                        entries.extend(cls.from_auditlog(audit_obj))
+                    cls.objects.bulk_create(entries, batch_size=1000)
+                    watermark = audit_list[-1].id
+                    processed += len(audit_list)
+        return processed
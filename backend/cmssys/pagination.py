@@ -0,0 +1,184 @@
+import base64, binascii, json
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+def encode_cursor(values):
+    """Opaque cursor for a row's keyset values (None kept as null)"""
+    data = json.dumps([None if value is None else str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+def decode_cursor(cursor, fields):
+    """Returns list of python values for fields from cursor, None if missing or invalid"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(fields):
+            return None
+        return [None if value is None else field.to_python(value) for (field, value) in zip(fields, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+class KeysetPage:
+    """Page of a keyset paginated ListView, used as page_obj"""
+    def __init__(self, object_list, has_next, has_previous, keyset_fields, params, count=None):
+        self.object_list = object_list
+        self.has_next_page = has_next
+        self.has_previous_page = has_previous
+        self.keyset_fields = keyset_fields
+        self.params = params
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.has_next_page
+
+    def has_previous(self):
+        return self.has_previous_page
+
+    def has_other_pages(self):
+        return self.has_next_page or self.has_previous_page
+
+    def _query(self, **cursor):
+        params = self.params.copy()
+        for key in ('after', 'before', 'page'):
+            params.pop(key, None)
+        for (key, value) in cursor.items():
+            params[key] = value
+        return params.urlencode()
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, field) for field in self.keyset_fields])
+
+    @property
+    def first_query(self):
+        return self._query()
+
+    @property
+    def next_query(self):
+        return self._query(after=self._cursor(self.object_list[-1])) if self.object_list else ''
+
+    @property
+    def previous_query(self):
+        return self._query(before=self._cursor(self.object_list[0])) if self.object_list else ''
+
+    @property
+    def count_query(self):
+        params = self.params.copy()
+        params['count'] = '1'
+        return params.urlencode()
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin: paginates by seeking on keyset_fields (newest first) instead of
+    OFFSET, so every page costs the same as the first
+    GET after / before: cursor of the last / first row of the current page
+    GET count=1: also count all rows (COUNT(*) over the filtered queryset)
+    get_archive_queryset(): archived rows to merge into the pages (see cmssys.archive),
+    read only for pages reaching back to get_archive_newest() if that is known
+    Template: page_obj.has_next/has_previous, next_query/previous_query/first_query
+    (query strings keeping the other GET parameters), page_obj.count (None if not counted)
+    NULL keyset values sort as the oldest (nulls last in the newest first order)
+    """
+    keyset_fields = ('last_updated', 'id')
+
+    @staticmethod
+    def _equal(field, value):
+        return Q(**{f"{field}__isnull": True}) if value is None else Q(**{field: value})
+
+    @staticmethod
+    def _beyond(field, value, newer):
+        """Q for field values newer (or older) than value, NULL being the oldest"""
+        if newer:
+            return Q(**{f"{field}__isnull": False}) if value is None else Q(**{f"{field}__gt": value})
+        if value is None:
+            return None
+        return Q(**{f"{field}__lt": value}) | Q(**{f"{field}__isnull": True})
+
+    def _seek(self, values, newer):
+        """Q for rows after (older, or newer if newer=True) the row with keyset values"""
+        condition = Q(pk__in=[])
+        for (i, field) in enumerate(self.keyset_fields):
+            beyond = self._beyond(field, values[i], newer)
+            if beyond is None:
+                continue
+            for j in range(i):
+                beyond &= self._equal(self.keyset_fields[j], values[j])
+            condition |= beyond
+        return condition
+
+    def _order(self, newest_first):
+        if newest_first:
+            return [F(field).desc(nulls_last=True) for field in self.keyset_fields]
+        return [F(field).asc(nulls_first=True) for field in self.keyset_fields]
+
+    def get_archive_queryset(self):
+        """Optional queryset of archived rows (same keyset fields, not in the queryset) paged together with it"""
+        return None
+
+    def get_archive_newest(self):
+        """Keyset values of the newest archived row, None if unknown (archive read for every page)"""
+        return None
+
+    @staticmethod
+    def _sort_key(values):
+        """Sort key of keyset values, NULL values first (oldest)"""
+        return tuple((value is not None, value) for value in values)
+
+    def _keyset(self, obj):
+        return self._sort_key(getattr(obj, field) for field in self.keyset_fields)
+
+    def _fetch(self, queryset, after, before, page_size):
+        """page_size + 1 rows of queryset after/before the cursor values"""
+        if before:
+            queryset = queryset.filter(self._seek(before, newer=True)).order_by(*self._order(False))
+        else:
+            queryset = queryset.order_by(*self._order(True))
+            if after:
+                queryset = queryset.filter(self._seek(after, newer=False))
+        return list(queryset[:page_size + 1])
+
+    def _reaches_archive(self, object_list, after, before, page_size):
+        """True if archived rows may belong on the page of object_list (rows of the queryset)"""
+        newest = self.get_archive_newest()
+        if newest is None:
+            return True
+        newest = self._sort_key(newest)
+        if before:
+            return self._sort_key(before) < newest
+        if len(object_list) <= page_size:
+            return True
+        return self._keyset(object_list[-1]) <= newest
+
+    def paginate_queryset(self, queryset, page_size):
+        params = self.request.GET
+        fields = [queryset.model._meta.get_field(field) for field in self.keyset_fields]
+        after = decode_cursor(params.get('after'), fields)
+        before = None if after else decode_cursor(params.get('before'), fields)
+        archive_queryset = self.get_archive_queryset()
+        count = None
+        if params.get('count') == '1':
+            count = queryset.count() + (archive_queryset.count() if archive_queryset is not None else 0)
+        object_list = self._fetch(queryset, after, before, page_size)
+        if archive_queryset is not None and self._reaches_archive(object_list, after, before, page_size):
+            # page_size + 1 rows from each queryset, merged on the keyset
+            object_list.extend(self._fetch(archive_queryset, after, before, page_size))
+            object_list.sort(key=self._keyset, reverse=not before)
+        if before:
+            has_previous = len(object_list) > page_size
+            object_list = object_list[:page_size][::-1]
+            has_next = True
+        else:
+            has_next = len(object_list) > page_size
+            object_list = object_list[:page_size]
+            has_previous = bool(after)
+        page = KeysetPage(object_list, has_next, has_previous, self.keyset_fields, params, count)
+        return (None, page, object_list, page.has_other_pages())
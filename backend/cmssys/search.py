@@ -0,0 +1,44 @@
+from django.db import connections
+from .models import AuditLog, AuditLogArchive, AuditIndexEntry
+
+MAX_RESULTS = 500
+
+
+def index_available():
+    """Index search needs Postgres (pg_trgm) and a populated AuditIndexEntry"""
+    db = AuditIndexEntry.objects.db
+    return connections[db].vendor == 'postgresql' and AuditIndexEntry.objects.exists()
+
+def search_audit_ids(query, limit=MAX_RESULTS):
+    """
+    Returns ids of the latest CMS audit_log entries matching all words in query
+    Each word is matched as a substring of the indexed document (class name, object id,
+    event, actor, property and old/new values; pg_trgm GIN index)
+    """
+    words = query.lower().split()
+    if not words:
+        return []
+    object_list = AuditIndexEntry.objects.all()
+    for word in words:
+        object_list = object_list.filter(document__contains=word)
+    return list(object_list.order_by('-audit_id').values_list('audit_id', flat=True).distinct()[:limit])
+
+def object_history(class_name, object_id):
+    """
+    Returns list of AuditIndexEntry for the CMS object, oldest first; read from
+    audit_log and its archive (and parsed) if the index is not available
+    """
+    if index_available():
+        return list(AuditIndexEntry.objects.filter(
+            class_name=class_name, object_id=object_id,
+        ).order_by('date_created', 'audit_id', 'id'))
+    print("Warning: AuditIndexEntry not available, reading CMS audit_log (manage.py update_audit_index)")
+    entries = []
+    audit_list = {}
+    for source in (AuditLogArchive.objects, AuditLog.objects):
+        for audit_obj in source.filter(class_name=class_name, persisted_object_id=object_id):
+            audit_list[audit_obj.id] = audit_obj
+    audit_list = sorted(audit_list.values(), key=lambda audit_obj: (audit_obj.date_created, audit_obj.id))
+    for audit_obj in audit_list:
+        entries.extend(AuditIndexEntry.from_auditlog(audit_obj))
+    return entries
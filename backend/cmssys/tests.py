@@ -1,3 +1,82 @@
-from django.test import TestCase
+from datetime import date, datetime, timezone
+from django.db import models
+from django.db.models import Q
+from django.test import SimpleTestCase
+from .models import CMSModel
+from .pagination import KeysetPaginationMixin, decode_cursor, encode_cursor
 
-# Create your tests here.
+
+def cms_time(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class LocalRangeTest(SimpleTestCase):
+    """CMSModel local date helpers"""
+    def test_parse_local_date(self):
+        self.assertEqual(CMSModel.parse_local_date('2026-10-18'), date(2026, 10, 18))
+        self.assertEqual(CMSModel.parse_local_date(date(2026, 10, 18)), date(2026, 10, 18))
+        self.assertIsNone(CMSModel.parse_local_date(''))
+        self.assertIsNone(CMSModel.parse_local_date('18/10/2026'))
+
+    def test_local_range(self):
+        self.assertEqual(
+            CMSModel.local_range('2026-10-18'),
+            (cms_time(2026, 10, 18), cms_time(2026, 10, 19)),
+        )
+        self.assertEqual(
+            CMSModel.local_range(date(2026, 10, 1), '2026-10-31'),
+            (cms_time(2026, 10, 1), cms_time(2026, 11, 1)),
+        )
+
+    def test_local_range_session(self):
+        self.assertEqual(
+            CMSModel.local_range('2026-10-18', session=CMSModel.AM),
+            (cms_time(2026, 10, 18), cms_time(2026, 10, 18, 15)),
+        )
+        self.assertEqual(
+            CMSModel.local_range('2026-10-18', session=CMSModel.PM),
+            (cms_time(2026, 10, 18, 15), cms_time(2026, 10, 19)),
+        )
+
+    def test_local_range_q(self):
+        self.assertEqual(
+            CMSModel.local_range_q('date_created', '2026-10-01', '2026-10-31'),
+            Q(date_created__gte=cms_time(2026, 10, 1)) & Q(date_created__lt=cms_time(2026, 11, 1)),
+        )
+        self.assertEqual(
+            CMSModel.local_range_q('bill__date_created', None, '2026-10-31'),
+            Q(bill__date_created__lt=cms_time(2026, 11, 1)),
+        )
+        self.assertEqual(CMSModel.local_range_q('date_created', '', ''), Q())
+        self.assertEqual(
+            CMSModel.local_range_q('date_created', '2026-10-18', session=CMSModel.PM),
+            Q(date_created__gte=cms_time(2026, 10, 18, 15), date_created__lt=cms_time(2026, 10, 19)),
+        )
+
+
+class CursorTest(SimpleTestCase):
+    """Keyset pagination cursors"""
+    fields = [models.DateTimeField(), models.BigAutoField(primary_key=True)]
+
+    def test_round_trip(self):
+        values = [cms_time(2026, 10, 18, 9, 30), 12345]
+        cursor = encode_cursor(values)
+        self.assertNotIn('=', cursor)
+        self.assertEqual(decode_cursor(cursor, self.fields), values)
+
+    def test_null_value(self):
+        self.assertEqual(decode_cursor(encode_cursor([None, 7]), self.fields), [None, 7])
+
+    def test_invalid(self):
+        self.assertIsNone(decode_cursor('', self.fields))
+        self.assertIsNone(decode_cursor('not a cursor', self.fields))
+        self.assertIsNone(decode_cursor(encode_cursor([7]), self.fields))
+        self.assertIsNone(decode_cursor(encode_cursor(['yesterday', 7]), self.fields))
+
+    def test_sort_key_nulls_first(self):
+        keys = [
+            KeysetPaginationMixin._sort_key([cms_time(2026, 10, 18), 2]),
+            KeysetPaginationMixin._sort_key([None, 3]),
+            KeysetPaginationMixin._sort_key([cms_time(2026, 10, 17), 1]),
+        ]
+        self.assertEqual(sorted(keys), [keys[1], keys[2], keys[0]])
@@ -4,4 +4,5 @@ from . import views
 app_name = 'cmssys'
 urlpatterns = [
     path('auditlog/', views.AuditLogList.as_view(), name='AuditLog'),
+    path('auditlog/<str:class_name>/<str:object_id>/', views.AuditTimeline.as_view(), name='AuditTimeline'),
     ]
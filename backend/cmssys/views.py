@@ -2,14 +2,18 @@ from django.shortcuts import render
 from django.views.generic import ListView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.db.models import Q
+from .pagination import KeysetPaginationMixin
+from .archive import ArchiveListMixin
+from .search import index_available, search_audit_ids, object_history
 from .models import (
     AuditLog,
+    AuditLogArchive,
 )
 # Create your views here.
 
-class AuditLogList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
+class AuditLogList(ArchiveListMixin, KeysetPaginationMixin, ListView, LoginRequiredMixin, PermissionRequiredMixin):
     """
-    Displays AuditLog
+    Displays AuditLog, with archived entries if the date filter reaches back
     """
     INV_ITEM='1'
     INV_MOVE_LOG='2'
@@ -24,6 +28,7 @@ class AuditLogList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
     permission_required = ('cmssys.view_auditlog',)
     template_name = 'cmssys/audit_log.html'
     model = AuditLog
+    archive_model = AuditLogArchive
     context_object_name = 'audit_log'
     paginate_by = 20
     last_query = ''
@@ -33,29 +38,32 @@ class AuditLogList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         self.begin = self.request.GET.get('begin') or ''
         self.end = self.request.GET.get('end') or ''
         self.disp_type = self.request.GET.get('t') or ''
+        self.last_query = self.request.GET.get('q') or ''
+        self.audit_ids = None
+        if self.last_query:
+            if index_available():
+                self.audit_ids = search_audit_ids(self.last_query)
+            else:
+                print("Warning: AuditIndexEntry not available, searching CMS table (manage.py update_audit_index)")
+        object_list = self.filter_history(AuditLog.objects.all())
+        self.last_query_count = object_list.count
+        return object_list
+
+    def filter_history(self, object_list):
+        """Class, search and date filters of the audit log (or its archive)"""
         if self.disp_type:
             class_type = dict(self.CLASS_TYPE_CHOICES).get(self.disp_type)
-            object_list = AuditLog.objects.filter(class_name=class_type).order_by('-last_updated')
-        else:
-            object_list = AuditLog.objects.all().order_by('-last_updated')
-        query = self.request.GET.get('q')
-        if query:
-            self.last_query = query
+            object_list = object_list.filter(class_name=class_type)
+        if self.audit_ids is not None:
+            object_list = object_list.filter(id__in=self.audit_ids)
+        elif self.last_query:
             object_list = object_list.filter(
-                Q(class_name__icontains=query) |
-                Q(property_name__icontains=query) |
-                Q(event_name__icontains=query)
+                Q(class_name__icontains=self.last_query) |
+                Q(property_name__icontains=self.last_query) |
+                Q(event_name__icontains=self.last_query)
             )
-            self.last_query_count = object_list.count
-        else:
-            self.last_query = ''
-            object_list = object_list.order_by('-last_updated')
-            self.last_query_count = object_list.count
-        if self.begin:
-            object_list = object_list.filter(received_date__gte=self.begin)
-        if self.end:
-            object_list = object_list.filter(received_date__lte=self.end)
-        return object_list
+        object_list = object_list.filter(AuditLog.local_range_q('date_created', self.begin, self.end))
+        return object_list.order_by('-last_updated')
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
@@ -64,4 +72,22 @@ class AuditLogList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
         data['disp_type'] = self.disp_type
         data['begin'] = self.begin
         data['end'] = self.end
-        return data
\ No newline at end of file
+        return data
+
+
+class AuditTimeline(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+    """
+    History of a CMS object (class name, persisted object id) from the audit index
+    """
+    permission_required = ('cmssys.view_auditlog',)
+    template_name = 'cmssys/audit_timeline.html'
+    context_object_name = 'audit_entries'
+
+    def get_queryset(self):
+        return object_history(self.kwargs['class_name'], self.kwargs['object_id'])
+
+    def get_context_data(self, **kwargs):
+        data = super().get_context_data(**kwargs)
+        data['class_name'] = self.kwargs['class_name']
+        data['object_id'] = self.kwargs['object_id']
+        return data
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
     'django_extensions',
     'admin_honeypot',
     'bootstrap4',
@@ -128,6 +129,15 @@ USE_TZ = True
 
 CMS_OFFSET_HRS = 8
 
+# Local read-only mirror of CMS inventory tables (manage.py sync_cms_mirror)
+CMS_MIRROR_ENABLED = False
+CMS_MIRROR_SCHEMA = 'cms_mirror'
+CMS_MIRROR_MAX_STALENESS_SECS = 120  # older mirror tables are not read
+CMS_MIRROR_SWEEP_SECS = 3600  # interval between full version sweeps
+
+# CMS history older than this is moved to local archive tables (manage.py archive_cms_history)
+CMS_ARCHIVE_DAYS = 730
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
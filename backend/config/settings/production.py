@@ -52,6 +52,11 @@ DATABASES = {
         'PORT': cms_db['port'],
     },
 }
+# Local mirror of CMS tables: default database, own schema
+DATABASES['cms_mirror'] = {
+    **DATABASES['default'],
+    'OPTIONS': {'options': f'-c search_path={CMS_MIRROR_SCHEMA}'},
+}
 
 # Misc security settings
 #SECURE_BROWSER_XSS_FILTER = True
@@ -3,6 +3,26 @@ CMS_APPS = [
         'cmsinv',
         'cmssys',
     ]
+
+# Models in CMS apps stored locally in the default database, e.g. indexes
+# derived from CMS tables (app_label.model_name, lowercase)
+LOCAL_MODELS = [
+        'cmsinv.inventoryitemindex',
+        'cmsinv.itemmovementdaily',
+        'cmsinv.itemprojection',
+        'cmsinv.inventorymovementlogarchive',
+        'cmsacc.takingsrollup',
+        'cmsacc.clinicday',
+        'cmsacc.revenuedaily',
+        'cmsacc.cashreconciliation',
+        'cmsacc.cashdiscrepancy',
+        'cmsacc.waitingtimedaily',
+        'cmssys.mirrorstate',
+        'cmssys.auditindexentry',
+        'cmssys.auditlogarchive',
+    ]
+
+MIRROR_DB = 'cms_mirror'
     
 class CmsDbRouter:
     """
@@ -14,14 +34,34 @@ class CmsDbRouter:
         """
         Attempts to read cms models go to cms_db.
         """
+        if model._meta.label_lower in LOCAL_MODELS:
+            return 'default'
         if model._meta.app_label in CMS_APPS:
+            if self.use_mirror(model, **hints):
+                return MIRROR_DB
             return 'cms_db'
         return 'default'
 
+    def use_mirror(self, model, **hints):
+        """
+        Reads of mirrored CMS tables go to the local cms_mirror copy when it is
+        within CMS_MIRROR_MAX_STALENESS_SECS (see cmssys.mirror), except for
+        related objects of an instance read from cms_db
+        """
+        from cmssys.mirror import MIRRORED_MODELS, is_fresh
+        if model._meta.label_lower not in MIRRORED_MODELS:
+            return False
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == 'cms_db':
+            return False
+        return is_fresh(model)
+
     def db_for_write(self, model, **hints):
         """
         Attempts to write cms models to cms_db
         """
+        if model._meta.label_lower in LOCAL_MODELS:
+            return 'default'
         if model._meta.app_label in CMS_APPS:
             return 'cms_db'
         return 'default'
@@ -37,7 +77,11 @@ class CmsDbRouter:
     def allow_migrate(self, db, app_label, model_name=None, **hints):
         """
         Do not allow migration of models relating to the cms_db
+        Local models of CMS apps are migrated in default only
+        cms_mirror tables are created by cmssys.mirror, not migrations
         """
-        if app_label in CMS_APPS:
+        if db == MIRROR_DB:
             return False
-        return True
\ No newline at end of file
+        if app_label in CMS_APPS:
+            return db == 'default' and f"{app_label}.{model_name}" in LOCAL_MODELS
+        return True
@@ -1,9 +1,10 @@
 from django.contrib import admin
-from .models import RegisteredDrug, Company
+from .models import RegisteredDrug, Company, DrugListImport
 from .custom_filters import DuplicateRegNoFilter
 
 class RegisteredDrugAdmin(admin.ModelAdmin):
     list_filter = (DuplicateRegNoFilter, )
 
 admin.site.register(RegisteredDrug, RegisteredDrugAdmin)
-admin.site.register(Company)
\ No newline at end of file
+admin.site.register(Company)
+admin.site.register(DrugListImport)
\ No newline at end of file
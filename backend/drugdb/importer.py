@@ -0,0 +1,292 @@
+import hashlib
+from collections import namedtuple
+from django.db import connections, router, transaction
+from django.utils import timezone
+from importers.pipeline import canonical
+from inventory.models import Item
+from .models import RegisteredDrug, Company, Ingredient, DrugListImport
+
+DrugRow = namedtuple('DrugRow', ['name', 'reg_no', 'ingredients', 'company_name', 'company_addr', 'tags'])
+
+
+def parse_drug_line(line):
+    """
+    Returns DrugRow of a drug list CSV line (name|permit no|ingredients|company|address|tags)
+    with the ingredients split and names canonicalised; raises ValueError if invalid
+    Runs in the import pipeline's worker processes
+    """
+    if len(line) < 5:
+        raise ValueError(f"{len(line)} columns, expected at least 5")
+    reg_no = line[1].strip()
+    if not reg_no:
+        raise ValueError("No permit number")
+    ingredients = []
+    for ingredient in line[2].split(','):
+        ingredient = canonical(ingredient)[:255]
+        if ingredient and ingredient not in ingredients:
+            ingredients.append(ingredient)
+    return DrugRow(
+        name=canonical(line[0])[:255],
+        reg_no=reg_no[:255],
+        ingredients=tuple(ingredients),
+        company_name=line[3].strip()[:255],
+        company_addr=line[4].strip(),
+        tags=line[5] if len(line) > 5 else '',  # Tag column may be blank
+    )
+
+
+class DrugListImporter:
+    """
+    Delta import of the drug office list (manage.py update_db)
+    Existing companies, drugs, items and ingredients are loaded into dicts once and
+    each DrugRow is compared with the content_hash stored on its drug: only added,
+    changed, reactivated or removed drugs are written, with bulk_create/bulk_update
+    per chunk of rows, all in one transaction. The import is recorded as a
+    DrugListImport (batch sync stamp)
+    """
+    ADDED = 'added'
+    CHANGED = 'changed'
+    UPDATED = 'updated'
+    UNCHANGED = 'unchanged'
+
+    def __init__(self, update_date, stdout=None):
+        self.update_date = update_date
+        self.stdout = stdout
+        self.counts = {
+            'drugs_listed': 0,
+            'added': 0,
+            'changed': 0,
+            'removed': 0,
+            'unchanged': 0,
+            'companies_added': 0,
+            'companies_updated': 0,
+            'ingredients_added': 0,
+            'items_matched': 0,
+        }
+
+    def write(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    @staticmethod
+    def content_hash(row):
+        """Hash of the drug list columns of row (name, company, address, ingredients)"""
+        text = '\x1f'.join([row.name, row.company_name, row.company_addr, ', '.join(row.ingredients)])
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    @staticmethod
+    def classify(drug, content_hash, item_id):
+        """
+        Returns how a listed drug compares with its stored drug (None if not stored):
+        ADDED, CHANGED (columns differ), UPDATED (only reactivated or matched with a
+        new Item) or UNCHANGED
+        """
+        if drug is None:
+            return DrugListImporter.ADDED
+        if drug.content_hash != content_hash:
+            return DrugListImporter.CHANGED
+        if not drug.is_active or (item_id and drug.item_id != item_id):
+            return DrugListImporter.UPDATED
+        return DrugListImporter.UNCHANGED
+
+    @staticmethod
+    def item_ids_by_reg_no():
+        """Returns dict of reg_no => Item id, for reg_nos matching exactly one Item"""
+        item_ids = {}
+        duplicates = set()
+        for (item_id, reg_no) in Item.objects.filter(reg_no__isnull=False).values_list('id', 'reg_no'):
+            if reg_no in item_ids:
+                duplicates.add(reg_no)
+            item_ids[reg_no] = item_id
+        for reg_no in duplicates:
+            del item_ids[reg_no]
+        return item_ids
+
+    def load(self):
+        """Loads existing companies, drugs, items and ingredients"""
+        self.companies = {company.name: company for company in Company.objects.all()}
+        self.drugs = {drug.reg_no: drug for drug in RegisteredDrug.objects.all()}
+        self.item_ids = self.item_ids_by_reg_no()
+        self.linked_items = {drug.item_id: reg_no for (reg_no, drug) in self.drugs.items() if drug.item_id}
+        self.ingredient_ids = dict(Ingredient.objects.values_list('name', 'id'))
+        self.listed = set()  # reg_nos imported, for inactivate_expired()
+
+    def import_companies(self, rows):
+        """Creates/updates companies of rows; returns dict of name => Company id"""
+        addresses = {row.company_name: row.company_addr for row in rows}
+        to_create = []
+        to_update = []
+        now = timezone.now()
+        for (name, address) in addresses.items():
+            company = self.companies.get(name)
+            if company is None:
+                to_create.append(Company(name=name, address=address, is_active=True))
+            elif company.address != address or not company.is_active:
+                company.address = address
+                company.is_active = True
+                company.last_updated = now
+                to_update.append(company)
+        Company.objects.bulk_create(to_create, batch_size=1000)
+        Company.objects.bulk_update(to_update, ['address', 'is_active', 'last_updated'], batch_size=1000)
+        if to_create:
+            for company in Company.objects.filter(name__in=[company.name for company in to_create]):
+                self.companies[company.name] = company
+        self.counts['companies_added'] += len(to_create)
+        self.counts['companies_updated'] += len(to_update)
+        return {name: self.companies[name].id for name in addresses}
+
+    def import_ingredients(self, rows):
+        """Creates missing ingredients of rows"""
+        names = {name for row in rows for name in row.ingredients}
+        to_create = [Ingredient(name=name) for name in sorted(names) if name not in self.ingredient_ids]
+        Ingredient.objects.bulk_create(to_create, batch_size=1000)
+        if to_create:
+            self.ingredient_ids.update(Ingredient.objects.filter(
+                name__in=[ingredient.name for ingredient in to_create],
+            ).values_list('name', 'id'))
+        self.counts['ingredients_added'] += len(to_create)
+
+    def import_drugs(self, rows, company_ids):
+        """
+        Creates new drugs and updates drugs whose columns changed (content_hash), that
+        were inactive or that match a new Item; unchanged drugs are not written
+        Returns set of reg_nos of drugs whose ingredients are to be (re)linked
+        """
+        linked_items = self.linked_items
+        to_create = []
+        to_update = []
+        relink = set()
+        now = timezone.now()
+        for row in rows:
+            reg_no = row.reg_no
+            item_id = self.item_ids.get(reg_no)
+            if item_id and linked_items.get(item_id, reg_no) != reg_no:
+                self.write(f"! Item #{item_id} matches {reg_no} but is linked to {linked_items[item_id]}, not matched")
+                item_id = None
+            content_hash = self.content_hash(row)
+            drug = self.drugs.get(reg_no)
+            change = self.classify(drug, content_hash, item_id)
+            if change == self.ADDED:
+                drug = RegisteredDrug(
+                    name=row.name,
+                    reg_no=reg_no,
+                    company_id=company_ids[row.company_name],
+                    is_active=True,
+                    last_synced=self.update_date,
+                    content_hash=content_hash,
+                    dosage=RegisteredDrug.dosage_from_name(row.name),
+                )
+                drug.set_ingredient_fields(row.ingredients)
+                to_create.append(drug)
+                relink.add(reg_no)
+            else:
+                if change == self.UNCHANGED:
+                    self.counts['unchanged'] += 1
+                    continue
+                new_item = item_id and drug.item_id != item_id
+                if change == self.CHANGED:
+                    drug.name = row.name
+                    drug.company_id = company_ids[row.company_name]
+                    drug.content_hash = content_hash
+                    drug.dosage = RegisteredDrug.dosage_from_name(row.name)
+                    drug.set_ingredient_fields(row.ingredients)
+                    relink.add(reg_no)
+                drug.is_active = True
+                drug.last_synced = self.update_date
+                drug.last_updated = now
+                to_update.append(drug)
+                if not new_item:
+                    continue
+                self.write(f"Matched {reg_no} with Item #{item_id} (was #{drug.item_id})")
+                if drug.item_id:
+                    del linked_items[drug.item_id]
+            drug.item_id = item_id
+            if item_id:
+                linked_items[item_id] = reg_no
+                self.counts['items_matched'] += 1
+        RegisteredDrug.objects.bulk_create(to_create, batch_size=1000)
+        RegisteredDrug.objects.bulk_update(
+            to_update, [
+                'name', 'company_id', 'content_hash', 'ingredients_text', 'generic', 'dosage',
+                'is_active', 'last_synced', 'last_updated', 'item_id',
+            ],
+            batch_size=1000,
+        )
+        self.counts['added'] += len(to_create)
+        self.counts['changed'] += len(to_update)
+        return relink
+
+    def link_ingredients(self, rows, reg_nos):
+        """
+        Replaces ingredient links of the drugs with reg_nos by those of their rows
+        (the stored ingredient fields are set by import_drugs, no m2m signals are sent)
+        """
+        drug_ids = dict(RegisteredDrug.objects.filter(reg_no__in=reg_nos).values_list('reg_no', 'id'))
+        Through = RegisteredDrug.ingredients.through
+        Through.objects.filter(registereddrug_id__in=drug_ids.values()).delete()
+        links = []
+        for row in rows:
+            if row.reg_no not in drug_ids:
+                continue
+            for name in row.ingredients:
+                links.append(Through(
+                    registereddrug_id=drug_ids[row.reg_no],
+                    ingredient_id=self.ingredient_ids[name],
+                ))
+        Through.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+    def inactivate_expired(self, reg_nos):
+        """
+        Sets active drugs with a reg_no not in reg_nos inactive; returns number of drugs
+        On Postgres the reg_nos are passed as one array parameter and unnested into an
+        anti-join, so the UPDATE is a single statement of constant size
+        """
+        connection = connections[router.db_for_write(RegisteredDrug)]
+        if connection.vendor != 'postgresql':
+            return RegisteredDrug.objects.filter(is_active=True).exclude(reg_no__in=reg_nos).update(
+                is_active=False, last_updated=timezone.now(),
+            )
+        quote_name = connection.ops.quote_name
+        table = quote_name(RegisteredDrug._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} AS drug SET is_active = false, last_updated = %s "
+                f"WHERE drug.is_active AND NOT EXISTS ("
+                f"SELECT 1 FROM unnest(%s::text[]) AS listed(reg_no) WHERE listed.reg_no = drug.reg_no)",
+                [timezone.now(), list(reg_nos)],
+            )
+            return cursor.rowcount
+
+    def import_chunk(self, rows):
+        """Imports a chunk of DrugRows; a permit number listed again is skipped"""
+        unique_rows = []
+        for row in rows:
+            if row.reg_no in self.listed:
+                self.write(f"! {row.reg_no} listed more than once, skipped")
+                continue
+            self.listed.add(row.reg_no)
+            unique_rows.append(row)
+        self.counts['drugs_listed'] += len(unique_rows)
+        company_ids = self.import_companies(unique_rows)
+        relink = self.import_drugs(unique_rows, company_ids)
+        # ingredients are parsed for new and changed drugs only
+        relink_rows = [row for row in unique_rows if row.reg_no in relink]
+        self.import_ingredients(relink_rows)
+        self.link_ingredients(relink_rows, relink)
+
+    def run(self, chunks):
+        """Imports chunks (lists) of DrugRows, e.g. ImportPipeline.chunks(); returns dict of counts"""
+        with transaction.atomic(using=router.db_for_write(RegisteredDrug)):
+            self.load()
+            for rows in chunks:
+                self.import_chunk(rows)
+            self.counts['removed'] = self.inactivate_expired(self.listed)
+            DrugListImport.objects.create(
+                list_date=self.update_date,
+                drug_count=self.counts['drugs_listed'],
+                added=self.counts['added'],
+                changed=self.counts['changed'],
+                removed=self.counts['removed'],
+                unchanged=self.counts['unchanged'],
+            )
+        return self.counts
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.3 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugdb', '0023_registereddrug_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrugListImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('list_date', models.DateTimeField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('drug_count', models.IntegerField(default=0)),
+                ('added', models.IntegerField(default=0)),
+                ('changed', models.IntegerField(default=0)),
+                ('removed', models.IntegerField(default=0)),
+                ('unchanged', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date_created'],
+                'get_latest_by': 'date_created',
+            },
+        ),
+        migrations.AddField(
+            model_name='registereddrug',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+    ]
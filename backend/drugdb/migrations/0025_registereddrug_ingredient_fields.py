@@ -0,0 +1,66 @@
+# Generated by Django 3.1.3 on 2026-10-18 18:20
+
+import re
+from collections import defaultdict
+from django.db import migrations, models
+
+# Copies of drugdb.models.DOSAGE_PATTERN and RegisteredDrug.generic_from_ingredients /
+# dosage_from_name as of this migration
+DOSAGE_PATTERN = re.compile(r'(\d*\.?\d*\s?(MC?G)\/?(\d*\.?\d*)?(MG|MCG|ML|SPRAY)?)|(\d*\.?\d*\%)/g', re.IGNORECASE)
+
+
+def dosage_from_name(name):
+    dose_search = DOSAGE_PATTERN.search(name or '')
+    if dose_search:
+        return dose_search.group()[:255]
+    else:
+        return ""
+
+def generic_from_ingredients(names):
+    first_words = [name.split()[0] for name in names if name.split()]
+    if len(first_words) <= 5:
+        return " / ".join(first_words)[:255]
+    else:
+        return ("COMBO: " + " / ".join(first_words[:5]) + "...")[:255]
+
+def fill_ingredient_fields(apps, schema_editor):
+    """Stores ingredients_text, generic and dosage of existing drugs (ingredients in link order)"""
+    RegisteredDrug = apps.get_model('drugdb', 'RegisteredDrug')
+    names = defaultdict(list)
+    links = RegisteredDrug.ingredients.through.objects.order_by('id').values_list('registereddrug_id', 'ingredient__name')
+    for (drug_id, name) in links.iterator():
+        names[drug_id].append(name)
+    drugs = []
+    for drug in RegisteredDrug.objects.only('id', 'name').iterator():
+        drug_names = names[drug.id]
+        drug.ingredients_text = ', '.join(drug_names)
+        drug.generic = generic_from_ingredients(drug_names)
+        drug.dosage = dosage_from_name(drug.name)
+        drugs.append(drug)
+    RegisteredDrug.objects.bulk_update(drugs, ['ingredients_text', 'generic', 'dosage'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugdb', '0024_druglistimport_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registereddrug',
+            name='dosage',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='registereddrug',
+            name='generic',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='registereddrug',
+            name='ingredients_text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_ingredient_fields, migrations.RunPython.noop),
+    ]
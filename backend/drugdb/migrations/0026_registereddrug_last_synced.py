@@ -0,0 +1,19 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drugdb', '0025_registereddrug_ingredient_fields'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registereddrug',
+            name='last_synced',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
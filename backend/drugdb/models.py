@@ -1,9 +1,15 @@
+from collections import defaultdict
 from django.db import models
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 from cmsinv.models import InventoryItem
 from ledger.models import Expense
 import re
 
+DOSAGE_PATTERN = re.compile(r'(\d*\.?\d*\s?(MC?G)\/?(\d*\.?\d*)?(MG|MCG|ML|SPRAY)?)|(\d*\.?\d*\%)/g', re.IGNORECASE)
+
 class RegisteredDrug(models.Model):
     """
     Stores list of products/drugs registered in offical drug office database
@@ -26,8 +32,16 @@ class RegisteredDrug(models.Model):
         )
     date_created = models.DateTimeField(auto_now_add=True)
     last_updated = models.DateTimeField(auto_now=True)
-    last_synced = models.DateTimeField(auto_now=True) 
+    last_synced = models.DateTimeField(default=timezone.now)
+    # last_synced: list date of the last drug list import that added or changed the drug (drugdb.importer)
     is_active = models.BooleanField(default=True)
+    content_hash = models.CharField(max_length=40, blank=True, default='')
+    # content_hash: hash of the drug list columns at last import, see drugdb.importer
+    ingredients_text = models.TextField(blank=True, default='')
+    generic = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    dosage = models.CharField(max_length=255, blank=True, default='')
+    # ingredients_text, generic, dosage: stored ingredients_list, gen_generic, gen_dosage;
+    # kept up to date by save(), the ingredients m2m_changed receiver and drugdb.importer
 
     class Meta:
         ordering = ['reg_no']
@@ -35,13 +49,18 @@ class RegisteredDrug(models.Model):
   
     @property
     def ingredients_list(self):
-        if self.ingredients:
-            return ", ".join([i.name for i in self.ingredients.all()])
-        else:
-            return ''
+        return self.ingredients_text
 
     @property
     def gen_dosage(self):
+        return self.dosage
+
+    @property
+    def gen_generic(self):
+        return self.generic
+
+    @staticmethod
+    def dosage_from_name(name):
         """
         Tries to get dosage from product name
         Patterns:
@@ -52,33 +71,46 @@ class RegisteredDrug(models.Model):
         - Inhaled:      [Number][MCG/SPRAY]
         - External:     [Number]%
         """
-        pattern = re.compile(r'(\d*\.?\d*\s?(MC?G)\/?(\d*\.?\d*)?(MG|MCG|ML|SPRAY)?)|(\d*\.?\d*\%)/g', re.IGNORECASE)
-        dose_search = pattern.search(self.name)
-
+        dose_search = DOSAGE_PATTERN.search(name or '')
         if dose_search:
-            return dose_search.group()
+            return dose_search.group()[:255]
         else:
             return ""
 
-    @property
-    def gen_generic(self):
+    @staticmethod
+    def generic_from_ingredients(names):
         """
-        Generate generic name from ingredients
-        For drugs with <= 3 ingredients, use first word of ingredient
-        For drugs with >3 ingredients, return "COMBO"
+        Generate generic name from ingredient names
+        For drugs with <= 5 ingredients, use first word of each ingredient
+        For drugs with >5 ingredients, "COMBO: " and the first 5
         """
-
-        first_words = []
-        if len(self.ingredients.all()) <=5:
-            for ingr in self.ingredients.all():
-                first_words.append(ingr.name.split()[0])
-            return " / ".join(first_words)
+        first_words = [name.split()[0] for name in names if name.split()]
+        if len(first_words) <= 5:
+            return " / ".join(first_words)[:255]
         else:
-            for ingr in self.ingredients.all():
-                first_words.append(ingr.name.split()[0])
-            return "COMBO: " + " / ".join(first_words[:5]) + "..."
+            return ("COMBO: " + " / ".join(first_words[:5]) + "...")[:255]
+
+    def set_ingredient_fields(self, names):
+        """Sets ingredients_text and generic from ingredient names in link order (not saved)"""
+        self.ingredients_text = ", ".join(names)
+        self.generic = self.generic_from_ingredients(names)
+
+    @classmethod
+    def refresh_ingredient_fields(cls, drug_ids):
+        """Recomputes and saves ingredients_text and generic of drugs with drug_ids"""
+        names = defaultdict(list)
+        links = cls.ingredients.through.objects.filter(registereddrug_id__in=drug_ids).order_by('id')
+        for (drug_id, name) in links.values_list('registereddrug_id', 'ingredient__name'):
+            names[drug_id].append(name)
+        drugs = list(cls.objects.filter(id__in=drug_ids).only('id', 'ingredients_text', 'generic'))
+        for drug in drugs:
+            drug.set_ingredient_fields(names[drug.id])
+        cls.objects.bulk_update(drugs, ['ingredients_text', 'generic'], batch_size=1000)
+
+    def save(self, *args, **kwargs):
+        self.dosage = self.dosage_from_name(self.name)
+        super().save(*args, **kwargs)
 
-    
     def __str__(self):
         return f"{self.reg_no} | {self.name}"
 
@@ -117,6 +149,48 @@ class Ingredient(models.Model):
     def __str__(self):
         return self.name
 
+class DrugListImport(models.Model):
+    """
+    Records each import of the drug office list (manage.py update_db)
+    list_date is the sync stamp of every drug in the list: drugs are only written
+    when added, changed or removed
+    """
+    list_date = models.DateTimeField()
+    date_created = models.DateTimeField(auto_now_add=True)
+    drug_count = models.IntegerField(default=0)
+    added = models.IntegerField(default=0)
+    changed = models.IntegerField(default=0)
+    removed = models.IntegerField(default=0)
+    unchanged = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date_created']
+        get_latest_by = 'date_created'
+
+    def __str__(self):
+        return f"{timezone.localtime(self.list_date):%Y-%m-%d}: {self.drug_count} drugs, +{self.added} ~{self.changed} -{self.removed}"
+
+@receiver(m2m_changed, sender=RegisteredDrug.ingredients.through)
+def ingredients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refreshes the stored ingredient fields of drugs whose ingredients changed"""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_drug_ids = list(instance.registereddrugs.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        drug_ids = [instance.id]
+    elif action == 'post_clear':
+        drug_ids = getattr(instance, '_cleared_drug_ids', [])
+    else:
+        drug_ids = list(pk_set)
+    RegisteredDrug.refresh_ingredient_fields(drug_ids)
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, created, **kwargs):
+    """Refreshes the stored ingredient fields of the drugs of a renamed ingredient"""
+    if not created:
+        RegisteredDrug.refresh_ingredient_fields(list(instance.registereddrugs.values_list('id', flat=True)))
+
 # class DrugDelivery(Delivery):
 #     """
 #     Records drug purchase transactions
@@ -1,3 +1,105 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from .importer import DrugListImporter, DrugRow, parse_drug_line
+from .models import RegisteredDrug
 
-# Create your tests here.
+
+class ClassifyTest(SimpleTestCase):
+    """DrugListImporter.content_hash and classify (delta import)"""
+    row = DrugRow(
+        name='PANADOL TAB 500MG', reg_no='HK-00001', ingredients=('PARACETAMOL',),
+        company_name='GSK', company_addr='HONG KONG', tags='',
+    )
+
+    def drug(self, **kwargs):
+        values = {'reg_no': self.row.reg_no, 'content_hash': DrugListImporter.content_hash(self.row), 'is_active': True}
+        values.update(kwargs)
+        return RegisteredDrug(**values)
+
+    def test_content_hash(self):
+        content_hash = DrugListImporter.content_hash(self.row)
+        self.assertEqual(DrugListImporter.content_hash(self.row._replace(tags='NEW')), content_hash)
+        for changed in [
+            self.row._replace(name='PANADOL TAB 250MG'),
+            self.row._replace(company_addr='KOWLOON'),
+            self.row._replace(ingredients=('PARACETAMOL', 'CAFFEINE')),
+        ]:
+            self.assertNotEqual(DrugListImporter.content_hash(changed), content_hash)
+
+    def test_added(self):
+        self.assertEqual(DrugListImporter.classify(None, 'hash', None), DrugListImporter.ADDED)
+
+    def test_unchanged(self):
+        content_hash = DrugListImporter.content_hash(self.row)
+        self.assertEqual(DrugListImporter.classify(self.drug(), content_hash, None), DrugListImporter.UNCHANGED)
+        self.assertEqual(
+            DrugListImporter.classify(self.drug(item_id=5), content_hash, 5), DrugListImporter.UNCHANGED,
+        )
+
+    def test_changed(self):
+        content_hash = DrugListImporter.content_hash(self.row._replace(name='PANADOL TAB 250MG'))
+        self.assertEqual(DrugListImporter.classify(self.drug(), content_hash, None), DrugListImporter.CHANGED)
+        self.assertEqual(
+            DrugListImporter.classify(self.drug(is_active=False), content_hash, None), DrugListImporter.CHANGED,
+        )
+
+    def test_updated(self):
+        content_hash = DrugListImporter.content_hash(self.row)
+        self.assertEqual(
+            DrugListImporter.classify(self.drug(is_active=False), content_hash, None), DrugListImporter.UPDATED,
+        )
+        self.assertEqual(DrugListImporter.classify(self.drug(), content_hash, 5), DrugListImporter.UPDATED)
+        self.assertEqual(
+            DrugListImporter.classify(self.drug(item_id=4), content_hash, 5), DrugListImporter.UPDATED,
+        )
+
+
+class IngredientFieldsTest(SimpleTestCase):
+    """RegisteredDrug.generic_from_ingredients, dosage_from_name and set_ingredient_fields"""
+    def test_generic(self):
+        self.assertEqual(RegisteredDrug.generic_from_ingredients([]), '')
+        self.assertEqual(
+            RegisteredDrug.generic_from_ingredients(['PARACETAMOL', 'CAFFEINE ANHYDROUS']),
+            'PARACETAMOL / CAFFEINE',
+        )
+
+    def test_generic_combo(self):
+        names = ['VITAMIN A', 'VITAMIN B1', 'VITAMIN C', 'ZINC OXIDE', 'IRON', 'COPPER']
+        self.assertEqual(
+            RegisteredDrug.generic_from_ingredients(names),
+            'COMBO: VITAMIN / VITAMIN / VITAMIN / ZINC / IRON...',
+        )
+
+    def test_dosage(self):
+        self.assertEqual(RegisteredDrug.dosage_from_name('PANADOL TAB 500MG'), '500MG')
+        self.assertEqual(RegisteredDrug.dosage_from_name('CALPOL SYRUP 120MG/5ML'), '120MG/5ML')
+        self.assertEqual(RegisteredDrug.dosage_from_name('VENTOLIN INHALER 100MCG/SPRAY'), '100MCG/SPRAY')
+        self.assertEqual(RegisteredDrug.dosage_from_name('VASELINE'), '')
+        self.assertEqual(RegisteredDrug.dosage_from_name(None), '')
+
+    def test_set_ingredient_fields_keeps_order(self):
+        drug = RegisteredDrug(name='PANADOL EXTRA')
+        drug.set_ingredient_fields(['PARACETAMOL', 'CAFFEINE ANHYDROUS'])
+        self.assertEqual(drug.ingredients_text, 'PARACETAMOL, CAFFEINE ANHYDROUS')
+        self.assertEqual(drug.generic, 'PARACETAMOL / CAFFEINE')
+
+
+class ParseDrugLineTest(SimpleTestCase):
+    """drugdb.importer.parse_drug_line"""
+    def test_parse(self):
+        row = parse_drug_line([
+            ' PANADOL  TAB 500MG ', ' HK-00001 ', 'PARACETAMOL,  CAFFEINE  ANHYDROUS ,PARACETAMOL,',
+            ' GSK ', ' HONG KONG ', 'OTC',
+        ])
+        self.assertEqual(row, DrugRow(
+            name='PANADOL TAB 500MG', reg_no='HK-00001', ingredients=('PARACETAMOL', 'CAFFEINE ANHYDROUS'),
+            company_name='GSK', company_addr='HONG KONG', tags='OTC',
+        ))
+
+    def test_no_tags(self):
+        self.assertEqual(parse_drug_line(['A', 'HK-1', 'B', 'C', 'D']).tags, '')
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_drug_line(['A', 'HK-1', 'B', 'C'])
+        with self.assertRaises(ValueError):
+            parse_drug_line(['A', ' ', 'B', 'C', 'D'])
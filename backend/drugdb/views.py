@@ -20,6 +20,8 @@ from .models import (
 from cmsinv.models import (
     InventoryItem
 )
+from cmsinv.search import search_items
+from cmssys.audit import AuditWriter, snapshot
 
 from inventory.models import (
     Item, DeliveryItem, ItemType
@@ -53,13 +55,13 @@ class RegisteredDrugList(ListView, LoginRequiredMixin, PermissionRequiredMixin):
             object_list = object_list.filter(
                 Q(name__icontains=query) |
                 Q(reg_no__icontains=query) |
-                Q(ingredients__name__icontains=query)
+                Q(ingredients_text__icontains=query)
             )
             self.last_query_count = object_list.count
         else:
             self.last_query = ''
             self.last_query_count = object_list.count
-        return object_list.distinct().order_by('name')
+        return object_list.select_related('company', 'item').order_by('name')
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
@@ -164,14 +166,11 @@ class DrugDetailMatch(ListView, LoginRequiredMixin):
                         index += 1
                 if self.disp_drug_list:
                     self.drug_list = RegisteredDrug.objects.filter(
-                        Q(ingredients__name__icontains=keyword) |
+                        Q(ingredients_text__icontains=keyword) |
                         Q(name__icontains=keyword)
-                    ).order_by('name')[:50]
+                    ).select_related('company', 'item').order_by('name')[:50]
                 else:
-                    self.match_item_list_obj = InventoryItem.objects.filter(
-                        Q(product_name__icontains=keyword) |
-                        Q(ingredient__icontains=keyword)
-                    ).order_by('product_name')[:50]
+                    self.match_item_list_obj = search_items(keyword, limit=50).order_by('search_rank')[:50]
         else:
             self.drug_list = None
             self.match_item_list_obj = None
@@ -194,12 +193,10 @@ class DrugDetailMatch(ListView, LoginRequiredMixin):
             self.keyword = ''
         if self.ingredients == None:
             self.ingredients = ''
-        object_list = InventoryItem.objects.filter(
-            Q(product_name__icontains=self.keyword) |
-            Q(generic_name__icontains=self.keyword) |
-            Q(alias__icontains=self.keyword) |
-            Q(ingredient__icontains=self.ingredients)
-        ).order_by('discontinue').exclude(registration_no=self.drug_reg_no)[:100]
+        # Name words must all match; the ingredient list is matched as a whole (either matches)
+        object_list = search_items(self.keyword, ingredient=self.ingredients).order_by(
+            'discontinue', 'search_rank'
+        ).exclude(registration_no=self.drug_reg_no)[:100]
         return object_list
 
 
@@ -211,7 +208,7 @@ def LinkCMSItemModalView(request, *args, **kwargs):
     else:
         print("Error: no reg_no")
     if kwargs['cmsitem_id']:
-        cmsitem_obj = get_object_or_404(InventoryItem, pk=kwargs['cmsitem_id'])
+        cmsitem_obj = get_object_or_404(InventoryItem.objects.using('cms_db'), pk=kwargs['cmsitem_id'])
     else:
         print("Error: no cmsitem_id")
     uri = request.GET.get('next', reverse('drugdb:DrugDetailMatch', args=(drug_obj.reg_no,)))
@@ -225,9 +222,14 @@ def LinkCMSItemModalView(request, *args, **kwargs):
         doUpdateCMSProductDetails = request.POST.get('updateCMSProductDetails') == '1'
         # Update CMS Product Name and Ingredients if checked
         if doUpdateCMSProductDetails:
-            cmsitem_obj.product_name = drug_obj.name
-            cmsitem_obj.ingredient = drug_obj.ingredients_list
-            cmsitem_obj.save()
+            with AuditWriter(request.user.username, session_id=request.session.session_key, uri=uri) as audit:
+                old_values = snapshot(cmsitem_obj)
+                cmsitem_obj.product_name = drug_obj.name
+                cmsitem_obj.ingredient = drug_obj.ingredients_list
+                cmsitem_obj.updated_by = request.user.username
+                cmsitem_obj.version += 1
+                cmsitem_obj.save()
+                audit.update(cmsitem_obj, old_values)
 
         # Create new corresponding inventory.Item if not existing
         new_item_data = {
@@ -0,0 +1,113 @@
+import csv, os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from decimal import InvalidOperation
+from itertools import islice
+
+CHUNK_SIZE = 2000
+MAX_ERRORS = 50  # invalid rows kept for the report
+
+RowError = namedtuple('RowError', ['line_no', 'message'])
+
+
+def read_delimited(path, delimiter='|'):
+    """Streams (line no, list of columns) of a delimited text file, header included"""
+    with open(path, 'r', newline='') as csv_file:
+        for (line_no, line) in enumerate(csv.reader(csv_file, delimiter=delimiter), start=1):
+            yield line_no, line
+
+def read_xlsx(path):
+    """Streams (row no, list of cell values) of the first sheet of an .xlsx file, header included"""
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for (row_no, row) in enumerate(workbook.active.iter_rows(values_only=True), start=1):
+            yield row_no, list(row)
+    finally:
+        workbook.close()
+
+def canonical(text):
+    """Text stripped, with runs of whitespace collapsed to one space"""
+    return ' '.join((text or '').split())
+
+def chunked(rows, size):
+    """Yields lists of up to size items of rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def parse_chunk(parse, chunk):
+    """
+    Parses (line no, columns) of chunk with parse; returns (records, errors)
+    Runs in the worker processes of ImportPipeline
+    """
+    records = []
+    errors = []
+    for (line_no, line) in chunk:
+        try:
+            record = parse(line)
+        except (ValueError, TypeError, IndexError, InvalidOperation) as e:
+            errors.append(RowError(line_no, str(e)))
+            continue
+        if record is not None:
+            records.append(record)
+    return records, errors
+
+
+class ImportPipeline:
+    """
+    Parses rows (line no, columns) of a reader in chunks of chunk_size into typed
+    records with parse(columns), which raises ValueError for an invalid row (reported
+    and skipped) and returns None for a row to ignore
+    With workers > 1 (default: number of CPUs) chunks are parsed in a process pool, so
+    parse must be a module level function (or partial) without database access; at
+    most 2 chunks per worker are in flight, so memory depends on the chunk size and
+    not on the file size. Chunks of records are yielded in file order
+    """
+    def __init__(self, parse, chunk_size=CHUNK_SIZE, workers=None, stdout=None):
+        self.parse = parse
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.stdout = stdout
+        self.row_count = 0
+        self.error_count = 0
+        self.errors = []
+
+    def write(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def _parsed(self, row_count, result):
+        (records, errors) = result
+        self.row_count += row_count
+        self.error_count += len(errors)
+        self.errors.extend(errors[:MAX_ERRORS - len(self.errors)])
+        self.write(f"Parsed {self.row_count} rows ({self.error_count} invalid)")
+        return records
+
+    def chunks(self, rows):
+        """Yields lists of records of rows"""
+        if self.workers <= 1:
+            for chunk in chunked(rows, self.chunk_size):
+                yield self._parsed(len(chunk), parse_chunk(self.parse, chunk))
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for chunk in chunked(rows, self.chunk_size):
+                pending.append((len(chunk), pool.submit(parse_chunk, self.parse, chunk)))
+                if len(pending) >= 2 * self.workers:
+                    (row_count, future) = pending.popleft()
+                    yield self._parsed(row_count, future.result())
+            while pending:
+                (row_count, future) = pending.popleft()
+                yield self._parsed(row_count, future.result())
+
+    def report(self):
+        """Writes the invalid rows"""
+        for error in self.errors:
+            self.write(f"! Line {error.line_no}: {error.message}")
+        if self.error_count > len(self.errors):
+            self.write(f"! ... {self.error_count - len(self.errors)} more invalid rows")
@@ -0,0 +1,75 @@
+import time, traceback
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from cmssys.models import CmsUser
+from cmsinv.sync import DeliverySync
+from inventory.models import DeliverySyncJob
+
+class Command(BaseCommand):
+    """
+    Worker process for queued DeliveryOrder -> CMS sync jobs
+    Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED so several workers can run;
+    running jobs left by a killed worker (no progress for DeliverySyncJob.STALE_SECS) are
+    claimed again, DeliverySync writes to CMS in one transaction so nothing was written
+    """
+    help = 'Runs queued DeliveryOrder CMS sync jobs'
+    PROGRESS_INTERVAL = 1  # seconds between progress updates written to job
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run pending jobs then exit')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between polls for new jobs')
+
+    def claim_job(self):
+        with transaction.atomic():
+            job = DeliverySyncJob.objects.select_for_update(skip_locked=True).filter(
+                Q(status=DeliverySyncJob.PENDING)
+                | Q(status=DeliverySyncJob.RUNNING, last_updated__lt=DeliverySyncJob.stale_before())
+            ).order_by('id').first()
+            if job:
+                if job.status == DeliverySyncJob.RUNNING:
+                    self.stdout.write(f"Reclaiming {job}, no progress since {job.last_updated}")
+                job.status = DeliverySyncJob.RUNNING
+                job.processed_steps = 0
+                job.started = timezone.now()
+                job.save(update_fields=['status', 'processed_steps', 'started', 'last_updated'])
+        return job
+
+    def run_job(self, job):
+        self.stdout.write(f"Running {job}")
+        last_saved = [0]
+
+        def progress(processed, total):
+            job.processed_steps = processed
+            job.total_steps = total
+            if time.monotonic() - last_saved[0] >= self.PROGRESS_INTERVAL:
+                job.save(update_fields=['processed_steps', 'total_steps', 'last_updated'])
+                last_saved[0] = time.monotonic()
+
+        try:
+            cmsuser_obj = CmsUser.objects.get(username=DeliverySync.CMS_USERNAME)
+            delivery_sync = DeliverySync(job.delivery_order, cmsuser_obj, session_id=job.session_id, uri=job.uri)
+            job.total_steps = delivery_sync.total_steps
+            job.results = delivery_sync.run(update_quantities=job.update_quantities, progress=progress)
+            job.status = DeliverySyncJob.DONE
+        except Exception as e:
+            print(f"Error: sync job #{job.id} failed - {e}")
+            job.error = traceback.format_exc()
+            job.status = DeliverySyncJob.FAILED
+        job.finished = timezone.now()
+        job.save()
+        self.stdout.write(f"Finished {job}")
+
+    def handle(self, *args, **options):
+        if options['interval'] <= 0:
+            raise CommandError('--interval must be positive')
+        while True:
+            job = self.claim_job()
+            if job:
+                self.run_job(job)
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
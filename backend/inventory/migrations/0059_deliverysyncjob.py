@@ -0,0 +1,37 @@
+# Generated by Django 3.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0058_auto_20210211_2041'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySyncJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10)),
+                ('update_quantities', models.BooleanField(default=True)),
+                ('total_lines', models.PositiveIntegerField(default=0)),
+                ('processed_lines', models.PositiveIntegerField(default=0)),
+                ('results', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('session_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('uri', models.CharField(blank=True, max_length=255, null=True)),
+                ('requested_by', models.CharField(blank=True, max_length=255, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('delivery_order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sync_job', to='inventory.deliveryorder')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
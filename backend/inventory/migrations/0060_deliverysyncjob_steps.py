@@ -0,0 +1,23 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0059_deliverysyncjob'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='deliverysyncjob',
+            old_name='processed_lines',
+            new_name='processed_steps',
+        ),
+        migrations.RenameField(
+            model_name='deliverysyncjob',
+            old_name='total_lines',
+            new_name='total_steps',
+        ),
+    ]
@@ -1,9 +1,10 @@
 
 import pytz
-from datetime import datetime
-from django.db import models
+from datetime import datetime, timedelta
+from django.db import models, transaction
 from django.urls import reverse
 from django.conf import settings
+from django.utils import timezone
 # from drugdb.models import RegisteredDrug
 # from ledger.models import ExpenseCategory
 from cmsinv.models import InventoryItem
@@ -360,3 +361,96 @@ class DeliveryItem(models.Model):
             items_unit = "units"
         terms = f"{terms} x{self.items_per_purchase}{items_unit}"
         return terms
+
+class DeliverySyncJob(models.Model):
+    """
+    Queued sync of a DeliveryOrder to CMS, executed by manage.py run_sync_jobs
+    One job per DeliveryOrder; a failed job is requeued on resubmit, a completed
+    (done) job is not. Progress is counted in DeliverySync steps (lines, then writes)
+    A running job without progress for STALE_SECS (worker killed) is claimed again
+    """
+    STALE_SECS = 10 * 60
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    delivery_order = models.OneToOneField(
+        DeliveryOrder, related_name='sync_job',
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    update_quantities = models.BooleanField(default=True)
+    total_steps = models.PositiveIntegerField(default=0)
+    processed_steps = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, null=True)
+    session_id = models.CharField(max_length=255, blank=True, null=True)
+    uri = models.CharField(max_length=255, blank=True, null=True)
+    requested_by = models.CharField(max_length=255, blank=True, null=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-id']
+
+    def __str__(self):
+        return f"Sync job #{self.id} | Delivery #{self.delivery_order_id} {self.status} ({self.processed_steps}/{self.total_steps})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @classmethod
+    def stale_before(cls):
+        """Running jobs last updated before this time are stale"""
+        return timezone.now() - timedelta(seconds=cls.STALE_SECS)
+
+    @property
+    def progress(self):
+        """Percentage of sync steps processed; 100 only once the job is done"""
+        if self.status == self.DONE:
+            return 100
+        if not self.total_steps:
+            return 0
+        return min(99, int(self.processed_steps * 100 / self.total_steps))
+
+    @classmethod
+    def enqueue(cls, delivery_obj, update_quantities=True, session_id=None, uri=None, requested_by=None):
+        """
+        Returns queued job for delivery_obj; a pending/running job is returned as is
+        so repeated submits do not queue the delivery twice (a stale running job is
+        claimed again by run_sync_jobs), and a done job is returned as is (not
+        requeued); only a failed job is queued again
+        """
+        job_data = {
+            'status': cls.PENDING,
+            'update_quantities': update_quantities,
+            'total_steps': 0,
+            'processed_steps': 0,
+            'results': [],
+            'error': None,
+            'session_id': session_id,
+            'uri': uri,
+            'requested_by': requested_by,
+            'started': None,
+            'finished': None,
+        }
+        with transaction.atomic():
+            job, created = cls.objects.select_for_update().get_or_create(
+                delivery_order=delivery_obj,
+                defaults=job_data,
+            )
+            if not created and job.status == cls.FAILED:
+                for (key, value) in job_data.items():
+                    setattr(job, key, value)
+                job.save()
+        return job
@@ -19,6 +19,7 @@ urlpatterns = [
     path('delivery/<int:pk>/update/modal/', views.DeliveryOrderUpdateModal.as_view(), name='DeliveryOrderUpdateModal'),
     path('delivery/<int:pk>/delete/modal/', views.DeliveryOrderDeleteModal.as_view(), name='DeliveryOrderDeleteModal'),
     path('delivery/<int:delivery_id>/togglesynced/', views.DeliveryOrderToggleSynced, name='DeliveryOrderToggleSynced'),
+    path('delivery/syncjob/<int:pk>/', views.DeliverySyncJobStatus, name='DeliverySyncJobStatus'),
     # path('delivery/<int:delivery_id>/item/<int:cmsitem_id>/add/', views.DeliveryOrderAddItemView, name='DeliveryOrderAddItem'),
     # path('delivery/<int:delivery_id>/new/modal/', views.DeliveryOrderAddDrugModal.as_view(), name='DeliveryOrderAddDrugModal'),
     path('delivery/<int:delivery_id>/', views.DeliveryOrderDetail, name='DeliveryOrderDetail'),
@@ -1,5 +1,5 @@
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponse, HttpResponseRedirect
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
@@ -21,9 +21,11 @@ from .models import (
     Vendor,
     DeliveryOrder,
     DeliveryItem,
+    DeliverySyncJob,
 )
 from drugdb.models import RegisteredDrug
 from cmsinv.models import InventoryItem, InventoryItemType
+from cmsinv.search import search_items
 from .forms import (
     NewCategoryForm, CategoryUpdateForm,
     NewVendorForm, NewVendorModalForm, VendorUpdateForm, VendorUpdateModalForm,
@@ -690,12 +692,9 @@ def DeliveryOrderDetail(request, *args, **kwargs):
         else:
             last_query = query
             if searchdb == CMSITEM_DB:
-                object_list = InventoryItem.objects.filter(
-                    Q(alias__icontains=query) |
-                    Q(product_name__icontains=query) |
-                    # Q(generic_name__icontains=query) |
-                    Q(ingredient__icontains=query)
-                ).order_by('discontinue')[:MAX_QUERY_COUNT]
+                object_list = search_items(query, limit=MAX_QUERY_COUNT).order_by(
+                    'discontinue', 'search_rank'
+                )[:MAX_QUERY_COUNT]
             else:
                 object_list = RegisteredDrug.objects.filter(
                     Q(name__icontains=query)
@@ -1014,12 +1013,9 @@ def StocktakeView(request, *args, **kwargs):
         else:
             last_query = query
             if searchdb == CMSITEM_DB:
-                object_list = InventoryItem.objects.filter(
-                    Q(alias__icontains=query) |
-                    Q(product_name__icontains=query) |
-                    # Q(generic_name__icontains=query) |
-                    Q(ingredient__icontains=query)
-                ).order_by('discontinue')[:MAX_QUERY_COUNT]
+                object_list = search_items(query, limit=MAX_QUERY_COUNT).order_by(
+                    'discontinue', 'search_rank'
+                )[:MAX_QUERY_COUNT]
             else:
                 object_list = RegisteredDrug.objects.filter(
                     Q(name__icontains=query)
@@ -1067,4 +1063,21 @@ def DeliveryOrderToggleSynced(request, *args, **kwargs):
     delivery_obj = DeliveryOrder.objects.get(pk=kwargs['delivery_id']) or None
     delivery_obj.cms_synced = not delivery_obj.cms_synced
     delivery_obj.save()
-    return HttpResponseRedirect(reverse('inventory:DeliveryOrderDetail', args=(delivery_obj.id,)))
\ No newline at end of file
+    return HttpResponseRedirect(reverse('inventory:DeliveryOrderDetail', args=(delivery_obj.id,)))
+
+@login_required
+@permission_required('inventory.view_deliveryorder')
+def DeliverySyncJobStatus(request, *args, **kwargs):
+    """Returns JSON status of DeliveryOrder CMS sync job for progress polling"""
+    job = get_object_or_404(DeliverySyncJob, pk=kwargs['pk'])
+    data = {
+        'job_id': job.id,
+        'delivery_id': job.delivery_order_id,
+        'status': job.status,
+        'processed_steps': job.processed_steps,
+        'total_steps': job.total_steps,
+        'progress': job.progress,
+        'results': job.results if job.is_finished else [],
+        'error': job.error,
+    }
+    return JsonResponse(data)
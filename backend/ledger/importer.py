@@ -0,0 +1,218 @@
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from django.db import router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from importers.pipeline import canonical
+from inventory.models import Vendor
+from .models import Expense, ExpenseCategory, Income, IncomeCategory, IncomeSource, PaymentMethod
+
+ExpenseRow = namedtuple('ExpenseRow', [
+    'category_num', 'payee', 'invoice_date', 'expected_date', 'amount', 'payment_ref', 'description', 'payment_method',
+])
+IncomeRow = namedtuple('IncomeRow', ['date', 'amount', 'payer', 'ref'])
+
+SAVE_VENDOR_CATEGORIES = [
+    '1',  # Drugs
+    '3',  # Lab/Imaging
+]
+
+
+def _date(value):
+    """date of a date/datetime/YYYY-MM-DD value, None if blank; raises ValueError if invalid"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    parsed = parse_date(str(value).strip())
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed
+
+def _amount(value):
+    """Decimal amount of a number or text (commas and $ allowed)"""
+    return Decimal(str(value).replace(',', '').replace('$', '').strip())
+
+def parse_expense_line(line):
+    """
+    Returns ExpenseRow of an expense CSV line
+    (Category|Payee|InvoiceDate|ExpectedDate|Amount|ChequeNo|Remarks|PaymentMethod),
+    None if Amount is 0; raises ValueError if invalid
+    Runs in the import pipeline's worker processes
+    """
+    if len(line) < 8:
+        raise ValueError(f"{len(line)} columns, expected 8")
+    if not line[0]:
+        raise ValueError("No category")
+    amount = _amount(line[4])
+    if not amount:
+        return None
+    return ExpenseRow(
+        category_num=line[0][0],
+        payee=canonical(line[1]),
+        invoice_date=_date(line[2]),
+        expected_date=_date(line[3]),
+        amount=amount,
+        payment_ref=line[5],
+        description=line[6],
+        payment_method=line[7].strip(),
+    )
+
+def parse_income_row(columns, row):
+    """
+    Returns IncomeRow of an income spreadsheet row, columns: dict of header => index
+    (Date, Amount, Payer, Ref); raises ValueError if invalid
+    Runs in the import pipeline's worker processes
+    """
+    values = {header: row[index] if index < len(row) else None for (header, index) in columns.items()}
+    if not values['Payer']:
+        raise ValueError("No payer")
+    income_date = _date(values['Date'])
+    if income_date is None:
+        raise ValueError("No date")
+    return IncomeRow(
+        date=income_date,
+        amount=_amount(values['Amount']),
+        payer=canonical(str(values['Payer'])),
+        ref=values['Ref'],
+    )
+
+
+class ExpenseImporter:
+    """
+    Creates Expense entries of chunks of ExpenseRows (manage.py import_expenses)
+    Categories, payment methods and vendors are looked up in dicts loaded once;
+    each chunk is saved in its own transaction
+    """
+    def __init__(self, stdout=None):
+        self.stdout = stdout
+        self.other_ref = f"Imported on {timezone.now().strftime('%Y-%m-%d')}"
+        self.counts = {'expenses': 0, 'vendors': 0, 'skipped': 0}
+
+    def load(self):
+        self.categories = list(ExpenseCategory.objects.all())
+        self.payment_methods = {method.name: method for method in PaymentMethod.objects.all()}
+        self.vendors = {vendor.name: vendor for vendor in Vendor.objects.all()}
+
+    def category(self, category_num):
+        """First ExpenseCategory with a label starting with category_num, None if none"""
+        for category in self.categories:
+            if category.label.startswith(category_num):
+                return category
+        return None
+
+    def vendor(self, payee):
+        vendor = self.vendors.get(payee)
+        if vendor is None:
+            vendor = Vendor.objects.create(name=payee, version=1, active=True, updated_by='import')
+            self.vendors[payee] = vendor
+            self.counts['vendors'] += 1
+            self.write(f"Added vendor: {vendor.name} with id {vendor.id}")
+        return vendor
+
+    def write(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def import_chunk(self, rows):
+        with transaction.atomic(using=router.db_for_write(Expense)):
+            for row in rows:
+                category = self.category(row.category_num)
+                if category is None:
+                    self.write(f"! No expense category {row.category_num}, skipped: {row.payee} ${row.amount}")
+                    self.counts['skipped'] += 1
+                    continue
+                vendor = self.vendor(row.payee) if row.category_num in SAVE_VENDOR_CATEGORIES else None
+                payment_method = self.payment_methods.get(row.payment_method) or self.payment_methods['Other']
+                Expense(
+                    # Assign Entry date using expected date; otherwise invoice date
+                    entry_date=row.expected_date or row.invoice_date,
+                    amount=row.amount,
+                    description=row.description,
+                    expected_date=row.expected_date,
+                    invoice_date=row.invoice_date,
+                    updated_by='import',
+                    version=1,
+                    category=category,
+                    payee=row.payee,
+                    vendor=vendor,
+                    payment_method=payment_method,
+                    payment_ref=row.payment_ref,
+                    other_ref=self.other_ref,
+                ).save()
+                self.counts['expenses'] += 1
+
+    def run(self, chunks):
+        """Imports chunks (lists) of ExpenseRows; returns dict of counts"""
+        self.load()
+        for rows in chunks:
+            self.import_chunk(rows)
+        return self.counts
+
+
+class IncomeImporter:
+    """
+    Creates bank transfer Income entries of chunks of IncomeRows (manage.py import_income)
+    Payers are looked up in a dict loaded once; each chunk is saved in its own transaction
+    """
+    def __init__(self, stdout=None):
+        self.stdout = stdout
+        self.today = timezone.now().strftime('%Y-%m-%d')
+        self.counts = {'incomes': 0, 'payers': 0}
+
+    def write(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def load(self):
+        # Get BankTx PaymentMethod
+        self.method_bank = PaymentMethod.objects.get(name='Bank Tx')
+        # Get/Create IncomeCategory
+        category_card, created = IncomeCategory.objects.get_or_create(
+            name='Medical Card',
+            defaults={
+                'name': 'Medical Card',
+                'code': str(IncomeCategory.objects.all().count() + 1),
+                'description': 'Medical Card Income',
+                'active': True,
+            })
+        if created:
+            self.write(f"Created 'Medical Card' IncomeCategory #{category_card.id}: {category_card.name}")
+        self.payers = {payer.name: payer for payer in IncomeSource.objects.all()}
+
+    def payer(self, name):
+        payer = self.payers.get(name)
+        if payer is None:
+            payer = IncomeSource.objects.create(
+                name=name, code=str(IncomeSource.objects.all().count() + 1), active=True,
+            )
+            self.payers[name] = payer
+            self.counts['payers'] += 1
+            self.write(f"Created payer #{payer.id}: {payer.name}")
+        return payer
+
+    def import_chunk(self, rows):
+        with transaction.atomic(using=router.db_for_write(Income)):
+            for row in rows:
+                Income(
+                    payer=self.payer(row.payer),
+                    payment_method=self.method_bank,
+                    amount=row.amount,
+                    other_ref=row.ref,
+                    expected_date=row.date,
+                    entry_date=self.today,
+                    description='Service fees for period ' + str(row.ref),
+                    updated_by='cmsman',
+                    version=1,
+                ).save()
+                self.counts['incomes'] += 1
+
+    def run(self, chunks):
+        """Imports chunks (lists) of IncomeRows; returns dict of counts"""
+        self.load()
+        for rows in chunks:
+            self.import_chunk(rows)
+        return self.counts
@@ -1,15 +1,17 @@
-import csv, os
-import pandas as pd
-from datetime import date
+import os
+from functools import partial
 
 from django.core.management.base import BaseCommand, CommandError
-from ledger.models import Income, IncomeCategory, IncomeSource, PaymentMethod
+from importers.pipeline import CHUNK_SIZE, ImportPipeline, read_xlsx
+from ledger.importer import IncomeImporter, parse_income_row
 from django.conf import settings
-from django.utils import timezone
+
+COLUMNS = ['Date', 'Amount', 'Payer', 'Ref']
 
 class Command(BaseCommand):
     """
-    Imports scraped drug list and parses data into respective models
+    Imports medical card income from an .xlsx file (columns Date, Amount, Payer, Ref),
+    see ledger.importer; invalid rows are reported and skipped
     """
     help = 'Import income .xlsx  file'
 
@@ -18,54 +20,27 @@ class Command(BaseCommand):
             "excelfile",
             help="The file system path to the Excel file with the data to import",
         )
-        
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows parsed per chunk')
+        parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: number of CPUs)')
+
     def handle(self, *args, **options):
         INCOME_XLSX_FILE = options['excelfile']
         filepath = os.path.join(settings.BASE_DIR, INCOME_XLSX_FILE)
         self.stdout.write(f"Importing income data from {filepath}")
-        data = pd.read_excel(filepath)
-        today =  timezone.now().strftime('%Y-%m-%d')
-        # Get BankTx PaymentMethod
-        methodBank = PaymentMethod.objects.get(name='Bank Tx')
+        if not os.path.isfile(filepath):
+            raise CommandError(f"No such file: {filepath}")
 
-        # Get/Create IncomeCategory
-        categoryCard, created = IncomeCategory.objects.get_or_create(
-            name='Medical Card',
-            defaults={
-                'name': 'Medical Card',
-                'code': str(IncomeCategory.objects.all().count() + 1),
-                'description': 'Medical Card Income',
-                'active': True,
-            })
-        if created:
-            print(f"Created 'Medical Card' IncomeCategory #{categoryCard.id}: {categoryCard.name}")
-
-        for index, row in data.iterrows():
-            print(f"Processing {index:3}|{row['Date']} - ${row['Amount']} from {row['Payer']}")
-            payerData = {
-                'name': row['Payer'],
-                'code': str(IncomeSource.objects.all().count() + 1),
-                'active': True
-            }
-            payer, created = IncomeSource.objects.get_or_create(name=row['Payer'], defaults=payerData)
-            if created:
-                print(f"Created payer #{payer.id}: {payer.name}")
-            newIncome = Income(
-                payer=payer,
-                payment_method=methodBank,
-                amount=row['Amount'],
-                other_ref=row['Ref'],
-                expected_date=row['Date'],
-                entry_date = today,
-                description='Service fees for period ' + str(row['Ref']),
-                date_created = timezone.now(),
-                last_updated = timezone.now(),
-                updated_by = 'cmsman',
-                version = 1,
-            )
-            newIncome.save()
-            if newIncome.id:
-                print(f"Created income #{newIncome.id}: ${newIncome.amount} from {newIncome.payer.name}")
-            else:
-                print(newIncome)
-        
+        rows = read_xlsx(filepath)
+        (_, header) = next(rows, (None, []))
+        header = [str(value).strip() if value is not None else '' for value in header]
+        missing = [column for column in COLUMNS if column not in header]
+        if missing:
+            raise CommandError(f"Missing columns: {', '.join(missing)}")
+        columns = {column: header.index(column) for column in COLUMNS}
+        pipeline = ImportPipeline(
+            partial(parse_income_row, columns), chunk_size=options['chunk_size'],
+            workers=options['workers'], stdout=self.stdout,
+        )
+        counts = IncomeImporter(stdout=self.stdout).run(pipeline.chunks(rows))
+        pipeline.report()
+        self.stdout.write(f"====\nIncome: {counts['incomes']} imported; payers added: {counts['payers']}")
@@ -1,3 +1,47 @@
-from django.test import TestCase
+from datetime import date, datetime
+from decimal import Decimal
+from django.test import SimpleTestCase
+from .importer import ExpenseRow, IncomeRow, parse_expense_line, parse_income_row
 
-# Create your tests here.
+
+class ParseExpenseLineTest(SimpleTestCase):
+    """ledger.importer.parse_expense_line"""
+    def test_parse(self):
+        row = parse_expense_line([
+            '1 Drugs', ' ABC  Pharma ', '2026-10-01', '', '$1,234.50', '000123', 'Oct invoice', ' Cheque ',
+        ])
+        self.assertEqual(row, ExpenseRow(
+            category_num='1', payee='ABC Pharma', invoice_date=date(2026, 10, 1), expected_date=None,
+            amount=Decimal('1234.50'), payment_ref='000123', description='Oct invoice', payment_method='Cheque',
+        ))
+
+    def test_zero_amount(self):
+        self.assertIsNone(parse_expense_line(['1', 'ABC', '', '', '0', '', '', '']))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_expense_line(['1', 'ABC', '', '', '10'])
+        with self.assertRaises(ValueError):
+            parse_expense_line(['', 'ABC', '', '', '10', '', '', ''])
+        with self.assertRaises(ValueError):
+            parse_expense_line(['1', 'ABC', '01/10/2026', '', '10', '', '', ''])
+
+
+class ParseIncomeRowTest(SimpleTestCase):
+    """ledger.importer.parse_income_row"""
+    columns = {'Date': 0, 'Amount': 1, 'Payer': 2, 'Ref': 3}
+
+    def test_parse(self):
+        row = parse_income_row(self.columns, [datetime(2026, 10, 18, 9, 0), 1500, ' Medi  Card ', '2026-09'])
+        self.assertEqual(row, IncomeRow(
+            date=date(2026, 10, 18), amount=Decimal('1500'), payer='Medi Card', ref='2026-09',
+        ))
+
+    def test_short_row(self):
+        self.assertIsNone(parse_income_row(self.columns, ['2026-10-18', '10', 'Payer']).ref)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_income_row(self.columns, ['2026-10-18', '10', '', 'x'])
+        with self.assertRaises(ValueError):
+            parse_income_row(self.columns, [None, '10', 'Payer', 'x'])